@@ -0,0 +1,252 @@
+'''
+benchmark the activation checkpoint of the model.blocks stages against the batch size, for the --model.
+
+Every (stages, batch size) run the train step of the WalkVideoClassificationLightningModule (normalize, fuse, forward, BCE loss, backward, Adam)
+on a synthetic uint8 batch in a spawned process, so the peak memory of the runs are not mixed.
+Before the sweep, one train step with and without the checkpoint of every stages is compared, the BatchNorm running stats should be same.
+The report is the step time, the throughput, the peak memory, and the largest batch in the --bench_memory_gb for every stages.
+The other parameters (img_size, uniform_temporal_subsample_num, model_depth, precision_mode ...) are same as main.py.
+
+usage:
+    python benchmark_checkpoint.py --model resnet --bench_stages none 1,2 1,2,3,4 --bench_batch_sizes 4 8 16 32 --bench_memory_gb 16
+'''
+
+# %%
+import copy
+import json
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import os
+import resource
+import time
+from argparse import ArgumentParser
+from typing import Any, Dict, List
+
+import torch
+import torch.nn.functional as F
+
+from main import get_parameters
+
+
+def parse_stages(stages: str) -> List[int]:
+    '''
+    Args:
+        stages (str): the comma separated model.blocks index, or none.
+
+    Returns:
+        List[int]: the stages for --checkpoint_stages.
+    '''
+
+    if stages == 'none':
+        return []
+
+    return [int(stage) for stage in stages.split(',')]
+
+
+def get_bench_parameters(unknown: List[str]):
+    '''
+    The parameters for the benchmark, the model parameters are from main.get_parameters.
+    '''
+    parser = ArgumentParser()
+
+    parser.add_argument('--bench_stages', type=str, nargs='+', default=['none', '1,2,3', '0,1,2,3,4'], help='the checkpoint stages to compare, comma separated model.blocks index or none, the first one is the baseline')
+    parser.add_argument('--bench_batch_sizes', type=int, nargs='+', default=[4, 8, 16], help='the batch sizes to compare')
+    parser.add_argument('--bench_memory_gb', type=float, default=16, help='the memory of the host, report the largest batch in it')
+    parser.add_argument('--bench_steps', type=int, default=5, help='the measured train steps')
+    parser.add_argument('--bench_warmup', type=int, default=1, help='the warmup train steps')
+    parser.add_argument('--bench_threads', type=int, default=None, help='torch cpu threads, None for the default')
+    parser.add_argument('--bench_bn_tol', type=float, default=1e-5, help='the max difference of the BatchNorm running stats with and without the checkpoint')
+    parser.add_argument('--bench_output', type=str, default=None, help='save the report as json')
+
+    return parser.parse_known_args(unknown)[0]
+
+
+def check_bn_stats(config, stages: List[int], batch_size: int = 2) -> float:
+    '''
+    one train step of the same model and batch with and without the checkpoint on the cpu,
+    the recompute in the backward should not update the BatchNorm running stats again.
+
+    Returns:
+        float: the max difference of the running mean and var.
+    '''
+
+    from models.pytorchvideo_models import WalkVideoClassificationLightningModule
+
+    running_stats = []
+
+    for checkpoint_stages in ([], stages):
+        config = copy.copy(config)
+        config.checkpoint_stages = checkpoint_stages
+        config.accelerator = 'cpu'
+
+        torch.manual_seed(42)
+        module = WalkVideoClassificationLightningModule(config)
+        module.train()
+
+        generator = torch.Generator().manual_seed(0)
+        shape = (batch_size, config.uniform_temporal_subsample_num, 3, config.img_size, config.img_size)
+        video_ap = torch.randint(0, 256, shape, dtype=torch.uint8, generator=generator)
+        video_lat = torch.randint(0, 256, shape, dtype=torch.uint8, generator=generator)
+        label = torch.randint(0, 2, (batch_size,), generator=generator)
+
+        y_hat = module._predict({'ap': module._normalize_video(video_ap), 'lat': module._normalize_video(video_lat)}).view(-1)
+        loss = F.binary_cross_entropy_with_logits(y_hat, label.repeat_interleave(y_hat.numel() // batch_size).float())
+        loss.backward()
+
+        norms = [norm for norm in module.modules() if isinstance(norm, torch.nn.modules.batchnorm._BatchNorm) and norm.track_running_stats]
+        running_stats.append(torch.cat([torch.cat([norm.running_mean, norm.running_var]) for norm in norms]))
+
+    return (running_stats[0] - running_stats[1]).abs().max().item()
+
+
+def benchmark_worker(config, stages: List[int], batch_size: int, steps: int, warmup: int, threads: int) -> Dict[str, Any]:
+    '''
+    the train step of one checkpoint stages and batch size, in a spawned process.
+
+    Returns:
+        Dict[str, Any]: the mean step ms, the clips per second, and the peak memory (MB) of the process, the peak RSS on the cpu and the max allocated on the gpu.
+    '''
+
+    from models.pytorchvideo_models import WalkVideoClassificationLightningModule
+
+    if threads:
+        torch.set_num_threads(threads)
+
+    config = copy.copy(config)
+    config.checkpoint_stages = stages
+    config.batch_size = batch_size
+
+    device = torch.device('cuda:%d' % config.gpu_num if config.accelerator == 'gpu' else 'cpu')
+
+    torch.manual_seed(42)
+
+    module = WalkVideoClassificationLightningModule(config).to(device)
+    module.train()
+
+    optimizer = torch.optim.Adam([param for param in module.parameters() if param.requires_grad], lr=config.lr)
+
+    shape = (batch_size, config.uniform_temporal_subsample_num, 3, config.img_size, config.img_size)
+    batch = {
+        'ap': torch.randint(0, 256, shape, dtype=torch.uint8, device=device),
+        'lat': torch.randint(0, 256, shape, dtype=torch.uint8, device=device),
+        'label': torch.randint(0, 2, (batch_size,), device=device),
+    }
+
+    def train_step() -> float:
+        # same as on_after_batch_transfer and training_step.
+        y_hat = module._predict({'ap': module._normalize_video(batch['ap']), 'lat': module._normalize_video(batch['lat'])}).view(-1)
+
+        label = batch['label'].repeat_interleave(y_hat.numel() // batch_size)
+        loss = F.binary_cross_entropy_with_logits(y_hat, label.float())
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+        return loss.item()
+
+    for _ in range(warmup):
+        train_step()
+
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        loss = train_step()
+    seconds = time.perf_counter() - start_time
+
+    if device.type == 'cuda':
+        peak_mb = torch.cuda.max_memory_allocated(device) / 2 ** 20
+    else:
+        # ru_maxrss is KB on linux.
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return {
+        'step_ms': seconds / steps * 1000,
+        'clips_per_sec': batch_size * steps / seconds,
+        'loss': loss,
+        'peak_mb': peak_mb,
+    }
+
+
+def print_report(reports: List[Dict[str, Any]], baseline_stages: str, memory_gb: float) -> None:
+
+    print('%-12s %6s %10s %10s %10s %10s %10s' % ('stages', 'batch', 'step ms', 'clips/s', 'slowdown', 'peak MB', 'saved MB'))
+
+    baselines = {report['batch_size']: report for report in reports if report['stages'] == baseline_stages and 'error' not in report}
+
+    for report in reports:
+        if 'error' in report:
+            print('%-12s %6d failed: %s' % (report['stages'], report['batch_size'], report['error']))
+            continue
+
+        baseline = baselines.get(report['batch_size'])
+        slowdown = report['step_ms'] / baseline['step_ms'] if baseline else float('nan')
+        saved = baseline['peak_mb'] - report['peak_mb'] if baseline else float('nan')
+
+        print('%-12s %6d %10.1f %10.2f %9.2fx %10.1f %10.1f' % (
+            report['stages'], report['batch_size'], report['step_ms'], report['clips_per_sec'], slowdown, report['peak_mb'], saved,
+        ))
+
+    # the largest batch of the stages in the host memory, and the throughput of it.
+    print('\nlargest batch in %.1f GB:' % memory_gb)
+
+    for stages in dict.fromkeys(report['stages'] for report in reports):
+        fits = [
+            report for report in reports
+            if report['stages'] == stages and 'error' not in report and report['peak_mb'] <= memory_gb * 1024
+        ]
+
+        if fits:
+            best = max(fits, key=lambda report: report['batch_size'])
+            print('%-12s batch %d, %.2f clips/s, %.1f MB' % (stages, best['batch_size'], best['clips_per_sec'], best['peak_mb']))
+        else:
+            print('%-12s no batch fits' % stages)
+
+
+# %%
+if __name__ == '__main__':
+
+    config, unknown = get_parameters()
+    bench_config = get_bench_parameters(unknown)
+
+    # the model.blocks are in the 3D CNN.
+    config.fusion_method = 'slow_fusion'
+
+    # the checkpoint should only trade the memory for the recompute, the model is same.
+    bn_checks = {}
+
+    for stages in bench_config.bench_stages:
+        if parse_stages(stages):
+            bn_checks[stages] = check_bn_stats(config, parse_stages(stages))
+            print('BatchNorm running stats with the checkpoint stages %s, max diff %.2e' % (stages, bn_checks[stages]))
+
+    failed = [stages for stages, diff in bn_checks.items() if diff > bench_config.bench_bn_tol]
+    if failed:
+        raise SystemExit('the BatchNorm running stats are changed by the checkpoint stages %s' % failed)
+
+    reports = []
+
+    for stages in bench_config.bench_stages:
+        for batch_size in bench_config.bench_batch_sizes:
+            print('benchmark %s stages %s batch %d ...' % (config.model, stages, batch_size))
+
+            # one process for one run, the peak memory is not mixed.
+            # the large batch can be killed by the out of memory, the executor raise BrokenProcessPool instead of waiting.
+            with ProcessPoolExecutor(1, mp_context=mp.get_context('spawn')) as executor:
+                try:
+                    result = executor.submit(
+                        benchmark_worker, config, parse_stages(stages), batch_size, bench_config.bench_steps, bench_config.bench_warmup, bench_config.bench_threads,
+                    ).result()
+                except Exception as e:
+                    result = {'error': '%s: %s' % (type(e).__name__, e)}
+
+            reports.append(dict(result, stages=stages, batch_size=batch_size))
+
+    print_report(reports, bench_config.bench_stages[0], bench_config.bench_memory_gb)
+
+    if bench_config.bench_output:
+        with open(bench_config.bench_output, 'w') as f:
+            json.dump({'host': os.uname().nodename, 'config': vars(config), 'bn_checks': bn_checks, 'reports': reports}, f, indent=4)
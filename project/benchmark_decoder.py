@@ -0,0 +1,229 @@
+'''
+benchmark the video decoder backends on one dataset folder.
+
+Every backend decode the uniform clips of the same videos, with num_workers spawned processes like the dataloader workers.
+The report has the clips/s of all the workers, the ms per clip of one worker and the RSS of every worker,
+so we can pick the fastest backend for the host, and then train with main.py --decoder <backend>.
+With --decode_resize, the first --check_videos videos are checked against the torchvision Resize first (decoders.check_decode_resize).
+
+usage:
+    python benchmark_decoder.py --data_path /workspace/data/Cross_Validation/ex_20250116_ap_organized/fold0/train --num_workers 4
+'''
+
+# %%
+import json
+import logging
+import multiprocessing as mp
+import os
+import resource
+import time
+from argparse import ArgumentParser
+from typing import Any, Dict, List, Optional, Tuple
+
+import psutil
+
+from dataloader.clip_index import uniform_clip_num
+from dataloader.decoders import DECODE_RESIZE_TOLERANCE, DECODERS, available_decoders, check_decode_resize, make_decoder
+from dataloader.paired_dataset import VIDEO_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+
+def get_parameters():
+    '''
+    The parameters for the decoder benchmark, can be called out via the --h menu
+    '''
+    parser = ArgumentParser()
+
+    parser.add_argument('--data_path', type=str, required=True, help='the dataset folder, all the videos under it are decoded')
+    parser.add_argument('--decoders', type=str, nargs='+', default=None, choices=list(DECODERS), help='the backends to compare, default all the available backends')
+    parser.add_argument('--num_workers', type=int, default=4, help='the decode processes, same as the dataloader workers')
+    parser.add_argument('--clip_duration', type=int, default=1, help='clip duration for the video')
+    parser.add_argument('--uniform_temporal_subsample_num', type=int, default=8, help='num frame from the clip duration, used by pyav_sparse')
+    parser.add_argument('--img_size', type=int, default=224)
+    parser.add_argument('--decode_resize', action='store_true', help='scale the frames to img_size during decode')
+    parser.add_argument('--check_videos', type=int, default=4, help='with --decode_resize, compare the decode resize with the torchvision Resize on the first N videos')
+    parser.add_argument('--max_videos', type=int, default=None, help='only decode the first N videos, None for all')
+    parser.add_argument('--output', type=str, default=None, help='save the report as json')
+
+    return parser.parse_known_args()
+
+
+def find_videos(data_path: str) -> List[str]:
+    '''
+    all the video files under the folder, sorted.
+    '''
+
+    video_paths = []
+
+    for root, _, files in os.walk(data_path, followlinks=True):
+        for file_name in files:
+            if file_name.lower().endswith(VIDEO_EXTENSIONS):
+                video_paths.append(os.path.join(root, file_name))
+
+    return sorted(video_paths)
+
+
+def benchmark_worker(
+    decoder_name: str,
+    video_paths: List[str],
+    clip_duration: float,
+    num_samples: int,
+    target_size: Optional[Tuple[int, int]],
+) -> Dict[str, Any]:
+    '''
+    decode all the uniform clips of the videos with one backend, in one worker process.
+
+    Args:
+        decoder_name (str): the decoder name in DECODERS.
+        video_paths (List[str]): the videos of this worker.
+        clip_duration (float): the clip duration.
+        num_samples (int): the frame number of one clip.
+        target_size (Optional[Tuple[int, int]]): the (h, w) to scale the frames during decode.
+
+    Returns:
+        Dict[str, Any]: clips, failed clips, decode seconds, rss and peak rss (bytes) of the worker.
+    '''
+
+    decoder = make_decoder(decoder_name, num_samples=num_samples, target_size=target_size)
+
+    clips, failed = 0, 0
+    start_time = time.perf_counter()
+
+    for video_path in video_paths:
+        try:
+            video = decoder.open(video_path)
+        except Exception as e:
+            logger.warning("Failed to open %s with %s: %s", video_path, decoder_name, e)
+            failed += 1
+            continue
+
+        try:
+            for clip_index in range(uniform_clip_num(float(video.duration), clip_duration)):
+                clip = video.get_clip(clip_index * clip_duration, (clip_index + 1) * clip_duration)
+
+                if clip["video"] is None:
+                    failed += 1
+                else:
+                    clips += 1
+        finally:
+            video.close()
+
+    seconds = time.perf_counter() - start_time
+
+    return {
+        "clips": clips,
+        "failed": failed,
+        "seconds": seconds,
+        "rss": psutil.Process().memory_info().rss,
+        # ru_maxrss is KB on linux.
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def benchmark_decoder(decoder_name: str, video_paths: List[str], config) -> Dict[str, Any]:
+    '''
+    benchmark one backend, the videos are split to the workers by round robin.
+    The spawned workers start from the same clean state, so the RSS of the backends can be compared.
+
+    Returns:
+        Dict[str, Any]: the backend report.
+    '''
+
+    num_workers = max(1, min(config.num_workers, len(video_paths)))
+    target_size = (config.img_size, config.img_size) if config.decode_resize else None
+
+    worker_args = [
+        (decoder_name, video_paths[i::num_workers], config.clip_duration, config.uniform_temporal_subsample_num, target_size)
+        for i in range(num_workers)
+    ]
+
+    with mp.get_context("spawn").Pool(num_workers) as pool:
+        workers = pool.starmap(benchmark_worker, worker_args)
+
+    clips = sum(worker["clips"] for worker in workers)
+    decode_seconds = sum(worker["seconds"] for worker in workers)
+    # the workers run in parallel, so the wall time is the slowest worker.
+    wall_seconds = max(worker["seconds"] for worker in workers)
+
+    return {
+        "decoder": decoder_name,
+        "clips": clips,
+        "failed": sum(worker["failed"] for worker in workers),
+        "clips_per_sec": clips / wall_seconds if wall_seconds > 0 else 0.0,
+        "ms_per_clip": decode_seconds / clips * 1000 if clips > 0 else float("nan"),
+        "rss_mb": [worker["rss"] / 2 ** 20 for worker in workers],
+        "peak_rss_mb": [worker["peak_rss"] / 2 ** 20 for worker in workers],
+    }
+
+
+def check_resize(video_paths: List[str], config) -> Dict[str, float]:
+    '''
+    the mean absolute error of the decode resize with the torchvision Resize, for every video.
+
+    Returns:
+        Dict[str, float]: {video path: error}
+    '''
+
+    errors = {}
+
+    for video_path in video_paths:
+        # report the error over the tolerance, not raise.
+        errors[video_path] = check_decode_resize(video_path, config.img_size, config.clip_duration, strict=False)
+        print("decode resize error %.3f (tolerance %.1f): %s" % (errors[video_path], DECODE_RESIZE_TOLERANCE, video_path))
+
+    return errors
+
+
+def print_report(reports: List[Dict[str, Any]]) -> None:
+
+    print("%-14s %8s %8s %10s %10s %14s %14s" % ("decoder", "clips", "failed", "clips/s", "ms/clip", "rss/worker MB", "peak/worker MB"))
+
+    for report in reports:
+        print("%-14s %8d %8d %10.2f %10.2f %14.1f %14.1f" % (
+            report["decoder"],
+            report["clips"],
+            report["failed"],
+            report["clips_per_sec"],
+            report["ms_per_clip"],
+            max(report["rss_mb"]),
+            max(report["peak_rss_mb"]),
+        ))
+
+    finished = [report for report in reports if report["clips"] > 0]
+
+    if finished:
+        fastest = max(finished, key=lambda report: report["clips_per_sec"])
+        print("\nthe fastest backend: %s, use main.py --decoder %s" % (fastest["decoder"], fastest["decoder"]))
+
+
+# %%
+if __name__ == '__main__':
+
+    config, unkonwn = get_parameters()
+
+    video_paths = find_videos(config.data_path)[:config.max_videos]
+    print("videos:", len(video_paths))
+
+    decoder_names = config.decoders or available_decoders()
+
+    resize_errors = check_resize(video_paths[:config.check_videos], config) if config.decode_resize else {}
+
+    reports = []
+
+    for decoder_name in decoder_names:
+        print("benchmark %s ..." % decoder_name)
+
+        try:
+            reports.append(benchmark_decoder(decoder_name, video_paths, config))
+        except ImportError as e:
+            print("skip %s: %s" % (decoder_name, e))
+
+    print_report(reports)
+
+    if resize_errors:
+        print("\nthe max decode resize error %.3f, the tolerance %.1f" % (max(resize_errors.values()), DECODE_RESIZE_TOLERANCE))
+
+    if config.output:
+        with open(config.output, "w") as f:
+            json.dump({"host": os.uname().nodename, "config": vars(config), "resize_errors": resize_errors, "reports": reports}, f, indent=4)
@@ -0,0 +1,167 @@
+'''
+benchmark the cpu bf16 autocast and the channels_last_3d against fp32, for every --model.
+
+Every (model, mode) run the train step of the WalkVideoClassificationLightningModule (normalize, fuse, forward, BCE loss, backward, Adam)
+on a synthetic uint8 batch in a spawned process, so the peak RSS of the modes can be compared.
+The other parameters (batch_size, img_size, uniform_temporal_subsample_num, model_depth ...) are same as main.py.
+
+usage:
+    python benchmark_precision.py --batch_size 4 --bench_models resnet csn x3d
+'''
+
+# %%
+import copy
+import json
+import multiprocessing as mp
+import os
+import resource
+import time
+from argparse import ArgumentParser
+from typing import Any, Dict, List
+
+import torch
+import torch.nn.functional as F
+
+from main import get_parameters
+from models.make_model import WALK_MODELS
+
+# mode: (precision_mode, channels_last)
+BENCH_MODES = {
+    'fp32': ('fp32', False),
+    'fp32_channels_last': ('fp32', True),
+    'bf16': ('bf16', False),
+    'bf16_channels_last': ('bf16', True),
+}
+
+# the models can be made without the pretrained weights.
+SCRATCH_MODELS = ['resnet', 'csn', 'r2plus1d', 'x3d', 'slowfast']
+
+
+def get_bench_parameters(unknown: List[str]):
+    '''
+    The parameters for the benchmark, the model parameters are from main.get_parameters.
+    '''
+    parser = ArgumentParser()
+
+    parser.add_argument('--bench_models', type=str, nargs='+', default=None, choices=list(WALK_MODELS), help='the models to compare, default all the models can be made (c2d and i3d need --transfor_learning)')
+    parser.add_argument('--bench_modes', type=str, nargs='+', default=list(BENCH_MODES), choices=list(BENCH_MODES), help='the modes to compare, the first one is the baseline')
+    parser.add_argument('--bench_steps', type=int, default=10, help='the measured train steps')
+    parser.add_argument('--bench_warmup', type=int, default=2, help='the warmup train steps')
+    parser.add_argument('--bench_threads', type=int, default=None, help='torch cpu threads, None for the default')
+    parser.add_argument('--bench_output', type=str, default=None, help='save the report as json')
+
+    return parser.parse_known_args(unknown)[0]
+
+
+def benchmark_worker(config, mode: str, steps: int, warmup: int, threads: int) -> Dict[str, Any]:
+    '''
+    the cpu train step of one model and mode, in a spawned process.
+
+    Returns:
+        Dict[str, Any]: the mean step ms, the last loss and the peak RSS (MB) of the process.
+    '''
+
+    from models.pytorchvideo_models import WalkVideoClassificationLightningModule
+
+    if threads:
+        torch.set_num_threads(threads)
+
+    config = copy.copy(config)
+    config.precision_mode, config.channels_last = BENCH_MODES[mode]
+
+    torch.manual_seed(42)
+
+    module = WalkVideoClassificationLightningModule(config)
+    module.train()
+
+    optimizer = torch.optim.Adam(module.parameters(), lr=config.lr)
+
+    shape = (config.batch_size, config.uniform_temporal_subsample_num, 3, config.img_size, config.img_size)
+    batch = {
+        'ap': torch.randint(0, 256, shape, dtype=torch.uint8),
+        'lat': torch.randint(0, 256, shape, dtype=torch.uint8),
+        'label': torch.randint(0, 2, (config.batch_size,)),
+    }
+
+    def train_step() -> float:
+        # same as on_after_batch_transfer and training_step.
+        y_hat = module._predict({'ap': module._normalize_video(batch['ap']), 'lat': module._normalize_video(batch['lat'])}).view(-1)
+
+        label = batch['label'].repeat_interleave(y_hat.numel() // config.batch_size)
+        loss = F.binary_cross_entropy_with_logits(y_hat, label.float())
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+        return loss.item()
+
+    for _ in range(warmup):
+        train_step()
+
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        loss = train_step()
+    seconds = time.perf_counter() - start_time
+
+    return {
+        'step_ms': seconds / steps * 1000,
+        'loss': loss,
+        # ru_maxrss is KB on linux.
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_report(reports: List[Dict[str, Any]], baseline_mode: str) -> None:
+
+    print('%-10s %-20s %10s %10s %12s %10s' % ('model', 'mode', 'step ms', 'speedup', 'peak RSS MB', 'loss'))
+
+    baselines = {report['model']: report for report in reports if report['mode'] == baseline_mode and 'error' not in report}
+
+    for report in reports:
+        if 'error' in report:
+            print('%-10s %-20s failed: %s' % (report['model'], report['mode'], report['error']))
+            continue
+
+        baseline = baselines.get(report['model'])
+        speedup = baseline['step_ms'] / report['step_ms'] if baseline else float('nan')
+
+        print('%-10s %-20s %10.1f %9.2fx %12.1f %10.4f' % (
+            report['model'], report['mode'], report['step_ms'], speedup, report['peak_rss_mb'], report['loss'],
+        ))
+
+
+# %%
+if __name__ == '__main__':
+
+    config, unknown = get_parameters()
+    bench_config = get_bench_parameters(unknown)
+
+    # the cpu modes, the model is made on the cpu.
+    config.accelerator = 'cpu'
+    config.fusion_method = 'slow_fusion'
+
+    models = bench_config.bench_models or (list(WALK_MODELS) if config.transfor_learning else SCRATCH_MODELS)
+
+    reports = []
+
+    for model in models:
+        config.model = model
+
+        for mode in bench_config.bench_modes:
+            print('benchmark %s %s ...' % (model, mode))
+
+            # one process for one mode, the peak RSS is not mixed.
+            with mp.get_context('spawn').Pool(1) as pool:
+                try:
+                    result = pool.apply(benchmark_worker, (config, mode, bench_config.bench_steps, bench_config.bench_warmup, bench_config.bench_threads))
+                except Exception as e:
+                    result = {'error': '%s: %s' % (type(e).__name__, e)}
+
+            reports.append(dict(result, model=model, mode=mode))
+
+    print_report(reports, bench_config.bench_modes[0])
+
+    if bench_config.bench_output:
+        with open(bench_config.bench_output, 'w') as f:
+            json.dump({'host': os.uname().nodename, 'config': vars(config), 'reports': reports}, f, indent=4)
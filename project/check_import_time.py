@@ -0,0 +1,107 @@
+'''
+check the import time of main.py in a fresh interpreter, like every dataloader worker (spawn) and every runner.py subprocess.
+The repo has no test suite, so run it by hand or in the CI, it exit with 1 when the import is slower than the budget.
+
+It also check the import does not load any pytorchvideo model family, which are imported only when the model is made.
+
+usage:
+    python check_import_time.py --budget_sec 5
+'''
+
+# %%
+import json
+import os
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+from models.make_model import MODEL_FAMILIES
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_parameters():
+    '''
+    The parameters for the import time check, can be called out via the --h menu
+    '''
+    parser = ArgumentParser()
+
+    parser.add_argument('--module', type=str, default='main', help='the module to import')
+    parser.add_argument('--budget_sec', type=float, default=5.0, help='fail when the import is slower than this')
+    parser.add_argument('--repeat', type=int, default=3, help='import N times in the new interpreter, and use the fastest one')
+    parser.add_argument('--top', type=int, default=10, help='print the N slowest imports')
+
+    return parser.parse_known_args()
+
+
+def run_python(code: str, importtime: bool = False):
+    '''
+    run the code in a new interpreter in the project folder.
+
+    Returns:
+        the wall time (sec), stdout and stderr.
+    '''
+
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', code]
+
+    start_time = time.perf_counter()
+    result = subprocess.run(command, cwd=PROJECT_DIR, capture_output=True, text=True)
+    wall_sec = time.perf_counter() - start_time
+
+    if result.returncode != 0:
+        raise RuntimeError('%s failed:\n%s' % (code, result.stderr))
+
+    return wall_sec, result.stdout, result.stderr
+
+
+def slowest_imports(importtime_log: str, top: int):
+    '''
+    parse the -X importtime log, the (cumulative us, module) of the slowest imports.
+    '''
+
+    imports = []
+
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, module = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), module.rstrip()))
+
+    return sorted(imports, reverse=True)[:top]
+
+
+# %%
+if __name__ == '__main__':
+
+    config, unkonwn = get_parameters()
+
+    # the interpreter start time, not counted in the budget.
+    baseline_sec = min(run_python('pass')[0] for _ in range(config.repeat))
+    import_sec = min(run_python('import %s' % config.module)[0] for _ in range(config.repeat)) - baseline_sec
+
+    _, _, importtime_log = run_python('import %s' % config.module, importtime=True)
+
+    print('import %s: %.2f s (budget %.2f s)' % (config.module, import_sec, config.budget_sec))
+    for cumulative, module in slowest_imports(importtime_log, config.top):
+        print('%10.3f s  %s' % (cumulative / 1e6, module))
+
+    # the model families should not be imported with the module.
+    _, stdout, _ = run_python(
+        'import json, sys, %s; print(json.dumps([m for m in %r if m in sys.modules]))'
+        % (config.module, [module_name for module_name, _ in MODEL_FAMILIES.values()])
+    )
+    eager_families = json.loads(stdout.strip().splitlines()[-1])
+
+    failed = False
+
+    if eager_families:
+        print('imported model families: %s' % ', '.join(eager_families))
+        failed = True
+
+    if import_sec > config.budget_sec:
+        print('import %s is over the budget' % config.module)
+        failed = True
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,114 @@
+"""
+the balanced sampler on the clip index.
+
+The clip number of every patient is very different (the segment number and length), so the fold is imbalanced by the clips,
+even when it is balanced by the patients. The sampler draw the clips with the weights from the per-clip label and patient of the clip index,
+so it does not read any file at the epoch start, and one epoch is one torch.multinomial call.
+"""
+
+from typing import Iterator, Optional
+
+import numpy as np
+import torch
+
+from dataloader.clip_index import ClipIndex
+
+BALANCE_MODES = ("class", "patient", "class_patient")
+
+
+def balance_weights(clip_index: ClipIndex, balance: str) -> torch.Tensor:
+    """
+    the sample weight of every clip.
+
+    class: every class has the same probability.
+    patient: every patient has the same probability.
+    class_patient: every class has the same probability, and every patient in the class has the same probability.
+
+    Args:
+        clip_index (ClipIndex): the clip index with the label and patient.
+        balance (str): the balance mode, in BALANCE_MODES.
+
+    Returns:
+        torch.Tensor: the weights, float64, sum to 1.
+    """
+
+    if balance not in BALANCE_MODES:
+        raise ValueError(f"the balance should be in {BALANCE_MODES}, get {balance}")
+
+    if clip_index.label is None or clip_index.patient is None:
+        raise ValueError("the clip index has no label or patient, build it with the labels and patients.")
+
+    label, patient = clip_index.label, clip_index.patient
+
+    # the clip number of the class and the patient of every clip.
+    clips_of_class = np.bincount(label)[label]
+    clips_of_patient = np.bincount(patient)[patient]
+
+    if balance == "class":
+        weights = 1.0 / clips_of_class
+
+    elif balance == "patient":
+        weights = 1.0 / clips_of_patient
+
+    else:
+        # the patient number of every class.
+        patient_label = np.zeros(patient.max() + 1, dtype=np.int64)
+        patient_label[patient] = label
+        patients_of_class = np.bincount(patient_label[np.unique(patient)], minlength=label.max() + 1)[label]
+
+        weights = 1.0 / (patients_of_class * clips_of_patient)
+
+    weights = torch.from_numpy(weights.astype(np.float64))
+
+    return weights / weights.sum()
+
+
+class BalancedClipSampler(torch.utils.data.Sampler):
+    """
+    draw the clip index rows with the balance weights, with replacement.
+    Use it as the sampler of the map-style dataset with the clip_index property (WalkClipDataset, WalkFrameStoreDataset).
+    """
+
+    def __init__(
+        self,
+        clip_index: ClipIndex,
+        balance: str = "class",
+        num_samples: Optional[int] = None,
+        replacement: bool = True,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            clip_index (ClipIndex): the clip index of the dataset.
+            balance (str, optional): the balance mode, in BALANCE_MODES. Defaults to "class".
+            num_samples (Optional[int], optional): the clips of one epoch, None for the clip number. Defaults to None.
+            replacement (bool, optional): draw with replacement, the minority clips are repeated. Defaults to True.
+            seed (Optional[int], optional): the seed of the sampler, None to follow the torch seed. Defaults to None.
+        """
+
+        self.weights = balance_weights(clip_index, balance)
+        self.num_samples = num_samples or len(clip_index)
+        self.replacement = replacement
+        self.seed = seed
+        self.epoch = 0
+
+        if not replacement and self.num_samples > len(clip_index):
+            raise ValueError(f"can not draw {self.num_samples} clips from {len(clip_index)} without replacement")
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def __iter__(self) -> Iterator[int]:
+        generator = torch.Generator()
+
+        if self.seed is not None:
+            generator.manual_seed(self.seed + self.epoch)
+        else:
+            generator.manual_seed(int(torch.empty((), dtype=torch.int64).random_().item()))
+
+        rows = torch.multinomial(self.weights, self.num_samples, self.replacement, generator=generator)
+
+        yield from rows.tolist()
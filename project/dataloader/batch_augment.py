@@ -0,0 +1,126 @@
+"""
+the batched augmentation for the paired ap and lat clips.
+
+The random parameters (flip, scale and crop position) are sampled once for one pair,
+so the two views of one sample always get the same geometric transform.
+The ap and lat batch are stacked to b, 2, t, c, h, w, and the transform is one affine grid sample for the whole batch,
+without the python transform for every sample and every view.
+
+It can run after the batch transfer on the device (the model on_after_batch_transfer),
+or in the dataloader worker with the PairedAugmentCollate, on the uint8 batch.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import default_collate
+
+BATCH_AUGMENT = ("device", "worker")
+
+
+class PairedBatchAugment(nn.Module):
+    """
+    random horizontal flip and random scale + crop, same parameters for the two views of one pair.
+    The scale + crop is same as the RandomShortSideScale to img_size * scale and the RandomCrop to img_size,
+    but done by the bilinear grid sample on the batch.
+    """
+
+    def __init__(self, flip_prob: float = 0.5, scale_range: Tuple[float, float] = (1.0, 1.0)) -> None:
+        """
+        Args:
+            flip_prob (float, optional): the horizontal flip probability of one pair. Defaults to 0.5.
+            scale_range (Tuple[float, float], optional): the random zoom in range, (1.0, 1.0) for the flip only. Defaults to (1.0, 1.0).
+        """
+
+        super().__init__()
+
+        if scale_range[0] < 1.0 or scale_range[0] > scale_range[1]:
+            raise ValueError(f"the scale range should be 1 <= min <= max, get {scale_range}")
+
+        self.flip_prob = flip_prob
+        self.scale_range = scale_range
+
+    def sample_params(self, batch_size: int, device: torch.device) -> Dict[str, torch.Tensor]:
+        """
+        sample the parameters of every pair.
+
+        Returns:
+            Dict[str, torch.Tensor]: flip [b] bool, scale [b], shift [b, 2] in the normalized coordinate.
+        """
+
+        flip = torch.rand(batch_size, device=device) < self.flip_prob
+
+        scale_min, scale_max = self.scale_range
+        scale = torch.empty(batch_size, device=device).uniform_(scale_min, scale_max)
+
+        # the crop window is 1 / scale of the frame, and moves in the rest.
+        max_shift = (1.0 - 1.0 / scale).unsqueeze(1)
+        shift = (torch.rand(batch_size, 2, device=device) * 2 - 1) * max_shift
+
+        return {"flip": flip, "scale": scale, "shift": shift}
+
+    def forward(self, video_ap: torch.Tensor, video_lat: torch.Tensor, params: Optional[Dict[str, torch.Tensor]] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Args:
+            video_ap (torch.Tensor): b, t, c, h, w, uint8 or float.
+            video_lat (torch.Tensor): b, t, c, h, w, same shape as the video_ap.
+            params (Optional[Dict[str, torch.Tensor]], optional): the parameters from sample_params, None to sample. Defaults to None.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: the augmented ap and lat video, same dtype as the input.
+        """
+
+        videos = torch.stack([video_ap, video_lat], dim=1) # b, 2, t, c, h, w
+        b, v, t, c, h, w = videos.shape
+
+        if params is None:
+            params = self.sample_params(b, videos.device)
+
+        if self.scale_range == (1.0, 1.0):
+            # flip only, no resample.
+            videos = torch.where(params["flip"].view(-1, 1, 1, 1, 1, 1), videos.flip(-1), videos)
+            return videos[:, 0], videos[:, 1]
+
+        # the affine of every pair: x = sign / scale * x' + shift_x, y = 1 / scale * y' + shift_y
+        inv_scale = 1.0 / params["scale"]
+        sign = 1.0 - 2.0 * params["flip"].float()
+
+        theta = torch.zeros(b, 2, 3, device=videos.device)
+        theta[:, 0, 0] = sign * inv_scale
+        theta[:, 1, 1] = inv_scale
+        theta[:, :, 2] = params["shift"]
+
+        # one theta for all the frames of the two views.
+        theta = theta.repeat_interleave(v * t, dim=0)
+
+        frames = videos.reshape(b * v * t, c, h, w)
+        out = frames.float() if not frames.is_floating_point() else frames
+
+        grid = F.affine_grid(theta.to(out.dtype), [b * v * t, c, h, w], align_corners=False)
+        out = F.grid_sample(out, grid, mode="bilinear", padding_mode="border", align_corners=False)
+
+        if not frames.is_floating_point():
+            out = out.round_().clamp_(0, 255).to(frames.dtype)
+
+        out = out.view(b, v, t, c, h, w)
+
+        return out[:, 0], out[:, 1]
+
+
+class PairedAugmentCollate:
+    """
+    collate the paired clips, and augment the batch in the dataloader worker.
+    """
+
+    def __init__(self, augment: PairedBatchAugment) -> None:
+        self.augment = augment
+
+    def __call__(self, samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+        batch = default_collate(samples)
+
+        with torch.no_grad():
+            batch["ap"], batch["lat"] = self.augment(batch["ap"], batch["lat"])
+
+        return batch
@@ -0,0 +1,188 @@
+"""
+persistent on-disk cache of the pre-decoded walk clips.
+
+The clips of one video pair are stored after the transform as one uint8 shard file,
+shape [clip_num, 2 (ap, lat), t, c, h, w], and read back as a memory-mapped array.
+So the later epochs and the later folds can skip the video decode.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+import numpy as np
+import torch
+
+from dataloader.paired_dataset import VideoPair
+
+logger = logging.getLogger(__name__)
+
+
+class ClipCache:
+    """
+    the clip cache for the paired walk dataset, one shard file for one video pair.
+
+    The cache key is made of the relative video name, the video size and mtime, the clip parameters and the decoder,
+    so the shard will be rebuilt when the video, the clip setting or the decode changed.
+    The key does not depend on the fold folder, the fold copies (copy2 keep the mtime) of the same patient video hit the same shard.
+    Notice that, the cached clip is the output of the dataset transform, so the transform should be deterministic.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        clip_duration: float,
+        uniform_temporal_subsample_num: int,
+        img_size: int,
+        decoder: str = "pyav",
+        decode_resize: bool = False,
+    ) -> None:
+        """
+        Args:
+            cache_dir (str): the folder to save the shard files.
+            clip_duration (float): clip duration for the video.
+            uniform_temporal_subsample_num (int): num frame from the clip duration.
+            img_size (int): the image size after resize.
+            decoder (str, optional): the decoder name in DECODERS, the backends decode the different frames. Defaults to "pyav".
+            decode_resize (bool, optional): the frames are scaled during decode. Defaults to False.
+        """
+
+        self.cache_dir = cache_dir
+        self.clip_duration = clip_duration
+        self.uniform_temporal_subsample_num = uniform_temporal_subsample_num
+        self.img_size = img_size
+        self.decoder = decoder
+        self.decode_resize = decode_resize
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, video_pair: VideoPair) -> str:
+        """
+        make the cache key of the video pair, not depend on the fold folder.
+
+        Args:
+            video_pair (VideoPair): the video pair.
+
+        Returns:
+            str: the sha1 hex digest of the video name, size, mtime, clip parameters and decoder.
+        """
+
+        ap_stat = os.stat(video_pair.ap_path)
+        lat_stat = os.stat(video_pair.lat_path)
+
+        key_items = [
+            video_pair.name,
+            str(ap_stat.st_size),
+            str(ap_stat.st_mtime_ns),
+            str(lat_stat.st_size),
+            str(lat_stat.st_mtime_ns),
+            str(self.clip_duration),
+            str(self.uniform_temporal_subsample_num),
+            str(self.img_size),
+            self.decoder,
+            str(self.decode_resize),
+        ]
+
+        return hashlib.sha1("|".join(key_items).encode("utf-8")).hexdigest()
+
+    def _shard_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def build_lock(self, video_pair: VideoPair):
+        """
+        the lock of the shard build, so only one worker decode the video pair at the same time.
+        """
+
+        shard_path = self._shard_path(self.key(video_pair))
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+
+        return file_lock(shard_path[: -len(".npy")] + ".lock")
+
+    def load(self, video_pair: VideoPair) -> Optional[np.ndarray]:
+        """
+        load the shard of the video pair as a read only memory-mapped array.
+
+        Args:
+            video_pair (VideoPair): the video pair.
+
+        Returns:
+            Optional[np.ndarray]: the uint8 shard, [clip_num, 2, t, c, h, w], None when not cached.
+        """
+
+        shard_path = self._shard_path(self.key(video_pair))
+
+        if not os.path.isfile(shard_path):
+            return None
+
+        try:
+            return np.load(shard_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning("broken clip cache shard %s, will rebuild it. error: %s", shard_path, e)
+            return None
+
+    def save(self, video_pair: VideoPair, ap_clips: List[torch.Tensor], lat_clips: List[torch.Tensor]) -> None:
+        """
+        save all the clips of the video pair into one shard.
+        The shard is written to a temp file first and then renamed, so the different workers will not read a half shard.
+
+        Args:
+            video_pair (VideoPair): the video pair.
+            ap_clips (List[torch.Tensor]): the ap clips after transform, t, c, h, w.
+            lat_clips (List[torch.Tensor]): the lat clips after transform, t, c, h, w.
+        """
+
+        if len(ap_clips) == 0:
+            return
+
+        shard_path = self._shard_path(self.key(video_pair))
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+        tmp_path = "%s.%d.tmp.npy" % (shard_path[: -len(".npy")], os.getpid())
+
+        shape = (len(ap_clips), 2) + tuple(ap_clips[0].shape)
+        shard = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=shape)
+
+        for i, (ap_clip, lat_clip) in enumerate(zip(ap_clips, lat_clips)):
+            shard[i, 0] = to_uint8(ap_clip).numpy()
+            shard[i, 1] = to_uint8(lat_clip).numpy()
+
+        shard.flush()
+        del shard
+
+        os.replace(tmp_path, shard_path)
+
+
+@contextmanager
+def file_lock(lock_path: str) -> Iterator[None]:
+    """
+    the exclusive flock of the lock file, between the dataloader workers and the processes.
+
+    Args:
+        lock_path (str): the lock file path, made when not exist.
+    """
+
+    with open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def to_uint8(clip: torch.Tensor) -> torch.Tensor:
+    """
+    convert the clip in [0, 255] to uint8, the float clip will be rounded.
+
+    Args:
+        clip (torch.Tensor): the clip tensor.
+
+    Returns:
+        torch.Tensor: the uint8 clip tensor.
+    """
+
+    if clip.dtype == torch.uint8:
+        return clip
+
+    return clip.round().clamp(0, 255).to(torch.uint8)
@@ -0,0 +1,305 @@
+"""
+the precomputed clip index of the walk dataset, and the map-style dataset on it.
+
+The clip index is a flat array of (video_id, clip_start, clip_end), same as the clips of the uniform clip sampler.
+With the map-style dataset, the dataloader can shuffle the clips, use the DistributedSampler,
+and know the epoch length.
+"""
+
+import logging
+import math
+import os
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+
+from dataloader.decoders import VideoDecoder, make_decoder
+from dataloader.manifest import VideoManifest, probe_duration
+from dataloader.paired_dataset import VideoPair, decode_paired_clip, load_cached_clip
+
+if TYPE_CHECKING:
+    from dataloader.clip_cache import ClipCache
+
+logger = logging.getLogger(__name__)
+
+
+class ClipIndex:
+    """
+    the flat clip index, one row for one clip.
+
+    Args:
+        video_id (np.ndarray): the video pair index of the clip, int64.
+        clip_start (np.ndarray): the clip start time (sec), float64.
+        clip_end (np.ndarray): the clip end time (sec), float64.
+        clip_in_video (np.ndarray): the clip index in the video, int64.
+        label (Optional[np.ndarray], optional): the class label of the clip, int64. Defaults to None.
+        patient (Optional[np.ndarray], optional): the patient id of the clip, int64. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        video_id: np.ndarray,
+        clip_start: np.ndarray,
+        clip_end: np.ndarray,
+        clip_in_video: np.ndarray,
+        label: Optional[np.ndarray] = None,
+        patient: Optional[np.ndarray] = None,
+    ) -> None:
+        self.video_id = video_id
+        self.clip_start = clip_start
+        self.clip_end = clip_end
+        self.clip_in_video = clip_in_video
+        self.label = label
+        self.patient = patient
+
+    def __len__(self) -> int:
+        return len(self.video_id)
+
+    def clips_of_video(self, video_id: int) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: the row index of the clips of the video, sorted by the clip time.
+        """
+        return np.flatnonzero(self.video_id == video_id)
+
+
+def uniform_clip_num(duration: float, clip_duration: float, eps: float = 1e-6) -> int:
+    """
+    the clip number of the uniform clip sampler, with stride = clip_duration and no backpad.
+    The first clip is always sampled, even the video is shorter than the clip duration.
+
+    Args:
+        duration (float): the video duration.
+        clip_duration (float): the clip duration.
+        eps (float, optional): the eps of the uniform clip sampler. Defaults to 1e-6.
+
+    Returns:
+        int: the clip number.
+    """
+    return max(1, math.floor((duration + eps) / clip_duration))
+
+
+def video_pair_durations(paired_video_paths: List[VideoPair], manifest: Optional[VideoManifest] = None) -> List[float]:
+    """
+    the duration of every video pair, the shorter one of the two views, same as the PairedWalkDataset.
+
+    Args:
+        paired_video_paths (List[VideoPair]): the paired video list.
+        manifest (Optional[VideoManifest], optional): the cached video manifest, probe the video headers when None. Defaults to None.
+
+    Returns:
+        List[float]: the durations.
+    """
+
+    def duration(file_path: str) -> float:
+        if manifest is not None:
+            return manifest.video_info(file_path)["duration"]
+        # only the header, the packet demux of the probe_video is for the manifest keyframes.
+        return probe_duration(file_path)
+
+    return [min(duration(video_pair.ap_path), duration(video_pair.lat_path)) for video_pair in paired_video_paths]
+
+
+def video_pair_patients(paired_video_paths: List[VideoPair]) -> np.ndarray:
+    """
+    the patient id of every video pair, the segments of one patient are in the same class/person folder.
+
+    Args:
+        paired_video_paths (List[VideoPair]): the paired video list.
+
+    Returns:
+        np.ndarray: the patient id, int64, 0 ... patient number - 1.
+    """
+
+    patient_folders = [os.path.dirname(video_pair.name) for video_pair in paired_video_paths]
+    _, patients = np.unique(patient_folders, return_inverse=True)
+
+    return patients.astype(np.int64)
+
+
+def build_clip_index(
+    durations: Sequence[float],
+    clip_duration: float,
+    labels: Optional[Sequence[int]] = None,
+    patients: Optional[Sequence[int]] = None,
+) -> ClipIndex:
+    """
+    build the clip index from the video durations.
+
+    Args:
+        durations (Sequence[float]): the duration of every video pair.
+        clip_duration (float): the clip duration.
+        labels (Optional[Sequence[int]], optional): the label of every video pair, repeated to the clips. Defaults to None.
+        patients (Optional[Sequence[int]], optional): the patient id of every video pair, repeated to the clips. Defaults to None.
+
+    Returns:
+        ClipIndex: the clip index.
+    """
+
+    clip_nums = np.array([uniform_clip_num(duration, clip_duration) for duration in durations], dtype=np.int64)
+
+    video_id = np.repeat(np.arange(len(clip_nums), dtype=np.int64), clip_nums)
+
+    # the clip index in the video, 0, 1, ... for every video.
+    clip_offset = np.repeat(np.cumsum(clip_nums) - clip_nums, clip_nums)
+    clip_in_video = np.arange(len(video_id), dtype=np.int64) - clip_offset
+
+    clip_start = clip_in_video * float(clip_duration)
+    clip_end = clip_start + float(clip_duration)
+
+    label = np.asarray(labels, dtype=np.int64)[video_id] if labels is not None else None
+    patient = np.asarray(patients, dtype=np.int64)[video_id] if patients is not None else None
+
+    return ClipIndex(video_id, clip_start, clip_end, clip_in_video, label, patient)
+
+
+class WalkClipDataset(torch.utils.data.Dataset):
+    """
+    the map-style paired walk dataset, one sample index for one clip of the clip index.
+    The sample is same as the PairedWalkDataset, dict with ap, lat, label, name and clip_index.
+    """
+
+    def __init__(
+        self,
+        paired_video_paths: List[VideoPair],
+        clip_index: ClipIndex,
+        transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        decoder: Union[str, VideoDecoder] = "pyav",
+        clip_cache: Optional["ClipCache"] = None,
+    ) -> None:
+        """
+        Args:
+            paired_video_paths (List[VideoPair]): the paired video list.
+            clip_index (ClipIndex): the clip index on the paired video list.
+            transform (Optional[Callable[[Dict[str, Any]], Dict[str, Any]]], optional): This callable is evaluated on the paired clip output before the clip is returned. Defaults to None.
+            decoder (Union[str, VideoDecoder], optional): the decoder name in decoders.DECODERS, or the decoder instance. Defaults to "pyav".
+            clip_cache (Optional[ClipCache], optional): the on-disk clip cache. Defaults to None.
+        """
+
+        self._paired_video_paths = paired_video_paths
+        self._clip_index = clip_index
+        self._transform = transform
+        self._decoder = make_decoder(decoder) if isinstance(decoder, str) else decoder
+        self._clip_cache = clip_cache
+
+        # the videos failed to build the cache in this worker, decode the clips of them without the cache.
+        self._failed_videos = set()
+
+    @property
+    def paired_video_paths(self) -> List[VideoPair]:
+        return self._paired_video_paths
+
+    @property
+    def clip_index(self) -> ClipIndex:
+        return self._clip_index
+
+    def __len__(self) -> int:
+        return len(self._clip_index)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        """
+        load the clip of the index, from the cache or decode.
+
+        Args:
+            index (int): the clip index.
+
+        Returns:
+            Dict[str, Any]: the paired clip.
+        """
+
+        video_id = int(self._clip_index.video_id[index])
+        clip_in_video = int(self._clip_index.clip_in_video[index])
+        video_pair = self._paired_video_paths[video_id]
+
+        if self._clip_cache is not None and video_id not in self._failed_videos:
+            shard = self._clip_cache.load(video_pair)
+            sample_dict = None
+
+            if shard is None:
+                shard, sample_dict = self._build_cache(video_id, index)
+
+            if shard is not None and clip_in_video < shard.shape[0]:
+                return load_cached_clip(video_pair, shard, clip_in_video)
+
+            # the build failed on the other clips, this clip has been decoded.
+            if sample_dict is not None:
+                return sample_dict
+
+        sample_dict = self._decode_clips(video_pair, [index])[0]
+
+        if sample_dict is None:
+            raise RuntimeError(f"Failed to decode clip {clip_in_video} of {video_pair.name}")
+
+        return sample_dict
+
+    def _decode_clips(self, video_pair: VideoPair, rows: Sequence[int]) -> List[Optional[Dict[str, Any]]]:
+        """
+        open the two views once, and decode the clips of the rows.
+
+        Args:
+            video_pair (VideoPair): the video pair.
+            rows (Sequence[int]): the rows in the clip index, of the same video.
+
+        Returns:
+            List[Optional[Dict[str, Any]]]: the paired clips, None when decode failed.
+        """
+
+        ap_video = self._decoder.open(video_pair.ap_path)
+        lat_video = self._decoder.open(video_pair.lat_path)
+
+        try:
+            return [
+                decode_paired_clip(
+                    ap_video,
+                    lat_video,
+                    video_pair,
+                    self._clip_index.clip_start[row],
+                    self._clip_index.clip_end[row],
+                    int(self._clip_index.clip_in_video[row]),
+                    self._transform,
+                )
+                for row in rows
+            ]
+        finally:
+            ap_video.close()
+            lat_video.close()
+
+    def _build_cache(self, video_id: int, index: int) -> Tuple[Optional[np.ndarray], Optional[Dict[str, Any]]]:
+        """
+        decode all the clips of the video once, and save them to the clip cache.
+        The build is under the lock of the video pair, the other workers wait and load the shard, instead of decoding the same video.
+
+        Args:
+            video_id (int): the video pair index.
+            index (int): the clip index of the __getitem__.
+
+        Returns:
+            Tuple[Optional[np.ndarray], Optional[Dict[str, Any]]]: the memory-mapped shard, None when any clip decode failed,
+                and the decoded clip of the index, None when it is loaded by the other worker or failed.
+        """
+
+        video_pair = self._paired_video_paths[video_id]
+
+        with self._clip_cache.build_lock(video_pair):
+            # the other worker has built it when waiting the lock.
+            shard = self._clip_cache.load(video_pair)
+            if shard is not None:
+                return shard, None
+
+            rows = self._clip_index.clips_of_video(video_id)
+            sample_dicts = self._decode_clips(video_pair, rows)
+            index_sample = sample_dicts[int(np.flatnonzero(rows == index)[0])]
+
+            if any(sample_dict is None for sample_dict in sample_dicts):
+                logger.warning("Failed to build the clip cache of %s, decode its clips without the cache.", video_pair.name)
+                self._failed_videos.add(video_id)
+                return None, index_sample
+
+            self._clip_cache.save(
+                video_pair,
+                [sample_dict["ap"] for sample_dict in sample_dicts],
+                [sample_dict["lat"] for sample_dict in sample_dicts],
+            )
+
+            return self._clip_cache.load(video_pair), index_sample
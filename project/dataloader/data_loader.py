@@ -21,7 +21,7 @@ from torchvision.transforms import (
 from torchvision.transforms.v2 import functional as F, Transform
 from torchvision.transforms.v2 import UniformTemporalSubsample
 
-from typing import Any, Callable, Dict, Optional, Type
+from typing import Any, Callable, Dict, List, Optional, Type, Union
 from pytorch_lightning import LightningDataModule
 import os
 
@@ -29,12 +29,21 @@ import torch
 from torch.utils.data import DataLoader
 from pytorchvideo.data.clip_sampling import ClipSampler
 from pytorchvideo.data import make_clip_sampler
-from pytorch_lightning.trainer.supporters import CombinedLoader
 
-from pytorchvideo.data.labeled_video_dataset import (
-    LabeledVideoDataset,
-    labeled_video_dataset,
-)
+from dataloader.paired_dataset import PairedWalkDataset, VideoPair, make_paired_video_paths
+from dataloader.clip_index import WalkClipDataset, build_clip_index, video_pair_durations, video_pair_patients
+from dataloader.clip_cache import ClipCache, to_uint8
+from dataloader.shared_clip_cache import get_shared_clip_cache
+from dataloader.decoders import VideoDecoder, make_decoder
+from dataloader.manifest import VideoManifest
+from dataloader.shard_dataset import WalkShardDataset, read_shard_paths
+from dataloader.frame_store import FrameStore, WalkFrameStoreDataset
+from dataloader.recording_dataset import WalkRecordingDataset, load_split_persons, make_recordings
+from dataloader.prefetcher import AsyncBatchPrefetcher
+from dataloader.batch_augment import PairedAugmentCollate, PairedBatchAugment
+from dataloader.balanced_sampler import BalancedClipSampler
+from dataloader.profiler import PipelineProfiler, ProfiledCollate, ProfiledDataLoader, ProfiledDecoder, profile_transforms
+from dataloader.progressive import ProgressiveSchedule, ProgressiveTransform
 
 class ApplyTransformToKey:
     """
@@ -82,39 +91,123 @@ class UniformTemporalSubsample(Transform):
         return self._call_kernel(F.uniform_temporal_subsample, inpt, self.num_samples)
 
 
+def _get_paired_video_paths(
+    data_path_ap: str,
+    data_path_lat: str,
+    decoder: Union[str, VideoDecoder],
+    manifest: Optional[VideoManifest] = None,
+) -> List[VideoPair]:
+    """
+    pair the ap and lat videos, from the manifest or walk the folders.
+
+    Args:
+        data_path_ap (str): Path to the ap data.
+        data_path_lat (str): Path to the lat data.
+        decoder (Union[str, VideoDecoder]): the decoder, get the probed video info from the manifest.
+        manifest (Optional[VideoManifest], optional): the cached video manifest. Defaults to None.
+
+    Returns:
+        List[VideoPair]: the paired video list.
+    """
+    if manifest is None:
+        return make_paired_video_paths(data_path_ap, data_path_lat)
+
+    paired_video_paths = manifest.paired_video_paths(data_path_ap, data_path_lat)
+
+    # only the info of this split, to keep the decoder small when copied to the workers.
+    if isinstance(decoder, VideoDecoder):
+        decoder.add_video_info({
+            video_path: manifest.videos[video_path]
+            for video_pair in paired_video_paths
+            for video_path in (video_pair.ap_path, video_pair.lat_path)
+        })
+
+    return paired_video_paths
+
+
 def WalkDataset(
-    data_path: str,
+    data_path_ap: str,
+    data_path_lat: str,
     clip_sampler: ClipSampler,
     video_sampler: Type[torch.utils.data.Sampler] = torch.utils.data.RandomSampler,
     transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
-    video_path_prefix: str = "",
-    decode_audio: bool = False,
-    decoder: str = "pyav",
-) -> LabeledVideoDataset:
+    decoder: Union[str, VideoDecoder] = "pyav",
+    clip_cache: Optional[ClipCache] = None,
+    manifest: Optional[VideoManifest] = None,
+    multi_clip_buffer: int = 0,
+    shuffle_window: int = 0,
+) -> PairedWalkDataset:
     """
-    A helper function to create "LabeledVideoDataset" object for the Walk dataset.
+    A helper function to create "PairedWalkDataset" object for the Walk dataset.
+    The ap and lat videos are paired by the relative path, and decoded in the same worker.
 
     Args:
-        data_path (str): Path to the data. The path defines how the data should be read. For a directory, the directory structure defines the classes (i.e. each subdirectory is class).
-        clip_sampler (ClipSampler): Defines how clips should be sampled from each video. See the clip sampling documentation for more information.
-        video_sampler (Type[torch.utils.data.Sampler], optional): Sampler for the internal video container. Defaults to torch.utils.data.RandomSampler.
-        transform (Optional[Callable[[Dict[str, Any]], Dict[str, Any]]], optional): This callable is evaluated on the clip output before the clip is returned. Defaults to None.
-        video_path_prefix (str, optional): Path to root directory with the videos that are
-                loaded in ``LabeledVideoDataset``. Defaults to "".
-        decode_audio (bool, optional): If True, also decode audio from video. Defaults to False. Notice that, if Ture will trigger the stack error.
-        decoder (str, optional): Defines what type of decoder used to decode a video. Defaults to "pyav".
+        data_path_ap (str): Path to the ap data. For a directory, the directory structure defines the classes (i.e. each subdirectory is class).
+        data_path_lat (str): Path to the lat data, with the same directory structure as the ap data.
+        clip_sampler (ClipSampler): Defines how clips should be sampled from each video pair. See the clip sampling documentation for more information.
+        video_sampler (Type[torch.utils.data.Sampler], optional): Sampler for the video pair index. Defaults to torch.utils.data.RandomSampler.
+        transform (Optional[Callable[[Dict[str, Any]], Dict[str, Any]]], optional): This callable is evaluated on the paired clip output before the clip is returned. Defaults to None.
+        decoder (Union[str, VideoDecoder], optional): Defines what type of decoder used to decode a video, "pyav" decode all the frames, "pyav_sparse" only decode the subsampled frames. Defaults to "pyav".
+        clip_cache (Optional[ClipCache], optional): the on-disk cache of the decoded clips. Defaults to None.
+        manifest (Optional[VideoManifest], optional): the cached video manifest, skip the directory walk when the folders not changed. Defaults to None.
+        multi_clip_buffer (int, optional): the max clip number decoded in one pass, 0 to decode clip by clip. Defaults to 0.
+        shuffle_window (int, optional): shuffle the clips within a window of this size, 0 to keep the order. Defaults to 0.
 
     Returns:
-        LabeledVideoDataset: _description_
+        PairedWalkDataset: the dataset yield dict with ap, lat, label and name.
     """
-    return labeled_video_dataset(
-        data_path,
+    paired_video_paths = _get_paired_video_paths(data_path_ap, data_path_lat, decoder, manifest)
+
+    return PairedWalkDataset(
+        paired_video_paths,
         clip_sampler,
         video_sampler,
         transform,
-        video_path_prefix,
-        decode_audio,
         decoder,
+        clip_cache,
+        multi_clip_buffer,
+        shuffle_window,
+    )
+
+def WalkClipIndexDataset(
+    data_path_ap: str,
+    data_path_lat: str,
+    clip_duration: float,
+    transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    decoder: Union[str, VideoDecoder] = "pyav",
+    clip_cache: Optional[ClipCache] = None,
+    manifest: Optional[VideoManifest] = None,
+) -> WalkClipDataset:
+    """
+    A helper function to create the map-style "WalkClipDataset" object for the Walk dataset.
+    The clip index is same as the uniform clip sampler, but can be shuffled and sharded by the sampler of the dataloader.
+
+    Args:
+        data_path_ap (str): Path to the ap data. For a directory, the directory structure defines the classes (i.e. each subdirectory is class).
+        data_path_lat (str): Path to the lat data, with the same directory structure as the ap data.
+        clip_duration (float): the clip duration of the uniform clip index.
+        transform (Optional[Callable[[Dict[str, Any]], Dict[str, Any]]], optional): This callable is evaluated on the paired clip output before the clip is returned. Defaults to None.
+        decoder (Union[str, VideoDecoder], optional): Defines what type of decoder used to decode a video. Defaults to "pyav".
+        clip_cache (Optional[ClipCache], optional): the on-disk cache of the decoded clips. Defaults to None.
+        manifest (Optional[VideoManifest], optional): the cached video manifest, the video durations are read from it. Defaults to None.
+
+    Returns:
+        WalkClipDataset: the dataset return dict with ap, lat, label and name.
+    """
+    paired_video_paths = _get_paired_video_paths(data_path_ap, data_path_lat, decoder, manifest)
+    clip_index = build_clip_index(
+        video_pair_durations(paired_video_paths, manifest),
+        clip_duration,
+        labels=[video_pair.label for video_pair in paired_video_paths],
+        patients=video_pair_patients(paired_video_paths),
+    )
+
+    return WalkClipDataset(
+        paired_video_paths,
+        clip_index,
+        transform,
+        decoder,
+        clip_cache,
     )
 
 class WalkDataModule(LightningDataModule):
@@ -129,24 +222,126 @@ class WalkDataModule(LightningDataModule):
         self._NUM_WORKERS = opt.num_workers
         self._IMG_SIZE = opt.img_size
 
+        # the loader settings, can be tuned per host by tune_loader.py
+        self._PREFETCH_FACTOR = opt.prefetch_factor
+        self._PERSISTENT_WORKERS = opt.persistent_workers
+        self._PIN_MEMORY = opt.pin_memory
+        # the batches copied to the device by a background thread ahead of the step, 0 to disable.
+        self._ASYNC_PREFETCH = opt.async_prefetch
+        # the prefetcher of every dataloader name, reported in the teardown.
+        self._prefetchers: Dict[str, AsyncBatchPrefetcher] = {}
+
+        # draw the train clips with the class / patient balance weights of the clip index, only for the map-style dataset.
+        self._BALANCE_SAMPLER = opt.balance_sampler
+
+        if self._BALANCE_SAMPLER != "none" and opt.dataset_type not in ("clip_index", "frame_store"):
+            raise ValueError(f"the balance sampler needs the clip index, not work with the {opt.dataset_type} dataset")
+
+        # the paired batch augmentation in the train dataloader worker, else it is in the model after the batch transfer.
+        if opt.batch_augment == "worker":
+            self.train_collate = PairedAugmentCollate(
+                PairedBatchAugment(opt.aug_flip_prob, (opt.aug_scale_min, opt.aug_scale_max))
+            )
+        else:
+            self.train_collate = None
+
         # frame rate
         self._CLIP_DURATION = opt.clip_duration
         self.uniform_temporal_subsample_num = opt.uniform_temporal_subsample_num
 
-        self.train_transform = Compose(
-            [
-                ApplyTransformToKey(
-                    key="video",
-                    transform=Compose(
-                        [
-                            UniformTemporalSubsample(
-                                self.uniform_temporal_subsample_num
-                            ),
-                            # Lambda(x: x/255),
-                            Resize(size=[self._IMG_SIZE, self._IMG_SIZE]),
-                        ]
+        # the pre-decoded clip cache, None to decode every epoch.
+        self._CLIP_CACHE_DIR = opt.clip_cache_dir
+        # the shared-memory clip cache budget (GB), shared by the workers and the folds. 0 to disable.
+        self._SHARED_CACHE_GB = opt.shared_cache_gb
+        self.clip_cache = None
+
+        # the video decoder, the sparse decoder only decode the subsampled frames.
+        self._DECODER = opt.decoder
+        # scale the frames to img_size during decode, the Resize in transform keep the decoded size.
+        self._DECODE_RESIZE = opt.decode_resize
+
+        # the cached video manifest, None to walk the folders every setup.
+        self._MANIFEST_PATH = opt.manifest_path
+
+        # clip_index: map-style dataset, can shuffle and know the length. iterable: decode the clips video by video.
+        self._DATASET_TYPE = opt.dataset_type
+
+        # for the iterable dataset, decode the consecutive clips in one pass, and shuffle the train clips in a window.
+        self._MULTI_CLIP_BUFFER = opt.multi_clip_buffer
+        self._CLIP_SHUFFLE_WINDOW = opt.clip_shuffle_window
+
+        # the tar shards of this fold from pack_shards.py, for the shard dataset.
+        self._SHARD_PATH = os.path.join(opt.shard_path, os.path.basename(os.path.normpath(self._TRAIN_PATH_A))) if opt.shard_path else None
+
+        # the pre-cropped frame store from export_frame_store.py, shared by all the folds.
+        self._FRAME_STORE_PATH = opt.frame_store_path
+        self.frame_store = None
+
+        if self._DATASET_TYPE == "frame_store" and self._FRAME_STORE_PATH is None:
+            raise ValueError("the frame_store dataset needs the --frame_store_path, export it with export_frame_store.py")
+
+        # the full recordings with the cached boxes, split the walk direction on the fly. the fold persons are from the split json.
+        self._RECORDING_PATH = opt.recording_path
+        self._SPLIT_JSON = opt.split_json
+
+        # the per-stage timing of the data pipeline, saved with the logs of the fold. None to keep the pipeline unwrapped.
+        if opt.profile_data:
+            self.profiler = PipelineProfiler(os.path.join(opt.log_path, opt.model, opt.log_version, opt.fold, "data_profile"))
+        else:
+            self.profiler = None
+
+        # the transform at the target img_size and frame number, the val clips always use it.
+        self.train_transform = self._make_transform(self._IMG_SIZE, self.uniform_temporal_subsample_num)
+
+        # start the train with the small clips, and grow to the target in the progressive epochs.
+        if opt.progressive_epochs > 0:
+            if self._CLIP_CACHE_DIR or self._SHARED_CACHE_GB > 0:
+                raise ValueError("the clip cache keep the clips at the target size, not work with the progressive schedule")
+
+            self.progressive_schedule = ProgressiveSchedule(
+                opt.progressive_epochs,
+                opt.progressive_img_size,
+                opt.progressive_frames,
+                self._IMG_SIZE,
+                self.uniform_temporal_subsample_num,
+            )
+            self.progressive_transform = ProgressiveTransform(self.train_transform)
+            self._progressive_stage = (self._IMG_SIZE, self.uniform_temporal_subsample_num)
+        else:
+            self.progressive_schedule = None
+            self.progressive_transform = None
+
+    def _make_transform(self, img_size: int, num_samples: int) -> Compose:
+        """
+        the paired clip transform, subsample and resize the two views.
+
+        Args:
+            img_size (int): the output img size.
+            num_samples (int): the output frame number.
+
+        Returns:
+            Compose: the transform of the paired clip.
+        """
+
+        video_transform = Compose(
+            profile_transforms(
+                [
+                    UniformTemporalSubsample(
+                        num_samples
                     ),
-                ),
+                    Resize(size=[img_size, img_size]),
+                    # keep uint8 to the device, the Div255 and Normalize are in the on_after_batch_transfer of the model.
+                    Lambda(to_uint8),
+                ],
+                self.profiler,
+            )
+        )
+
+        # the same transform for the two views.
+        return Compose(
+            [
+                ApplyTransformToKey(key="ap", transform=video_transform),
+                ApplyTransformToKey(key="lat", transform=video_transform),
             ]
         )
 
@@ -161,133 +356,261 @@ class WalkDataModule(LightningDataModule):
             stage (Optional[str], optional): trainer.stage, in ('fit', 'validate', 'test', 'predict'). Defaults to None.
         """
         
-        data_path_a = self._TRAIN_PATH_A
-        data_path_b = self._TRAIN_PATH_B
         transform = self.train_transform
 
+        if self._CLIP_CACHE_DIR:
+            clip_cache = ClipCache(
+                self._CLIP_CACHE_DIR,
+                self._CLIP_DURATION,
+                self.uniform_temporal_subsample_num,
+                self._IMG_SIZE,
+                decoder=self._DECODER,
+                decode_resize=self._DECODE_RESIZE,
+            )
+        else:
+            clip_cache = None
+
+        # the shared-memory cache over the on-disk cache, made once in this process and reused by the next fold.
+        if self._SHARED_CACHE_GB > 0:
+            clip_cache = get_shared_clip_cache(
+                int(self._SHARED_CACHE_GB * 2 ** 30),
+                self._CLIP_DURATION,
+                self.uniform_temporal_subsample_num,
+                self._IMG_SIZE,
+                backing=clip_cache,
+                decoder=self._DECODER,
+                decode_resize=self._DECODE_RESIZE,
+            )
+        self.clip_cache = clip_cache
+
+        # with the sparse decoder, the UniformTemporalSubsample in transform keep all the decoded frames.
+        decoder = make_decoder(
+            self._DECODER,
+            num_samples=self.uniform_temporal_subsample_num,
+            target_size=(self._IMG_SIZE, self._IMG_SIZE) if self._DECODE_RESIZE else None,
+        )
+
+        if self.profiler is not None:
+            decoder = ProfiledDecoder(decoder, self.profiler)
+
+        manifest = VideoManifest(self._MANIFEST_PATH) if self._MANIFEST_PATH else None
+
+        if self._DATASET_TYPE == "frame_store" and self.frame_store is None:
+            self.frame_store = FrameStore(self._FRAME_STORE_PATH)
+
         # if stage == "f it" or stage == None:
         if stage in ("fit", None):
-            self.train_dataset_a = WalkDataset(
-                data_path=os.path.join(data_path_a, "train"),
-                clip_sampler=make_clip_sampler("uniform", self._CLIP_DURATION),
+            train_transform = self.progressive_transform if self.progressive_transform is not None else transform
+            self.train_dataset = self._make_dataset("train", train_transform, decoder, clip_cache, manifest)
+
+        if stage in ("fit", "validate", "predict", "test", None):
+            self.val_dataset = self._make_dataset("val", transform, decoder, clip_cache, manifest)
+
+    def teardown(self, stage: Optional[str] = None) -> None:
+        if self._SHARED_CACHE_GB > 0 and self.clip_cache is not None:
+            print("shared clip cache after %s: %s" % (stage, self.clip_cache.stats()))
+
+        if self.profiler is not None:
+            self.profiler.report()
+
+        # once for every dataloader, the stats are summed over the epochs.
+        for name, prefetcher in self._prefetchers.items():
+            prefetcher.report(name)
+        self._prefetchers = {}
+
+    def _make_dataset(
+        self,
+        split: str,
+        transform: Callable[[Dict[str, Any]], Dict[str, Any]],
+        decoder: VideoDecoder,
+        clip_cache: Optional[ClipCache],
+        manifest: Optional[VideoManifest],
+    ) -> torch.utils.data.Dataset:
+        """
+        make the paired dataset of the split, with the dataset type.
+
+        Args:
+            split (str): the split folder, in ('train', 'val').
+            transform (Callable[[Dict[str, Any]], Dict[str, Any]]): the transform for the paired clip.
+            decoder (VideoDecoder): the video decoder.
+            clip_cache (Optional[ClipCache]): the on-disk clip cache.
+            manifest (Optional[VideoManifest]): the cached video manifest.
+
+        Returns:
+            torch.utils.data.Dataset: the map-style or iterable paired dataset.
+        """
+
+        if self._DATASET_TYPE == "shard":
+            # stream the shards with the sequential read, the clip cache is not used.
+            return WalkShardDataset(
+                shard_paths=read_shard_paths(os.path.join(self._SHARD_PATH, split)),
+                clip_duration=self._CLIP_DURATION,
                 transform=transform,
-                video_sampler=torch.utils.data.SequentialSampler,
+                decoder=decoder,
+                shuffle_shards=split == "train",
+                shuffle_window=self._CLIP_SHUFFLE_WINDOW if split == "train" else 0,
             )
 
-            self.train_dataset_b = WalkDataset(
-                data_path=os.path.join(data_path_b, "train"),
-                clip_sampler=make_clip_sampler("uniform", self._CLIP_DURATION),
+        if self._DATASET_TYPE == "frame_store":
+            # slice the subsampled frames from the store, the UniformTemporalSubsample in transform keep all the frames.
+            return WalkFrameStoreDataset(
+                paired_video_paths=_get_paired_video_paths(
+                    os.path.join(self._TRAIN_PATH_A, split),
+                    os.path.join(self._TRAIN_PATH_B, split),
+                    decoder,
+                    manifest,
+                ),
+                frame_store=self.frame_store,
+                clip_duration=self._CLIP_DURATION,
+                num_samples=self.uniform_temporal_subsample_num,
                 transform=transform,
-                video_sampler=torch.utils.data.SequentialSampler,
             )
 
-        if stage in ("fit", "validate", "predict", "test", None):
-            self.val_dataset_a = WalkDataset(
-                data_path=os.path.join(data_path_a, "val"),
-                clip_sampler=make_clip_sampler("uniform", self._CLIP_DURATION),
+        if self._DATASET_TYPE == "recording":
+            # the recordings are cropped to img_size in the dataset, the Resize in transform keep the size.
+            fold = os.path.basename(os.path.normpath(self._TRAIN_PATH_A))
+            persons = load_split_persons(self._SPLIT_JSON, fold, split) if self._SPLIT_JSON else None
+
+            return WalkRecordingDataset(
+                recordings=make_recordings(self._RECORDING_PATH, persons),
+                clip_duration=self._CLIP_DURATION,
+                num_samples=self.uniform_temporal_subsample_num,
+                img_size=self._IMG_SIZE,
                 transform=transform,
-                video_sampler=torch.utils.data.SequentialSampler,
+                video_sampler=torch.utils.data.RandomSampler if split == "train" else torch.utils.data.SequentialSampler,
+                shuffle_window=self._CLIP_SHUFFLE_WINDOW if split == "train" else 0,
             )
 
-            self.val_dataset_b = WalkDataset(
-                data_path=os.path.join(data_path_b, "val"),
-                clip_sampler=make_clip_sampler("uniform", self._CLIP_DURATION),
+        if self._DATASET_TYPE == "clip_index":
+            return WalkClipIndexDataset(
+                data_path_ap=os.path.join(self._TRAIN_PATH_A, split),
+                data_path_lat=os.path.join(self._TRAIN_PATH_B, split),
+                clip_duration=self._CLIP_DURATION,
                 transform=transform,
-                video_sampler=torch.utils.data.SequentialSampler,
+                decoder=decoder,
+                clip_cache=clip_cache,
+                manifest=manifest,
             )
 
-    def train_dataloader(self) -> DataLoader:
+        return WalkDataset(
+            data_path_ap=os.path.join(self._TRAIN_PATH_A, split),
+            data_path_lat=os.path.join(self._TRAIN_PATH_B, split),
+            clip_sampler=make_clip_sampler("uniform", self._CLIP_DURATION),
+            transform=transform,
+            video_sampler=torch.utils.data.SequentialSampler,
+            clip_cache=clip_cache,
+            decoder=decoder,
+            manifest=manifest,
+            multi_clip_buffer=self._MULTI_CLIP_BUFFER,
+            # keep the val clips in order.
+            shuffle_window=self._CLIP_SHUFFLE_WINDOW if split == "train" else 0,
+        )
+
+    def _make_dataloader(
+        self,
+        dataset: torch.utils.data.Dataset,
+        shuffle: bool = False,
+        collate_fn: Optional[Callable[[List[Dict[str, Any]]], Dict[str, Any]]] = None,
+        sampler: Optional[torch.utils.data.Sampler] = None,
+        name: str = "val",
+    ) -> Union[DataLoader, AsyncBatchPrefetcher]:
         """
-        create the Walk train partition from the list of video labels
-        in directory and subdirectory. Add transform that subsamples and
-        normalizes the video before applying the scale, crop and flip augmentations.
+        one dataloader for the paired dataset, the ap and lat clips are in the same batch.
+
+        Args:
+            dataset (torch.utils.data.Dataset): the paired dataset.
+            shuffle (bool, optional): shuffle the clips, only for the map-style dataset. Defaults to False.
+            collate_fn (Optional[Callable[[List[Dict[str, Any]]], Dict[str, Any]]], optional): the batch collate, None for the default collate. Defaults to None.
+            sampler (Optional[torch.utils.data.Sampler], optional): the sampler of the map-style dataset, replace the shuffle. Defaults to None.
+            name (str, optional): the dataloader name, the prefetch stats of the same name are summed. Defaults to "val".
+
+        Returns:
+            Union[DataLoader, AsyncBatchPrefetcher]: the dataloader of the dataset, wrapped by the prefetcher when async_prefetch > 0.
         """
-        loader_a = DataLoader(
-            self.train_dataset_a,
-            batch_size=self._BATCH_SIZE,
-            num_workers=self._NUM_WORKERS,
-            shuffle=False,
-        )
+        # the prefetch and persistent workers only work with the worker processes.
+        use_workers = self._NUM_WORKERS > 0
 
-        loader_b = DataLoader(
-            self.train_dataset_b,
+        if self.profiler is not None:
+            collate_fn = ProfiledCollate(self.profiler, collate_fn)
+
+        dataloader = DataLoader(
+            dataset,
             batch_size=self._BATCH_SIZE,
             num_workers=self._NUM_WORKERS,
-            shuffle=False,
+            shuffle=shuffle and sampler is None and not isinstance(dataset, torch.utils.data.IterableDataset),
+            sampler=sampler,
+            prefetch_factor=self._PREFETCH_FACTOR if use_workers else None,
+            persistent_workers=self._PERSISTENT_WORKERS and use_workers,
+            pin_memory=self._PIN_MEMORY,
+            collate_fn=collate_fn,
         )
-        loaders = {"a": loader_a, "b": loader_b}
-        combined_loader = CombinedLoader(loaders, mode="max_size_cycle")
 
-        return combined_loader
+        if self.profiler is not None:
+            dataloader = ProfiledDataLoader(dataloader, self.profiler)
 
-    def val_dataloader(self) -> DataLoader:
+        if self._ASYNC_PREFETCH > 0:
+            # the batch is on the device before the Trainer transfer, which becomes a no-op.
+            device = self.trainer.strategy.root_device if self.trainer is not None else torch.device("cpu")
+            last_prefetcher = self._prefetchers.get(name)
+            dataloader = AsyncBatchPrefetcher(
+                dataloader, device, num_prefetch=self._ASYNC_PREFETCH, stats=last_prefetcher.stats if last_prefetcher is not None else None,
+            )
+            self._prefetchers[name] = dataloader
+
+        return dataloader
+
+    def train_dataloader(self) -> Union[DataLoader, AsyncBatchPrefetcher]:
         """
         create the Walk train partition from the list of video labels
         in directory and subdirectory. Add transform that subsamples and
         normalizes the video before applying the scale, crop and flip augmentations.
         """
-        loader_a = DataLoader(
-            self.train_dataset_a,
-            batch_size=self._BATCH_SIZE,
-            num_workers=self._NUM_WORKERS,
-            shuffle=False,
-        )
+        if self.progressive_schedule is not None:
+            self._set_progressive_stage(self.trainer.current_epoch if self.trainer is not None else 0)
 
-        loader_b = DataLoader(
-            self.train_dataset_b,
-            batch_size=self._BATCH_SIZE,
-            num_workers=self._NUM_WORKERS,
-            shuffle=False,
-        )
-        loaders = {"a": loader_a, "b": loader_b}
-        combined_loader = CombinedLoader(loaders, mode="max_size_cycle")
+        if self._BALANCE_SAMPLER != "none":
+            sampler = BalancedClipSampler(self.train_dataset.clip_index, self._BALANCE_SAMPLER)
+        else:
+            sampler = None
 
-        return combined_loader
+        return self._make_dataloader(self.train_dataset, shuffle=True, collate_fn=self.train_collate, sampler=sampler, name="train")
 
-    def test_dataloader(self) -> DataLoader:
+    def _set_progressive_stage(self, epoch: int) -> None:
         """
-        create the Walk train partition from the list of video labels
-        in directory and subdirectory. Add transform that subsamples and
-        normalizes the video before applying the scale, crop and flip augmentations.
+        set the train transform of the epoch, the Trainer reload the train dataloader every epoch with the progressive schedule.
+
+        Args:
+            epoch (int): the current epoch.
         """
-        loader_a = DataLoader(
-            self.train_dataset_a,
-            batch_size=self._BATCH_SIZE,
-            num_workers=self._NUM_WORKERS,
-            shuffle=False,
-        )
 
-        loader_b = DataLoader(
-            self.train_dataset_b,
-            batch_size=self._BATCH_SIZE,
-            num_workers=self._NUM_WORKERS,
-            shuffle=False,
-        )
-        loaders = {"a": loader_a, "b": loader_b}
-        combined_loader = CombinedLoader(loaders, mode="max_size_cycle")
+        stage = self.progressive_schedule.at(epoch)
+
+        if stage != self._progressive_stage:
+            self.progressive_transform.transform = self._make_transform(*stage)
+            self._progressive_stage = stage
 
-        return combined_loader
+            print("progressive schedule epoch %d: img_size %d, frames %d" % (epoch, *stage))
 
-    def predict_dataloader(self) -> DataLoader:
+    def val_dataloader(self) -> Union[DataLoader, AsyncBatchPrefetcher]:
         """
-        create the Walk pred partition from the list of video labels
+        create the Walk val partition from the list of video labels
         in directory and subdirectory. Add transform that subsamples and
         normalizes the video before applying the scale, crop and flip augmentations.
         """
-        loader_a = DataLoader(
-            self.train_dataset_a,
-            batch_size=self._BATCH_SIZE,
-            num_workers=self._NUM_WORKERS,
-            shuffle=False,
-        )
+        return self._make_dataloader(self.val_dataset, name="val")
 
-        loader_b = DataLoader(
-            self.train_dataset_b,
-            batch_size=self._BATCH_SIZE,
-            num_workers=self._NUM_WORKERS,
-            shuffle=False,
-        )
-        loaders = {"a": loader_a, "b": loader_b}
-        combined_loader = CombinedLoader(loaders, mode="max_size_cycle")
+    def test_dataloader(self) -> Union[DataLoader, AsyncBatchPrefetcher]:
+        """
+        create the Walk test partition from the list of video labels
+        in directory and subdirectory. Add transform that subsamples and
+        normalizes the video before applying the scale, crop and flip augmentations.
+        """
+        return self._make_dataloader(self.val_dataset, name="test")
 
-        return combined_loader
+    def predict_dataloader(self) -> Union[DataLoader, AsyncBatchPrefetcher]:
+        """
+        create the Walk pred partition from the list of video labels
+        in directory and subdirectory. Add transform that subsamples and
+        normalizes the video before applying the scale, crop and flip augmentations.
+        """
+        return self._make_dataloader(self.val_dataset, name="predict")
@@ -0,0 +1,736 @@
+"""
+video decoders for the walk dataset.
+
+The decoder open a video file, and return a video object like the pytorchvideo EncodedVideo,
+which has the duration, get_clip(start_sec, end_sec) and close().
+The clip video tensor is c, t, h, w, same as the EncodedVideo, but keep the uint8 pixel value.
+
+When the target_size is given, the frames are scaled by the ffmpeg scaler (swscale) during decode,
+so the full size frame tensors are never made. The scaled frames match the torchvision Resize (bilinear, antialias)
+within DECODE_RESIZE_TOLERANCE, see check_decode_resize.
+
+The backends in DECODERS:
+    pyav: the pyav video, which decode all the frames in the clip, scaled with the target_size.
+    pyav_threaded: same as pyav, but the ffmpeg frame/slice threads are enabled.
+    pyav_sparse: only decode the subsampled frames of the clip.
+    torchvision: torchvision.io.read_video.
+    decord: decord.VideoReader, only when the decord is installed.
+    opencv: cv2.VideoCapture.
+Use benchmark_decoder.py to compare the backends on the dataset.
+"""
+
+import bisect
+import io
+import logging
+import math
+from fractions import Fraction
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Type, Union
+
+import av
+import cv2
+import numpy as np
+import torch
+import torchvision
+from torchvision.transforms.v2 import functional as F
+
+try:
+    import decord
+except ImportError:
+    decord = None
+
+logger = logging.getLogger(__name__)
+
+# the swscale bilinear filter is the closest to the antialias bilinear resize for the downscale,
+# the mean absolute error to 224 px (check_decode_resize): bilinear 1.27 / 2.22, area 1.62 / 3.07, gauss 1.52 / 2.65, bicubic 1.99 / 3.19
+# for the 512x512 segment / the 1920x1080 full frame.
+DECODE_RESIZE_INTERPOLATION = "BILINEAR"
+
+# the max mean absolute error with the torchvision Resize, in [0, 255] pixel value.
+# measured with the bilinear filter on 1 s h264 clips (yuv420p, crf 23) of the natural images with the camera pan:
+#   512x512 segment: 1.27 to 224 px, 1.76 to 112 px.
+#   1920x1080 full frame: 2.22 to 224 px, 3.02 to 112 px.
+# the tolerance is for the default 224 px, the smaller img_size (like the progressive 112 px) have the larger error.
+DECODE_RESIZE_TOLERANCE = 2.5
+
+
+class VideoDecoder:
+    """
+    the decoder interface, one decoder instance is shared by all the videos of the dataset.
+    """
+
+    def __init__(self, num_samples: Optional[int] = None, target_size: Optional[Tuple[int, int]] = None) -> None:
+        """
+        Args:
+            num_samples (Optional[int], optional): the frame number of one clip after the uniform temporal subsample. Defaults to None.
+            target_size (Optional[Tuple[int, int]], optional): the (h, w) to scale the frames during decode, None keep the original size. Defaults to None.
+        """
+        self.num_samples = num_samples
+        self.target_size = target_size
+
+        # the probed video info from the manifest, {file_path: info}
+        self.video_info: Dict[str, Dict[str, Any]] = {}
+
+    def add_video_info(self, video_info: Dict[str, Dict[str, Any]]) -> None:
+        """
+        add the probed video info from the manifest, then the decoder can skip the probe when open the video.
+
+        Args:
+            video_info (Dict[str, Dict[str, Any]]): {file_path: info}, see manifest.probe_video.
+        """
+        self.video_info.update(video_info)
+
+    def open(self, file_path: str):
+        """
+        open the video file.
+
+        Args:
+            file_path (str): the video file path.
+
+        Returns:
+            the video object with duration, get_clip and close.
+        """
+        raise NotImplementedError
+
+    def open_bytes(self, data: bytes, name: str):
+        """
+        open the video from the encoded bytes in memory, e.g. the member of the tar shard.
+
+        Args:
+            data (bytes): the encoded video file.
+            name (str): the unique video name, for the log and the per video index.
+
+        Returns:
+            the video object with duration, get_clip and close.
+        """
+        raise NotImplementedError(f"{type(self).__name__} can not decode the video in memory, use pyav, pyav_threaded, pyav_sparse or decord.")
+
+
+class PyAVDecoder(VideoDecoder):
+    """
+    decode all the frames in the clip duration, the uniform temporal subsample is done in the transform.
+    Without the target_size, the frames keep the original size, the clip is uint8 same as the other decoders.
+    """
+
+    def open(self, file_path: str) -> "ScaledEncodedVideoPyAV":
+        return ScaledEncodedVideoPyAV(file_path, self.target_size)
+
+    def open_bytes(self, data: bytes, name: str) -> "ScaledEncodedVideoPyAV":
+        return ScaledEncodedVideoPyAV(io.BytesIO(data), self.target_size, name=name)
+
+
+class PyAVThreadedDecoder(VideoDecoder):
+    """
+    decode all the frames in the clip duration, with the ffmpeg threads of the codec.
+    The mp4v (mpeg4 part 2) decoder support the frame threads, so one clip is decoded by more than one core.
+    Notice that, with many dataloader workers, the threads of all the workers may be more than the cores.
+    """
+
+    def __init__(self, num_samples: Optional[int] = None, target_size: Optional[Tuple[int, int]] = None, thread_type: str = "AUTO") -> None:
+        super().__init__(num_samples, target_size)
+        self._thread_type = thread_type
+
+    def open(self, file_path: str) -> "ScaledEncodedVideoPyAV":
+        return ScaledEncodedVideoPyAV(file_path, self.target_size, thread_type=self._thread_type)
+
+    def open_bytes(self, data: bytes, name: str) -> "ScaledEncodedVideoPyAV":
+        return ScaledEncodedVideoPyAV(io.BytesIO(data), self.target_size, thread_type=self._thread_type, name=name)
+
+
+class TorchvisionDecoder(VideoDecoder):
+    """
+    decode the clip with torchvision.io.read_video, which open the file for every clip.
+    The frames are resized after decode when the target_size is given.
+    """
+
+    def open(self, file_path: str) -> "TorchvisionVideo":
+        return TorchvisionVideo(file_path, self.video_info.get(file_path), self.target_size)
+
+
+class DecordDecoder(VideoDecoder):
+    """
+    decode the clip with decord.VideoReader, the frames are scaled by decord when the target_size is given.
+    """
+
+    def __init__(self, num_samples: Optional[int] = None, target_size: Optional[Tuple[int, int]] = None, num_threads: int = 1) -> None:
+        if decord is None:
+            raise ImportError("the decord decoder need the decord package, pip install decord.")
+
+        super().__init__(num_samples, target_size)
+        self._num_threads = num_threads
+
+    def open(self, file_path: str) -> "DecordVideo":
+        return DecordVideo(file_path, self.target_size, self._num_threads)
+
+    def open_bytes(self, data: bytes, name: str) -> "DecordVideo":
+        return DecordVideo(io.BytesIO(data), self.target_size, self._num_threads, name=name)
+
+
+class OpenCVDecoder(VideoDecoder):
+    """
+    decode the clip with cv2.VideoCapture, the frames are resized by cv2.INTER_AREA when the target_size is given.
+    """
+
+    def open(self, file_path: str) -> "OpenCVVideo":
+        return OpenCVVideo(file_path, self.target_size)
+
+
+class PyAVSparseDecoder(VideoDecoder):
+    """
+    only decode the subsampled frames of the clip.
+    The target frames are computed from the clip time first, then the decoder seek to the keyframe before the target,
+    and decode until the target frame. When the next target is in the same GOP, continue to decode without seek.
+    """
+
+    def __init__(self, num_samples: Optional[int] = None, target_size: Optional[Tuple[int, int]] = None) -> None:
+        if num_samples is None:
+            raise ValueError("the sparse decoder need the num_samples of one clip.")
+
+        super().__init__(num_samples, target_size)
+
+        # the keyframe index of the opened videos, keep in the worker process.
+        self._keyframe_index: Dict[str, List[int]] = {}
+
+    def open(self, file_path: str) -> "SparseEncodedVideoPyAV":
+        # the keyframes from the manifest, skip the demux.
+        if file_path not in self._keyframe_index and file_path in self.video_info:
+            self._keyframe_index[file_path] = self.video_info[file_path]["keyframes"]
+
+        return SparseEncodedVideoPyAV(file_path, self.num_samples, self._keyframe_index, self.target_size)
+
+    def open_bytes(self, data: bytes, name: str) -> "SparseEncodedVideoPyAV":
+        return SparseEncodedVideoPyAV(io.BytesIO(data), self.num_samples, self._keyframe_index, self.target_size, name=name)
+
+
+class _PyAVVideo:
+    """
+    the base pyav video, open the container and read the stream info.
+    """
+
+    def __init__(
+        self,
+        file_path: Union[str, BinaryIO],
+        target_size: Optional[Tuple[int, int]] = None,
+        thread_type: Optional[str] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        """
+        Args:
+            file_path (Union[str, BinaryIO]): the video file path, or the file object of the video in memory.
+            target_size (Optional[Tuple[int, int]], optional): the (h, w) to scale the frames during decode. Defaults to None.
+            thread_type (Optional[str], optional): the codec thread type, "AUTO", "FRAME" or "SLICE". None to decode in one thread. Defaults to None.
+            name (Optional[str], optional): the video name, necessary for the file object. Defaults to the file path.
+        """
+
+        self._file_path = name or file_path
+        self._target_size = target_size
+
+        self._container = av.open(file_path)
+        self._stream = self._container.streams.video[0]
+
+        if thread_type is not None:
+            self._stream.thread_type = thread_type
+
+        self._time_base = self._stream.time_base
+        self._start_pts = self._stream.start_time or 0
+        self._fps = float(self._stream.average_rate or self._stream.guessed_rate)
+
+        if self._stream.duration is not None:
+            self._duration = Fraction(self._stream.duration * self._time_base)
+        else:
+            self._duration = Fraction(self._container.duration, av.time_base)
+
+    @property
+    def name(self) -> str:
+        return self._file_path
+
+    @property
+    def duration(self) -> Fraction:
+        return self._duration
+
+    @property
+    def fps(self) -> float:
+        return self._fps
+
+    def _secs_to_pts(self, sec: float) -> int:
+        return self._start_pts + math.ceil(sec / self._time_base)
+
+    def _frame_to_array(self, frame: av.VideoFrame) -> np.ndarray:
+        """
+        convert the frame to rgb array, scaled by swscale when the target_size is given.
+
+        Args:
+            frame (av.VideoFrame): the decoded frame.
+
+        Returns:
+            np.ndarray: h, w, c uint8 array.
+        """
+
+        if self._target_size is None:
+            return frame.to_ndarray(format="rgb24")
+
+        height, width = self._target_size
+
+        return frame.to_ndarray(format="rgb24", width=width, height=height, interpolation=DECODE_RESIZE_INTERPOLATION)
+
+    @staticmethod
+    def _to_video(frames: List[np.ndarray]) -> Dict[str, Optional[torch.Tensor]]:
+        if len(frames) == 0:
+            return {"video": None, "audio": None}
+
+        video = torch.from_numpy(np.stack(frames)).permute(3, 0, 1, 2) # t, h, w, c > c, t, h, w
+
+        return {"video": video, "audio": None}
+
+    def close(self) -> None:
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+
+class ScaledEncodedVideoPyAV(_PyAVVideo):
+    """
+    the pyav video, which decode all the frames in the clip and scale them during decode.
+    """
+
+    def get_clip(self, start_sec: float, end_sec: float) -> Dict[str, Optional[torch.Tensor]]:
+        """
+        decode the frames in [start_sec, end_sec).
+
+        Args:
+            start_sec (float): the clip start time.
+            end_sec (float): the clip end time.
+
+        Returns:
+            Dict[str, Optional[torch.Tensor]]: the video tensor, c, t, h, w, uint8. None when decode failed.
+        """
+
+        start_pts = self._secs_to_pts(start_sec)
+        end_pts = self._secs_to_pts(end_sec)
+
+        frames = []
+
+        try:
+            self._container.seek(start_pts, stream=self._stream, backward=True, any_frame=False)
+
+            for frame in self._container.decode(self._stream):
+                if frame.pts is None or frame.pts < start_pts:
+                    continue
+                if frame.pts >= end_pts:
+                    break
+
+                frames.append(self._frame_to_array(frame))
+
+        except av.error.FFmpegError as e:
+            logger.debug("Failed to decode video with pyav scaled decoder: %s. %s", self._file_path, e)
+            return {"video": None, "audio": None}
+
+        return self._to_video(frames)
+
+
+class SparseEncodedVideoPyAV(_PyAVVideo):
+    """
+    the pyav video, which only decode the frames selected by the uniform temporal subsample.
+    """
+
+    def __init__(
+        self,
+        file_path: Union[str, BinaryIO],
+        num_samples: int,
+        keyframe_index: Dict[str, List[int]],
+        target_size: Optional[Tuple[int, int]] = None,
+        name: Optional[str] = None,
+    ) -> None:
+        """
+        Args:
+            file_path (Union[str, BinaryIO]): the video file path, or the file object of the video in memory.
+            num_samples (int): the frame number of one clip.
+            keyframe_index (Dict[str, List[int]]): the shared keyframe pts index, key is the video name.
+            target_size (Optional[Tuple[int, int]], optional): the (h, w) to scale the frames during decode. Defaults to None.
+            name (Optional[str], optional): the video name, necessary for the file object. Defaults to the file path.
+        """
+
+        super().__init__(file_path, target_size, name=name)
+
+        self._num_samples = num_samples
+
+        if self._file_path not in keyframe_index:
+            keyframe_index[self._file_path] = self._read_keyframe_pts()
+        self._keyframe_pts = keyframe_index[self._file_path]
+
+    def _read_keyframe_pts(self) -> List[int]:
+        """
+        demux the packets without decode, to get the keyframe pts.
+
+        Returns:
+            List[int]: the sorted keyframe pts.
+        """
+
+        keyframe_pts = [
+            packet.pts
+            for packet in self._container.demux(self._stream)
+            if packet.pts is not None and packet.is_keyframe
+        ]
+        self._container.seek(self._start_pts, stream=self._stream, backward=True, any_frame=False)
+
+        return sorted(keyframe_pts)
+
+    def _target_pts(self, start_sec: float, end_sec: float) -> List[int]:
+        """
+        the pts of the frames selected by the uniform temporal subsample in [start_sec, end_sec).
+
+        Args:
+            start_sec (float): the clip start time.
+            end_sec (float): the clip end time.
+
+        Returns:
+            List[int]: the target frame pts, sorted.
+        """
+
+        end_sec = min(end_sec, self._duration)
+        first_frame = math.ceil(start_sec * self._fps)
+        last_frame = max(math.ceil(end_sec * self._fps) - 1, first_frame)
+
+        # same as the uniform_temporal_subsample, torch.linspace then long.
+        frame_indices = first_frame + torch.linspace(0, last_frame - first_frame, self._num_samples).long()
+
+        return [
+            self._start_pts + int(round(frame_index / self._fps / self._time_base))
+            for frame_index in frame_indices.tolist()
+        ]
+
+    def _need_seek(self, current_pts: Optional[int], target_pts: int) -> bool:
+        """
+        seek when the target is before the current decode position, or the target is in a later GOP.
+
+        Args:
+            current_pts (Optional[int]): the pts of the last decoded frame, None when not decoded.
+            target_pts (int): the next target pts.
+
+        Returns:
+            bool: if need to seek.
+        """
+
+        if current_pts is None or target_pts < current_pts:
+            return True
+
+        keyframe_i = bisect.bisect_right(self._keyframe_pts, target_pts) - 1
+
+        return keyframe_i >= 0 and self._keyframe_pts[keyframe_i] > current_pts
+
+    def get_clip(self, start_sec: float, end_sec: float) -> Dict[str, Optional[torch.Tensor]]:
+        """
+        decode the subsampled frames in [start_sec, end_sec).
+
+        Args:
+            start_sec (float): the clip start time.
+            end_sec (float): the clip end time.
+
+        Returns:
+            Dict[str, Optional[torch.Tensor]]: the video tensor, c, t, h, w, uint8. None when decode failed.
+        """
+
+        frames = []
+        frame_iter = None
+        last_frame = None
+        last_array = None
+
+        try:
+            for target_pts in self._target_pts(start_sec, end_sec):
+
+                # the same frame is selected more than once, when the num_samples > frame number.
+                if last_frame is not None and last_frame.pts is not None and last_frame.pts >= target_pts:
+                    frames.append(last_array)
+                    continue
+
+                if frame_iter is None or self._need_seek(None if last_frame is None else last_frame.pts, target_pts):
+                    self._container.seek(target_pts, stream=self._stream, backward=True, any_frame=False)
+                    frame_iter = self._container.decode(self._stream)
+
+                for frame in frame_iter:
+                    last_frame = frame
+                    if frame.pts is not None and frame.pts >= target_pts:
+                        break
+
+                if last_frame is None:
+                    break
+
+                # at the end of the video, keep the last frame.
+                last_array = self._frame_to_array(last_frame)
+                frames.append(last_array)
+
+        except av.error.FFmpegError as e:
+            logger.debug("Failed to decode video with pyav sparse decoder: %s. %s", self._file_path, e)
+            return {"video": None, "audio": None}
+
+        return self._to_video(frames)
+
+
+class _FrameIndexVideo:
+    """
+    the base video of the frame index based backends (torchvision, decord, opencv).
+    The clip [start_sec, end_sec) is converted to the frame index range by the fps, same as the pyav pts range.
+    """
+
+    _file_path: str
+    _fps: float
+    _frame_count: int
+
+    @property
+    def name(self) -> str:
+        return self._file_path
+
+    @property
+    def duration(self) -> Fraction:
+        return Fraction(self._frame_count) / Fraction(self._fps).limit_denominator()
+
+    def _frame_range(self, start_sec: float, end_sec: float) -> Tuple[int, int]:
+        """
+        Returns:
+            Tuple[int, int]: the [first, last) frame index of the clip, in the video.
+        """
+
+        first = min(math.ceil(start_sec * self._fps), self._frame_count)
+        last = min(math.ceil(end_sec * self._fps), self._frame_count)
+
+        return first, max(last, first)
+
+    def _resize(self, video: torch.Tensor) -> torch.Tensor:
+        """
+        resize the t, h, w, c uint8 frames to the target_size, after decode.
+        """
+
+        if self._target_size is None or tuple(video.shape[1:3]) == tuple(self._target_size):
+            return video
+
+        video = F.resize(video.permute(0, 3, 1, 2), list(self._target_size), antialias=True) # t, h, w, c > t, c, h, w
+
+        return video.permute(0, 2, 3, 1)
+
+    @staticmethod
+    def _to_video(video: Optional[torch.Tensor]) -> Dict[str, Optional[torch.Tensor]]:
+        if video is None or video.shape[0] == 0:
+            return {"video": None, "audio": None}
+
+        return {"video": video.permute(3, 0, 1, 2), "audio": None} # t, h, w, c > c, t, h, w
+
+
+class TorchvisionVideo(_FrameIndexVideo):
+    """
+    the torchvision.io video, the fps and frame count are from the manifest info or the pyav container header.
+    """
+
+    def __init__(self, file_path: str, video_info: Optional[Dict[str, Any]] = None, target_size: Optional[Tuple[int, int]] = None) -> None:
+        self._file_path = file_path
+        self._target_size = target_size
+
+        if video_info is None:
+            with av.open(file_path) as container:
+                stream = container.streams.video[0]
+                fps = float(stream.average_rate or stream.guessed_rate)
+
+                if stream.frames:
+                    frame_count = stream.frames
+                else:
+                    frame_count = int(container.duration / av.time_base * fps)
+
+            video_info = {"fps": fps, "frame_count": frame_count}
+
+        self._fps = video_info["fps"]
+        self._frame_count = video_info["frame_count"]
+
+    def get_clip(self, start_sec: float, end_sec: float) -> Dict[str, Optional[torch.Tensor]]:
+        first, last = self._frame_range(start_sec, end_sec)
+
+        if last <= first:
+            return {"video": None, "audio": None}
+
+        # read_video include the end pts, so stop half frame before the next clip.
+        try:
+            video, _, _ = torchvision.io.read_video(
+                self._file_path,
+                start_pts=first / self._fps,
+                end_pts=(last - 0.5) / self._fps,
+                pts_unit="sec",
+                output_format="THWC",
+            )
+        except (RuntimeError, av.error.FFmpegError) as e:
+            logger.debug("Failed to decode video with torchvision: %s. %s", self._file_path, e)
+            return {"video": None, "audio": None}
+
+        return self._to_video(self._resize(video))
+
+    def close(self) -> None:
+        pass
+
+
+class DecordVideo(_FrameIndexVideo):
+    """
+    the decord video, decode the frames of the clip with get_batch.
+    """
+
+    def __init__(
+        self,
+        file_path: Union[str, BinaryIO],
+        target_size: Optional[Tuple[int, int]] = None,
+        num_threads: int = 1,
+        name: Optional[str] = None,
+    ) -> None:
+        self._file_path = name or file_path
+        self._target_size = target_size
+
+        if target_size is None:
+            self._reader = decord.VideoReader(file_path, ctx=decord.cpu(0), num_threads=num_threads)
+        else:
+            height, width = target_size
+            self._reader = decord.VideoReader(file_path, ctx=decord.cpu(0), width=width, height=height, num_threads=num_threads)
+
+        self._fps = self._reader.get_avg_fps()
+        self._frame_count = len(self._reader)
+
+    def get_clip(self, start_sec: float, end_sec: float) -> Dict[str, Optional[torch.Tensor]]:
+        first, last = self._frame_range(start_sec, end_sec)
+
+        if last <= first:
+            return {"video": None, "audio": None}
+
+        try:
+            video = self._reader.get_batch(list(range(first, last))).asnumpy()
+        except decord.DECORDError as e:
+            logger.debug("Failed to decode video with decord: %s. %s", self._file_path, e)
+            return {"video": None, "audio": None}
+
+        return self._to_video(torch.from_numpy(video))
+
+    def close(self) -> None:
+        self._reader = None
+
+
+class OpenCVVideo(_FrameIndexVideo):
+    """
+    the opencv video, seek to the first frame of the clip and read the frames in order.
+    """
+
+    def __init__(self, file_path: str, target_size: Optional[Tuple[int, int]] = None) -> None:
+        self._file_path = file_path
+        self._target_size = target_size
+
+        self._capture = cv2.VideoCapture(file_path)
+
+        if not self._capture.isOpened():
+            raise IOError(f"can not open the video {file_path} with opencv.")
+
+        self._fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self._frame_count = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        # the next frame index to read, skip the seek for the consecutive clips.
+        self._position = 0
+
+    def get_clip(self, start_sec: float, end_sec: float) -> Dict[str, Optional[torch.Tensor]]:
+        first, last = self._frame_range(start_sec, end_sec)
+
+        if self._position != first:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+            self._position = first
+
+        frames = []
+
+        for _ in range(first, last):
+            ret, frame = self._capture.read()
+            if not ret:
+                break
+
+            self._position += 1
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+            if self._target_size is not None:
+                height, width = self._target_size
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+            frames.append(frame)
+
+        if len(frames) == 0:
+            return {"video": None, "audio": None}
+
+        return self._to_video(torch.from_numpy(np.stack(frames)))
+
+    def close(self) -> None:
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+
+DECODERS: Dict[str, Type[VideoDecoder]] = {
+    "pyav": PyAVDecoder,
+    "pyav_threaded": PyAVThreadedDecoder,
+    "pyav_sparse": PyAVSparseDecoder,
+    "torchvision": TorchvisionDecoder,
+    "decord": DecordDecoder,
+    "opencv": OpenCVDecoder,
+}
+
+
+def available_decoders() -> List[str]:
+    """
+    the decoder names can be used in this environment, the decord is optional.
+
+    Returns:
+        List[str]: the decoder names.
+    """
+
+    return [name for name in DECODERS if name != "decord" or decord is not None]
+
+
+def make_decoder(decoder: str, **kwargs) -> VideoDecoder:
+    """
+    make the decoder with the name.
+
+    Args:
+        decoder (str): the decoder name, in DECODERS.
+
+    Raises:
+        ValueError: unknown decoder name.
+
+    Returns:
+        VideoDecoder: the decoder instance.
+    """
+
+    if decoder not in DECODERS:
+        raise ValueError(f"unknown decoder {decoder}, choices {list(DECODERS)}")
+
+    return DECODERS[decoder](**kwargs)
+
+
+def check_decode_resize(file_path: str, img_size: int, clip_duration: float = 1.0, strict: bool = True) -> float:
+    """
+    compare the first clip scaled during decode with the torchvision Resize after the full size decode.
+
+    Args:
+        file_path (str): the video file path.
+        img_size (int): the target image size.
+        clip_duration (float, optional): the clip duration to compare. Defaults to 1.0.
+        strict (bool, optional): raise when the error is larger than DECODE_RESIZE_TOLERANCE. Defaults to True.
+
+    Raises:
+        AssertionError: the mean absolute error is larger than DECODE_RESIZE_TOLERANCE.
+
+    Returns:
+        float: the mean absolute error in [0, 255] pixel value.
+    """
+
+    full_video = PyAVDecoder().open(file_path)
+    scaled_video = PyAVDecoder(target_size=(img_size, img_size)).open(file_path)
+
+    try:
+        full_clip = full_video.get_clip(0, clip_duration)["video"]
+        scaled_clip = scaled_video.get_clip(0, clip_duration)["video"]
+    finally:
+        full_video.close()
+        scaled_video.close()
+
+    resized_clip = F.resize(full_clip.permute(1, 0, 2, 3).float(), [img_size, img_size], antialias=True) # c, t, h, w > t, c, h, w, float to compare without the rounding
+    frame_num = min(resized_clip.shape[0], scaled_clip.shape[1])
+
+    error = (resized_clip[:frame_num] - scaled_clip.permute(1, 0, 2, 3)[:frame_num].float()).abs().mean().item()
+
+    assert not strict or error <= DECODE_RESIZE_TOLERANCE, f"decode resize error {error:.3f} > {DECODE_RESIZE_TOLERANCE}, {file_path}"
+
+    return error
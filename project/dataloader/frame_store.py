@@ -0,0 +1,389 @@
+"""
+the pre-cropped frame store of the walk dataset, and the map-style dataset which slice the frames without decode.
+
+After split_cropfor*.py, every frame of the segment is a fixed size person crop, so the frames can be stored as
+one uint8 array [frame_num, h, w, c] of all the segments, with an index table:
+    index.json
+        {
+            "version": 1,
+            "format": "npy" or "hdf5",
+            "compression": null, "lzf" or "gzip",
+            "frame_shape": [h, w, c],
+            "frame_num": int,
+            "videos": {"ap/<name>": {"offset", "length", "fps", "size"}, "lat/<name>": ...},
+        }
+    frames.u8   the raw memory-mapped array, for the npy format.
+    frames.h5   the chunked dataset "frames", one chunk one frame, for the hdf5 format.
+
+The video key is the view and the relative path under the split folder, so the same video in different folds
+is stored once. The uniform temporal subsample is done by the frame index, so one clip read only num_samples frames.
+see export_frame_store.py.
+"""
+
+import json
+import logging
+import math
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from dataloader.clip_index import ClipIndex, build_clip_index, video_pair_patients
+from dataloader.decoders import make_decoder
+from dataloader.paired_dataset import VideoPair
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+logger = logging.getLogger(__name__)
+
+FRAME_STORE_VERSION = 1
+FRAME_STORE_INDEX = "index.json"
+FRAME_STORE_FORMATS = {"npy": "frames.u8", "hdf5": "frames.h5"}
+
+
+def video_key(view: str, name: str) -> str:
+    return view + "/" + name
+
+
+class FrameStoreWriter:
+    """
+    append the decoded frames of the videos to the frame store.
+    The store is written to a temp folder, and renamed when closed.
+    """
+
+    def __init__(self, store_path: str, store_format: str = "npy", compression: Optional[str] = None, img_size: Optional[int] = None) -> None:
+        """
+        Args:
+            store_path (str): the frame store folder.
+            store_format (str, optional): "npy" for the raw memmap, "hdf5" for the chunked and compressed store. Defaults to "npy".
+            compression (Optional[str], optional): the hdf5 compression, "lzf" (fast) or "gzip" (small), both lossless. Defaults to None.
+            img_size (Optional[int], optional): scale the frames to img_size during decode, None keep the crop size. Defaults to None.
+        """
+
+        if store_format not in FRAME_STORE_FORMATS:
+            raise ValueError(f"unknown frame store format {store_format}, choices {list(FRAME_STORE_FORMATS)}")
+        if store_format == "npy" and compression is not None:
+            raise ValueError("the npy frame store is not compressed, use the hdf5 format for the compression.")
+        if store_format == "hdf5" and h5py is None:
+            raise ImportError("the hdf5 frame store need the h5py package, pip install h5py.")
+
+        self.store_path = store_path
+        self.store_format = store_format
+        self.compression = compression
+
+        self._tmp_path = store_path.rstrip("/") + ".tmp"
+        os.makedirs(self._tmp_path, exist_ok=True)
+
+        # the threaded pyav decoder always return the uint8 frames and the fps.
+        self._decoder = make_decoder("pyav_threaded", target_size=(img_size, img_size) if img_size else None)
+        self._frames_path = os.path.join(self._tmp_path, FRAME_STORE_FORMATS[store_format])
+
+        self._file = None
+        self._frame_shape: Optional[Tuple[int, int, int]] = None
+        self._frame_num = 0
+        self.videos: Dict[str, Dict[str, Any]] = {}
+
+    def _append(self, frames: np.ndarray) -> None:
+        if self._frame_shape is None:
+            self._frame_shape = tuple(frames.shape[1:])
+
+            if self.store_format == "npy":
+                self._file = open(self._frames_path, "wb")
+            else:
+                self._file = h5py.File(self._frames_path, "w")
+                self._file.create_dataset(
+                    "frames",
+                    shape=(0,) + self._frame_shape,
+                    maxshape=(None,) + self._frame_shape,
+                    dtype=np.uint8,
+                    chunks=(1,) + self._frame_shape,
+                    compression=self.compression,
+                )
+
+        if tuple(frames.shape[1:]) != self._frame_shape:
+            raise ValueError(f"the frame shape {frames.shape[1:]} is different from the store {self._frame_shape}, set the img_size.")
+
+        if self.store_format == "npy":
+            self._file.write(np.ascontiguousarray(frames).tobytes())
+        else:
+            dataset = self._file["frames"]
+            dataset.resize(self._frame_num + len(frames), axis=0)
+            dataset[self._frame_num:] = frames
+
+        self._frame_num += len(frames)
+
+    def add_video(self, view: str, name: str, file_path: str) -> bool:
+        """
+        decode all the frames of the video and append them.
+
+        Args:
+            view (str): "ap" or "lat".
+            name (str): the relative path under the split folder.
+            file_path (str): the video file path.
+
+        Returns:
+            bool: False when the video is in the store, or decode failed.
+        """
+
+        key = video_key(view, name)
+
+        if key in self.videos:
+            if self.videos[key]["size"] != os.path.getsize(file_path):
+                logger.warning("%s has different files in the folds, keep the first one.", key)
+            return False
+
+        video = self._decoder.open(file_path)
+
+        try:
+            fps = video.fps
+            clip = video.get_clip(0, video.duration + 1)["video"]
+        finally:
+            video.close()
+
+        if clip is None:
+            logger.warning("Failed to decode %s, skip it.", file_path)
+            return False
+
+        frames = clip.permute(1, 2, 3, 0).numpy() # c, t, h, w > t, h, w, c
+
+        self.videos[key] = {"offset": self._frame_num, "length": len(frames), "fps": fps, "size": os.path.getsize(file_path)}
+        self._append(frames)
+
+        return True
+
+    def close(self) -> None:
+        """
+        write the index table and rename the temp folder to the store folder.
+        """
+
+        if self._file is not None:
+            self._file.close()
+
+        with open(os.path.join(self._tmp_path, FRAME_STORE_INDEX), "w") as f:
+            json.dump({
+                "version": FRAME_STORE_VERSION,
+                "format": self.store_format,
+                "compression": self.compression,
+                "frame_shape": list(self._frame_shape or ()),
+                "frame_num": self._frame_num,
+                "videos": self.videos,
+            }, f)
+
+        if os.path.isdir(self.store_path):
+            for file_name in os.listdir(self.store_path):
+                os.remove(os.path.join(self.store_path, file_name))
+            os.rmdir(self.store_path)
+
+        os.replace(self._tmp_path, self.store_path)
+
+
+class FrameStore:
+    """
+    the read only frame store, the frame array is opened lazily in every dataloader worker.
+    """
+
+    def __init__(self, store_path: str) -> None:
+        """
+        Args:
+            store_path (str): the frame store folder, from FrameStoreWriter.
+        """
+
+        self.store_path = store_path
+
+        with open(os.path.join(store_path, FRAME_STORE_INDEX), "r") as f:
+            index = json.load(f)
+
+        if index.get("version") != FRAME_STORE_VERSION:
+            raise ValueError(f"the frame store {store_path} is version {index.get('version')}, export it again.")
+
+        self.store_format = index["format"]
+        self.frame_shape = tuple(index["frame_shape"])
+        self.frame_num = index["frame_num"]
+        self.videos: Dict[str, Dict[str, Any]] = index["videos"]
+
+        self._frames = None
+
+    def __getstate__(self):
+        # the opened memmap and hdf5 file are not sent to the workers.
+        state = self.__dict__.copy()
+        state["_frames"] = None
+        return state
+
+    @property
+    def frames(self):
+        if self._frames is None:
+            frames_path = os.path.join(self.store_path, FRAME_STORE_FORMATS[self.store_format])
+
+            if self.store_format == "npy":
+                self._frames = np.memmap(frames_path, dtype=np.uint8, mode="r", shape=(self.frame_num,) + self.frame_shape)
+            else:
+                if h5py is None:
+                    raise ImportError("the hdf5 frame store need the h5py package, pip install h5py.")
+                self._frames = h5py.File(frames_path, "r")["frames"]
+
+        return self._frames
+
+    def video(self, view: str, video_pair: VideoPair) -> Optional[Dict[str, Any]]:
+        """
+        the index entry of one view, None when not in the store or the video file changed.
+        """
+
+        entry = self.videos.get(video_key(view, video_pair.name))
+        file_path = video_pair.ap_path if view == "ap" else video_pair.lat_path
+
+        if entry is None or entry["size"] != os.path.getsize(file_path):
+            return None
+
+        return entry
+
+    def read(self, entry: Dict[str, Any], frame_indices: np.ndarray) -> np.ndarray:
+        """
+        read the frames of the video by the frame index, only the selected frames are read.
+
+        Args:
+            entry (Dict[str, Any]): the video entry.
+            frame_indices (np.ndarray): the frame index in the video.
+
+        Returns:
+            np.ndarray: t, h, w, c uint8.
+        """
+
+        frame_indices = np.clip(frame_indices, 0, entry["length"] - 1) + entry["offset"]
+
+        # the hdf5 need the increasing index, the same frame can be selected more than once.
+        unique_indices, inverse = np.unique(frame_indices, return_inverse=True)
+
+        return np.asarray(self.frames[unique_indices])[inverse]
+
+
+def uniform_frame_indices(start_sec: float, end_sec: float, duration: float, fps: float, num_samples: int) -> np.ndarray:
+    """
+    the frame index of the uniform temporal subsample in [start_sec, end_sec), same as the sparse decoder.
+
+    Returns:
+        np.ndarray: the frame index, int64.
+    """
+
+    end_sec = min(end_sec, duration)
+    first_frame = math.ceil(start_sec * fps)
+    last_frame = max(math.ceil(end_sec * fps) - 1, first_frame)
+
+    return first_frame + torch.linspace(0, last_frame - first_frame, num_samples).long().numpy()
+
+
+class WalkFrameStoreDataset(torch.utils.data.Dataset):
+    """
+    the map-style paired walk dataset on the frame store, with the same clip index and sample as the WalkClipDataset.
+    The clip frames are sliced from the store, there is no video decode.
+    """
+
+    def __init__(
+        self,
+        paired_video_paths: List[VideoPair],
+        frame_store: FrameStore,
+        clip_duration: float,
+        num_samples: int,
+        transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        Args:
+            paired_video_paths (List[VideoPair]): the paired video list, the video not in the store is skipped.
+            frame_store (FrameStore): the frame store.
+            clip_duration (float): the clip duration of the uniform clip index.
+            num_samples (int): the frame number of one clip.
+            transform (Optional[Callable[[Dict[str, Any]], Dict[str, Any]]], optional): This callable is evaluated on the paired clip output before the clip is returned. Defaults to None.
+        """
+
+        self._frame_store = frame_store
+        self._num_samples = num_samples
+        self._transform = transform
+
+        self._paired_video_paths = []
+        self._entries: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+
+        for video_pair in paired_video_paths:
+            ap_entry = frame_store.video("ap", video_pair)
+            lat_entry = frame_store.video("lat", video_pair)
+
+            if ap_entry is None or lat_entry is None:
+                logger.warning("skip %s, not in the frame store %s, export it again.", video_pair.name, frame_store.store_path)
+                continue
+
+            self._paired_video_paths.append(video_pair)
+            self._entries.append((ap_entry, lat_entry))
+
+        self._durations = [
+            min(ap_entry["length"] / ap_entry["fps"], lat_entry["length"] / lat_entry["fps"])
+            for ap_entry, lat_entry in self._entries
+        ]
+        self._clip_index = build_clip_index(
+            self._durations,
+            clip_duration,
+            labels=[video_pair.label for video_pair in self._paired_video_paths],
+            patients=video_pair_patients(self._paired_video_paths),
+        )
+
+    @property
+    def paired_video_paths(self) -> List[VideoPair]:
+        return self._paired_video_paths
+
+    @property
+    def clip_index(self) -> ClipIndex:
+        return self._clip_index
+
+    def __len__(self) -> int:
+        return len(self._clip_index)
+
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        """
+        slice the subsampled frames of the clip from the store.
+
+        Args:
+            index (int): the clip index.
+
+        Returns:
+            Dict[str, Any]: the paired clip, the ap and lat video are c, t, h, w uint8, same as the decoder output.
+        """
+
+        video_id = int(self._clip_index.video_id[index])
+        video_pair = self._paired_video_paths[video_id]
+        clip_start = float(self._clip_index.clip_start[index])
+        clip_end = float(self._clip_index.clip_end[index])
+
+        sample_dict = {
+            "label": video_pair.label,
+            "name": video_pair.name,
+            "clip_index": int(self._clip_index.clip_in_video[index]),
+        }
+
+        for view, entry in zip(("ap", "lat"), self._entries[video_id]):
+            frame_indices = uniform_frame_indices(clip_start, clip_end, self._durations[video_id], entry["fps"], self._num_samples)
+            frames = self._frame_store.read(entry, frame_indices)
+
+            sample_dict[view] = torch.from_numpy(frames).permute(3, 0, 1, 2) # t, h, w, c > c, t, h, w
+
+        if self._transform is not None:
+            sample_dict = self._transform(sample_dict)
+
+        return sample_dict
+
+
+def export_paired_videos(writer: FrameStoreWriter, paired_video_paths: Iterable[VideoPair]) -> int:
+    """
+    add the two views of the paired videos to the store.
+
+    Returns:
+        int: the number of the added videos.
+    """
+
+    added = 0
+
+    for video_pair in paired_video_paths:
+        added += writer.add_video("ap", video_pair.name, video_pair.ap_path)
+        added += writer.add_video("lat", video_pair.name, video_pair.lat_path)
+
+    return added
@@ -0,0 +1,228 @@
+"""
+the cached video manifest of the walk dataset, so the setup() skip the directory walk and the container probe.
+
+The manifest is a json file like:
+    {
+        "version": 1,
+        "videos": {
+            video_path: {"mtime_ns", "duration", "fps", "frame_count", "keyframes"},
+        },
+        "splits": {
+            "ap_path|lat_path": {"dirs": {dir_path: mtime_ns}, "pairs": [[ap_path, lat_path, label, name], ...]},
+        },
+    }
+
+The video info is probed again only when the video mtime changed,
+and the split is walked again only when one of its folders changed (a file added or removed).
+"""
+
+import json
+import logging
+import os
+from fractions import Fraction
+from typing import Any, Dict, List
+
+import av
+
+from dataloader.paired_dataset import VideoPair, make_paired_video_paths
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def _stream_duration(container, stream) -> float:
+    """
+    the duration in the stream header, or the container header.
+    """
+
+    if stream.duration is not None:
+        return float(Fraction(stream.duration * stream.time_base))
+
+    return container.duration / av.time_base
+
+
+def probe_duration(file_path: str) -> float:
+    """
+    probe the video duration from the header only, without demux the packets.
+
+    Args:
+        file_path (str): the video file path.
+
+    Returns:
+        float: the duration (sec), same as the probe_video.
+    """
+
+    with av.open(file_path) as container:
+        return _stream_duration(container, container.streams.video[0])
+
+
+def probe_video(file_path: str) -> Dict[str, Any]:
+    """
+    probe the video stream info, demux the packets without decode.
+
+    Args:
+        file_path (str): the video file path.
+
+    Returns:
+        Dict[str, Any]: duration (sec), fps, frame_count and the keyframe pts.
+    """
+
+    with av.open(file_path) as container:
+        stream = container.streams.video[0]
+
+        fps = float(stream.average_rate or stream.guessed_rate)
+        duration = _stream_duration(container, stream)
+
+        frame_count = 0
+        keyframes = []
+
+        for packet in container.demux(stream):
+            if packet.pts is None:
+                continue
+
+            frame_count += 1
+            if packet.is_keyframe:
+                keyframes.append(packet.pts)
+
+    return {
+        "duration": duration,
+        "fps": fps,
+        "frame_count": frame_count,
+        "keyframes": sorted(keyframes),
+    }
+
+
+def _dir_mtimes(*roots: str) -> Dict[str, int]:
+    """
+    the mtime of all the folders under the roots.
+
+    Returns:
+        Dict[str, int]: {dir_path: mtime_ns}
+    """
+
+    dir_mtimes = {}
+
+    for root in roots:
+        for dir_path, _, _ in os.walk(root, followlinks=True):
+            dir_mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+
+    return dir_mtimes
+
+
+class VideoManifest:
+    """
+    the video manifest, built once and invalidated incrementally by the mtime.
+    """
+
+    def __init__(self, manifest_path: str) -> None:
+        """
+        Args:
+            manifest_path (str): the manifest json file path, will be created when not exist.
+        """
+
+        self.manifest_path = manifest_path
+        self._dirty = False
+
+        manifest = {}
+
+        if os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, "r") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("broken manifest %s, will rebuild it. error: %s", manifest_path, e)
+
+        if manifest.get("version") != MANIFEST_VERSION:
+            manifest = {"version": MANIFEST_VERSION, "videos": {}, "splits": {}}
+
+        self.videos: Dict[str, Dict[str, Any]] = manifest["videos"]
+        self.splits: Dict[str, Dict[str, Any]] = manifest["splits"]
+
+    def _split_changed(self, split: Dict[str, Any]) -> bool:
+        for dir_path, mtime_ns in split["dirs"].items():
+            try:
+                if os.stat(dir_path).st_mtime_ns != mtime_ns:
+                    return True
+            except FileNotFoundError:
+                return True
+
+        return False
+
+    def paired_video_paths(self, ap_path: str, lat_path: str) -> List[VideoPair]:
+        """
+        the paired video list of the split, same as make_paired_video_paths.
+        The split folders are walked again only when changed, and the video info of the pairs are probed.
+
+        Args:
+            ap_path (str): the split folder of the ap view.
+            lat_path (str): the split folder of the lat view.
+
+        Returns:
+            List[VideoPair]: the paired video list.
+        """
+
+        key = os.path.abspath(ap_path) + "|" + os.path.abspath(lat_path)
+        split = self.splits.get(key)
+
+        if split is None or self._split_changed(split):
+            paired_video_paths = make_paired_video_paths(ap_path, lat_path)
+
+            self.splits[key] = {
+                "dirs": _dir_mtimes(ap_path, lat_path),
+                "pairs": [list(video_pair) for video_pair in paired_video_paths],
+            }
+            self._dirty = True
+
+        else:
+            paired_video_paths = [VideoPair(*video_pair) for video_pair in split["pairs"]]
+
+        for video_pair in paired_video_paths:
+            self.video_info(video_pair.ap_path)
+            self.video_info(video_pair.lat_path)
+
+        self.save()
+
+        return paired_video_paths
+
+    def video_info(self, file_path: str) -> Dict[str, Any]:
+        """
+        the probed info of the video, probe again when the mtime changed.
+
+        Args:
+            file_path (str): the video file path.
+
+        Returns:
+            Dict[str, Any]: mtime_ns, duration, fps, frame_count and keyframes.
+        """
+
+        mtime_ns = os.stat(file_path).st_mtime_ns
+        info = self.videos.get(file_path)
+
+        if info is None or info["mtime_ns"] != mtime_ns:
+            info = probe_video(file_path)
+            info["mtime_ns"] = mtime_ns
+
+            self.videos[file_path] = info
+            self._dirty = True
+
+        return info
+
+    def save(self) -> None:
+        """
+        save the manifest when changed, write to a temp file and then rename.
+        """
+
+        if not self._dirty:
+            return
+
+        manifest_dir = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(manifest_dir, exist_ok=True)
+
+        tmp_path = "%s.%d.tmp" % (self.manifest_path, os.getpid())
+
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "videos": self.videos, "splits": self.splits}, f)
+
+        os.replace(tmp_path, self.manifest_path)
+        self._dirty = False
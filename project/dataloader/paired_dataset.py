@@ -0,0 +1,456 @@
+"""
+paired AP/LAT walk video dataset, where the two views of one sample are decoded in the same worker.
+
+Because the two views are loaded from one sample index, the name and label of the ap and lat clips are
+paired by construction, there is no need to check them in the training loop.
+"""
+
+import logging
+import os
+import random
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Type, Union
+
+import torch
+from pytorchvideo.data.clip_sampling import ClipSampler, UniformClipSampler
+from pytorchvideo.data.utils import MultiProcessSampler
+
+from dataloader.decoders import PyAVSparseDecoder, VideoDecoder, make_decoder
+
+if TYPE_CHECKING:
+    from dataloader.clip_cache import ClipCache
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = (".mp4", ".avi")
+
+
+class VideoPair(NamedTuple):
+    """
+    one paired sample of the walk dataset.
+
+    Args:
+        ap_path (str): the ap (front) view video path.
+        lat_path (str): the lat (side) view video path.
+        label (int): the class index, follow the sorted class folder name.
+        name (str): the relative path of the video under the split folder, same for the two views.
+    """
+
+    ap_path: str
+    lat_path: str
+    label: int
+    name: str
+
+
+def make_paired_video_paths(ap_path: str, lat_path: str) -> List[VideoPair]:
+    """
+    walk the class folders of the ap dataset, and pair every video with the lat video at the same relative path.
+    The class index follow the sorted class folder name, same as the LabeledVideoPaths.from_directory.
+
+    like this :
+    ap_path                     lat_path
+        - ASD                       - ASD
+            - date/segment0.mp4         - date/segment0.mp4
+        - non_ASD                   - non_ASD
+
+    Args:
+        ap_path (str): the split folder of the ap view, e.g. fold0/train.
+        lat_path (str): the split folder of the lat view, e.g. fold0/train.
+
+    Returns:
+        List[VideoPair]: the paired video list, the video without the other view will be skipped.
+    """
+
+    classes = sorted(f.name for f in os.scandir(ap_path) if f.is_dir())
+    class_to_idx = {class_name: i for i, class_name in enumerate(classes)}
+
+    paired_video_paths = []
+
+    for class_name in classes:
+        for root, _, files in sorted(os.walk(os.path.join(ap_path, class_name), followlinks=True)):
+            for file_name in sorted(files):
+                if not file_name.lower().endswith(VIDEO_EXTENSIONS):
+                    continue
+
+                ap_video_path = os.path.join(root, file_name)
+                name = os.path.relpath(ap_video_path, ap_path)
+                lat_video_path = os.path.join(lat_path, name)
+
+                if not os.path.isfile(lat_video_path):
+                    logger.warning("skip %s, the lat view not found in %s", name, lat_path)
+                    continue
+
+                paired_video_paths.append(
+                    VideoPair(ap_video_path, lat_video_path, class_to_idx[class_name], name)
+                )
+
+    return paired_video_paths
+
+
+def decode_paired_clip(
+    ap_video,
+    lat_video,
+    video_pair: VideoPair,
+    clip_start: float,
+    clip_end: float,
+    clip_index: int,
+    transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    decode the same clip time from the two opened views, and apply the transform.
+
+    Args:
+        ap_video: the opened ap video, from the decoder.
+        lat_video: the opened lat video, from the decoder.
+        video_pair (VideoPair): the video pair.
+        clip_start (float): the clip start time.
+        clip_end (float): the clip end time.
+        clip_index (int): the clip index in the video.
+        transform (Optional[Callable[[Dict[str, Any]], Dict[str, Any]]], optional): the transform for the paired clip. Defaults to None.
+
+    Returns:
+        Optional[Dict[str, Any]]: the paired clip, None when decode failed.
+    """
+
+    ap_clip = ap_video.get_clip(clip_start, clip_end)["video"]
+    lat_clip = lat_video.get_clip(clip_start, clip_end)["video"]
+
+    if ap_clip is None or lat_clip is None:
+        logger.debug("Failed to decode clip %s of %s", clip_index, video_pair.name)
+        return None
+
+    sample_dict = {
+        "ap": ap_clip,
+        "lat": lat_clip,
+        "label": video_pair.label,
+        "name": video_pair.name,
+        "clip_index": clip_index,
+    }
+
+    if transform is not None:
+        sample_dict = transform(sample_dict)
+
+    return sample_dict
+
+
+def load_cached_clip(video_pair: VideoPair, shard, clip_index: int) -> Dict[str, Any]:
+    """
+    load one paired clip from the clip cache shard.
+
+    Args:
+        video_pair (VideoPair): the video pair.
+        shard (np.ndarray): the memory-mapped shard, clip_num, 2, t, c, h, w.
+        clip_index (int): the clip index in the video.
+
+    Returns:
+        Dict[str, Any]: the paired clip.
+    """
+
+    # copy out from the read only memmap, the uint8 clip is same as the decode path.
+    clip = torch.from_numpy(shard[clip_index].copy())
+
+    return {
+        "ap": clip[0],
+        "lat": clip[1],
+        "label": video_pair.label,
+        "name": video_pair.name,
+        "clip_index": clip_index,
+    }
+
+
+def shuffle_buffer(samples: Iterator[Dict[str, Any]], buffer_size: int) -> Iterator[Dict[str, Any]]:
+    """
+    shuffle the samples of the stream with a bounded buffer of buffer_size samples.
+
+    Args:
+        samples (Iterator[Dict[str, Any]]): the samples in the read order.
+        buffer_size (int): the buffer size, 0 or 1 to keep the order.
+
+    Yields:
+        Dict[str, Any]: the shuffled samples.
+    """
+
+    if buffer_size <= 1:
+        yield from samples
+        return
+
+    # the worker seed is set by the dataloader, different in every worker and epoch.
+    rng = random.Random(torch.initial_seed())
+    buffer = []
+
+    for sample_dict in samples:
+        buffer.append(sample_dict)
+
+        if len(buffer) >= buffer_size:
+            i = rng.randrange(len(buffer))
+            buffer[i], buffer[-1] = buffer[-1], buffer[i]
+            yield buffer.pop()
+
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def _cut_frames(frames: torch.Tensor, window_start: float, window_end: float, clip_start: float, clip_end: float) -> torch.Tensor:
+    """
+    cut the frames of one clip from the decoded window, by the frame position in the window.
+
+    Args:
+        frames (torch.Tensor): the decoded window, c, t, h, w.
+        window_start (float): the window start time.
+        window_end (float): the window end time.
+        clip_start (float): the clip start time.
+        clip_end (float): the clip end time.
+
+    Returns:
+        torch.Tensor: the clip frames, c, t, h, w.
+    """
+
+    frame_num = frames.shape[1]
+    window_duration = float(window_end - window_start)
+
+    first = int(float(clip_start - window_start) / window_duration * frame_num)
+    last = int(float(clip_end - window_start) / window_duration * frame_num)
+
+    # keep one frame at least, when the video is shorter than the clip.
+    first = min(first, frame_num - 1)
+
+    return frames[:, first: max(last, first + 1)]
+
+
+class PairedWalkDataset(torch.utils.data.IterableDataset):
+    """
+    PairedWalkDataset handles the storage, loading, decoding and clip sampling for the paired ap/lat walk videos.
+    The clip times are sampled once for one pair, then the same clip is decoded from the two views.
+
+    Each sample is a dict like:
+        {
+            "ap": the ap clip tensor,
+            "lat": the lat clip tensor,
+            "label": the class index,
+            "name": the relative video path,
+            "clip_index": the clip index in the video,
+        }
+    """
+
+    def __init__(
+        self,
+        paired_video_paths: List[VideoPair],
+        clip_sampler: ClipSampler,
+        video_sampler: Type[torch.utils.data.Sampler] = torch.utils.data.RandomSampler,
+        transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        decoder: Union[str, VideoDecoder] = "pyav",
+        clip_cache: Optional["ClipCache"] = None,
+        multi_clip_buffer: int = 0,
+        shuffle_window: int = 0,
+    ) -> None:
+        """
+        Args:
+            paired_video_paths (List[VideoPair]): the paired video list, from make_paired_video_paths.
+            clip_sampler (ClipSampler): Defines how clips should be sampled from each video pair.
+            video_sampler (Type[torch.utils.data.Sampler], optional): Sampler for the video pair index. Defaults to torch.utils.data.RandomSampler.
+            transform (Optional[Callable[[Dict[str, Any]], Dict[str, Any]]], optional): This callable is evaluated on the paired clip output before the clip is returned. Defaults to None.
+            decoder (Union[str, VideoDecoder], optional): the decoder name in decoders.DECODERS, or the decoder instance. Defaults to "pyav".
+            clip_cache (Optional[ClipCache], optional): the on-disk clip cache, only work with the uniform clip sampler. Defaults to None.
+            multi_clip_buffer (int, optional): the max clip number decoded in one pass, then all the clips are cut from the buffered frames. 0 to decode clip by clip. Defaults to 0.
+            shuffle_window (int, optional): shuffle the output clips within a window of this size. 0 to keep the order. Defaults to 0.
+        """
+
+        # the cached clips must be the same in every epoch.
+        if clip_cache is not None and not isinstance(clip_sampler, UniformClipSampler):
+            raise ValueError(f"clip cache only support the uniform clip sampler, get {type(clip_sampler).__name__}")
+
+        self._decoder = make_decoder(decoder) if isinstance(decoder, str) else decoder
+
+        # the sparse decoder only decode the subsampled frames of one clip, can not cut the clips from it.
+        if multi_clip_buffer > 0 and isinstance(self._decoder, PyAVSparseDecoder):
+            raise ValueError("multi clip decode need the full decoder, not the sparse decoder.")
+
+        self._paired_video_paths = paired_video_paths
+        self._clip_sampler = clip_sampler
+        self._transform = transform
+        self._clip_cache = clip_cache
+        self._multi_clip_buffer = multi_clip_buffer
+        self._shuffle_window = shuffle_window
+
+        # the RandomSampler need a generator, to keep the same order in the different workers.
+        if video_sampler == torch.utils.data.RandomSampler:
+            self._video_random_generator = torch.Generator()
+            self._video_sampler = video_sampler(self._paired_video_paths, generator=self._video_random_generator)
+        else:
+            self._video_random_generator = None
+            self._video_sampler = video_sampler(self._paired_video_paths)
+
+    @property
+    def num_videos(self) -> int:
+        """
+        Returns:
+            int: the number of the video pairs in the dataset.
+        """
+        return len(self._paired_video_paths)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """
+        shard the video pair index across the dataloader workers, and yield the clips of every pair.
+        """
+
+        worker_info = torch.utils.data.get_worker_info()
+        if self._video_random_generator is not None and worker_info is not None:
+            base_seed = worker_info.seed - worker_info.id
+            self._video_random_generator.manual_seed(base_seed)
+
+        yield from shuffle_buffer(self._iter_videos(), self._shuffle_window)
+
+    def _iter_videos(self) -> Iterator[Dict[str, Any]]:
+        """
+        yield the clips of the videos of this worker, from the cache or decode.
+        """
+
+        for video_index in MultiProcessSampler(self._video_sampler):
+            video_pair = self._paired_video_paths[video_index]
+
+            if self._clip_cache is not None:
+                shard = self._clip_cache.load(video_pair)
+
+                if shard is not None:
+                    yield from self._iter_cached_clips(video_pair, shard)
+                    continue
+
+            yield from self._iter_clips(video_pair)
+
+    def _iter_cached_clips(self, video_pair: VideoPair, shard) -> Iterator[Dict[str, Any]]:
+        """
+        yield the clips from the cache shard, without decode.
+
+        Args:
+            video_pair (VideoPair): the video pair.
+            shard (np.ndarray): the memory-mapped shard, clip_num, 2, t, c, h, w.
+
+        Yields:
+            Dict[str, Any]: the paired clip.
+        """
+
+        for clip_index in range(shard.shape[0]):
+            yield load_cached_clip(video_pair, shard, clip_index)
+
+    def _sample_clip_times(self, duration: float) -> List[Tuple[float, float, int]]:
+        """
+        sample all the clip times of one video with the clip sampler.
+
+        Args:
+            duration (float): the video duration.
+
+        Returns:
+            List[Tuple[float, float, int]]: the (clip_start, clip_end, clip_index) list.
+        """
+
+        self._clip_sampler.reset()
+        last_clip_end_time = 0.0
+        is_last_clip = False
+        clip_times = []
+
+        while not is_last_clip:
+            clip_start, clip_end, clip_index, _, is_last_clip = self._clip_sampler(last_clip_end_time, duration, {})
+            last_clip_end_time = clip_end
+            clip_times.append((clip_start, clip_end, clip_index))
+
+        return clip_times
+
+    def _decode_clips(self, ap_video, lat_video, video_pair: VideoPair, duration: float) -> Iterator[Tuple[float, float, int, Optional[Dict[str, Any]]]]:
+        """
+        decode the clips of one video pair.
+        With the multi_clip_buffer, decode the frames of up to multi_clip_buffer consecutive clips in one pass,
+        then cut the clips from the buffered frames, so a short segment is decoded once.
+
+        Args:
+            ap_video: the opened ap video.
+            lat_video: the opened lat video.
+            video_pair (VideoPair): the video pair.
+            duration (float): the video duration.
+
+        Yields:
+            Tuple[float, float, int, Optional[Dict[str, Any]]]: clip_start, clip_end, clip_index and the paired clip, None when decode failed.
+        """
+
+        clip_times = self._sample_clip_times(duration)
+
+        if self._multi_clip_buffer <= 0:
+            for clip_start, clip_end, clip_index in clip_times:
+                yield clip_start, clip_end, clip_index, decode_paired_clip(
+                    ap_video, lat_video, video_pair, clip_start, clip_end, clip_index, self._transform
+                )
+            return
+
+        for i in range(0, len(clip_times), self._multi_clip_buffer):
+            window = clip_times[i: i + self._multi_clip_buffer]
+            window_start, window_end = window[0][0], window[-1][1]
+
+            ap_frames = ap_video.get_clip(window_start, window_end)["video"]
+            lat_frames = lat_video.get_clip(window_start, window_end)["video"]
+
+            for clip_start, clip_end, clip_index in window:
+                if ap_frames is None or lat_frames is None:
+                    logger.debug("Failed to decode clip %s of %s", clip_index, video_pair.name)
+                    yield clip_start, clip_end, clip_index, None
+                    continue
+
+                sample_dict = {
+                    "ap": _cut_frames(ap_frames, window_start, window_end, clip_start, clip_end),
+                    "lat": _cut_frames(lat_frames, window_start, window_end, clip_start, clip_end),
+                    "label": video_pair.label,
+                    "name": video_pair.name,
+                    "clip_index": clip_index,
+                }
+
+                if self._transform is not None:
+                    sample_dict = self._transform(sample_dict)
+
+                yield clip_start, clip_end, clip_index, sample_dict
+
+    def _iter_clips(self, video_pair: VideoPair) -> Iterator[Dict[str, Any]]:
+        """
+        decode the clips from one video pair, the two views share the same clip time.
+
+        Args:
+            video_pair (VideoPair): the video pair to decode.
+
+        Yields:
+            Dict[str, Any]: the paired clip.
+        """
+
+        ap_video = None
+
+        try:
+            ap_video = self._decoder.open(video_pair.ap_path)
+            lat_video = self._decoder.open(video_pair.lat_path)
+        except Exception as e:
+            logger.debug("Failed to load video pair %s with error: %s", video_pair.name, e)
+
+            # the lat open failed, close the opened ap video.
+            if ap_video is not None:
+                ap_video.close()
+            return
+
+        # the two views are recorded at the same time, but the duration may be different a little.
+        duration = min(ap_video.duration, lat_video.duration)
+
+        # collect the clips for the cache, only save when all the clips are decoded.
+        cache_clips = self._clip_cache is not None
+        ap_clips, lat_clips = [], []
+
+        try:
+            for clip_start, clip_end, clip_index, sample_dict in self._decode_clips(ap_video, lat_video, video_pair, duration):
+
+                if sample_dict is None:
+                    cache_clips = False
+                    continue
+
+                if cache_clips:
+                    ap_clips.append(sample_dict["ap"])
+                    lat_clips.append(sample_dict["lat"])
+
+                yield sample_dict
+        finally:
+            ap_video.close()
+            lat_video.close()
+
+        if cache_clips:
+            self._clip_cache.save(video_pair, ap_clips, lat_clips)
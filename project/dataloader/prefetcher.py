@@ -0,0 +1,203 @@
+"""
+the asynchronous batch prefetcher around the dataloader.
+
+A background thread get the next batch from the dataloader, copy it into the pinned memory,
+and issue the non-blocking host to device copy on a side cuda stream, while the current step runs on the main stream.
+The train loop get the batch already on the device, so the Trainer batch transfer is a no-op.
+Without the cuda device, the thread only keep the next batch ready in the cpu memory (double buffer).
+
+The time of the thread (load, pin and copy) is the prefetch work, the time the train loop waits for the batch is exposed,
+and the rest of the work is hidden behind the step.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import torch
+
+# the stop marker of the prefetch thread.
+_END = object()
+
+
+def apply_to_tensors(batch: Any, fn: Callable[[torch.Tensor], torch.Tensor]) -> Any:
+    """
+    apply the function to all the tensors in the nested dict, list and tuple.
+    """
+
+    if torch.is_tensor(batch):
+        return fn(batch)
+    if isinstance(batch, dict):
+        return {key: apply_to_tensors(value, fn) for key, value in batch.items()}
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(apply_to_tensors(value, fn) for value in batch)
+
+    return batch
+
+
+class AsyncBatchPrefetcher:
+    """
+    wrap the dataloader, and yield the batches prefetched by a background thread.
+    The other attributes (dataset, batch_size, num_workers ...) are from the wrapped dataloader.
+    """
+
+    def __init__(
+        self,
+        dataloader: torch.utils.data.DataLoader,
+        device: torch.device,
+        num_prefetch: int = 2,
+        stats: Optional[Dict[str, float]] = None,
+    ) -> None:
+        """
+        Args:
+            dataloader (torch.utils.data.DataLoader): the wrapped dataloader.
+            device (torch.device): the train device, the batch is copied to it when it is a cuda device.
+            num_prefetch (int, optional): the batches prepared ahead of the train loop, 1 for the double buffer. Defaults to 2.
+            stats (Optional[Dict[str, float]], optional): the stats of the last prefetcher of the same split, to sum over the reloaded dataloaders. Defaults to None.
+        """
+
+        self.dataloader = dataloader
+        self.device = torch.device(device)
+        self.num_prefetch = max(1, num_prefetch)
+
+        self._use_cuda = self.device.type == "cuda" and torch.cuda.is_available()
+        # summed over all the iterations, reported once by the data module teardown.
+        self.stats = stats if stats is not None else {"passes": 0, "batches": 0, "work_sec": 0.0, "exposed_sec": 0.0, "hidden_sec": 0.0}
+
+    def __len__(self) -> int:
+        return len(self.dataloader)
+
+    def __getattr__(self, name: str) -> Any:
+        # only called when the attribute is not found in the prefetcher.
+        if name == "dataloader":
+            raise AttributeError(name)
+        return getattr(self.dataloader, name)
+
+    def _to_device(self, batch: Any, stream: "torch.cuda.Stream") -> Tuple[Any, "torch.cuda.Event"]:
+        """
+        pin the batch and issue the non-blocking copy on the side stream.
+
+        Returns:
+            Tuple[Any, torch.cuda.Event]: the batch on the device, and the event recorded after the copy.
+        """
+
+        def copy(tensor: torch.Tensor) -> torch.Tensor:
+            if not tensor.is_pinned():
+                tensor = tensor.pin_memory()
+            return tensor.to(self.device, non_blocking=True)
+
+        with torch.cuda.stream(stream):
+            batch = apply_to_tensors(batch, copy)
+            event = torch.cuda.Event()
+            event.record(stream)
+
+        return batch, event
+
+    def _produce(self, batch_queue: "queue.Queue", stop: threading.Event) -> None:
+        """
+        the prefetch thread, put (batch, event, work time) to the queue.
+        """
+
+        stream = torch.cuda.Stream(device=self.device) if self._use_cuda else None
+
+        try:
+            iterator = iter(self.dataloader)
+
+            while not stop.is_set():
+                start_time = time.perf_counter()
+
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    break
+
+                if self._use_cuda:
+                    batch, event = self._to_device(batch, stream)
+                else:
+                    event = None
+
+                item = (batch, event, time.perf_counter() - start_time)
+
+                # wait for the free slot, stop when the train loop break.
+                while not stop.is_set():
+                    try:
+                        batch_queue.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+
+        except Exception as e:
+            batch_queue.put(e)
+            return
+
+        batch_queue.put(_END)
+
+    def __iter__(self) -> Iterator[Any]:
+
+        self.stats["passes"] += 1
+
+        batch_queue = queue.Queue(maxsize=self.num_prefetch)
+        stop = threading.Event()
+
+        thread = threading.Thread(target=self._produce, args=(batch_queue, stop), daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                wait_start = time.perf_counter()
+                item = batch_queue.get()
+                exposed = time.perf_counter() - wait_start
+
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                batch, event, work_sec = item
+
+                if event is not None:
+                    current_stream = torch.cuda.current_stream(self.device)
+                    current_stream.wait_event(event)
+                    # the memory is made on the side stream, but used on the main stream.
+                    apply_to_tensors(batch, lambda tensor: tensor.record_stream(current_stream))
+
+                self.stats["batches"] += 1
+                self.stats["work_sec"] += work_sec
+                self.stats["exposed_sec"] += exposed
+                self.stats["hidden_sec"] += max(work_sec - exposed, 0.0)
+
+                yield batch
+
+        finally:
+            stop.set()
+            # free the slot, the thread may wait for the put.
+            while thread.is_alive():
+                try:
+                    batch_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            thread.join()
+
+    def report(self, name: str = "") -> str:
+        """
+        log the hidden and exposed time of all the iterations.
+
+        Args:
+            name (str, optional): the dataloader name in the report. Defaults to "".
+
+        Returns:
+            str: the report.
+        """
+
+        stats = self.stats
+        work_sec = stats["work_sec"]
+        hidden_ratio = stats["hidden_sec"] / work_sec if work_sec > 0 else 0.0
+
+        report = "%sprefetch %d batches in %d passes on %s: load+copy %.2f s, hidden %.2f s (%.1f%%), exposed %.2f s" % (
+            name + " " if name else "", stats["batches"], stats["passes"], "cuda" if self._use_cuda else "cpu",
+            work_sec, stats["hidden_sec"], hidden_ratio * 100, stats["exposed_sec"],
+        )
+        print(report)
+
+        return report
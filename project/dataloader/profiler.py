@@ -0,0 +1,358 @@
+"""
+the per-stage profiler of the data pipeline, for main.py --profile_data.
+
+The stages of one batch:
+    open: open the video container (decoder.open).
+    seek: the container seek, only for the pyav decoders.
+    decode: decode the frames of the clip, without the seek.
+    subsample, resize, to_uint8: the video transform, for every view.
+    collate: make the batch in the worker.
+    ipc: from the batch made in the worker to the batch received in the main process.
+    wait: the main process blocked for the next batch.
+
+When it is off, nothing is wrapped, so the pipeline is same as before.
+When it is on, every process append its events to trace_dir/events-<pid>.jsonl after every batch,
+and report() merge them into the summary table with the per-worker histograms, and the chrome trace (chrome://tracing, perfetto).
+"""
+
+import glob
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import torch
+from torch.utils.data import default_collate
+
+from dataloader.decoders import VideoDecoder
+
+# the histogram bucket edges (ms), 2 ** -4 ... 2 ** 14
+HISTOGRAM_EDGES_MS = [2.0 ** i for i in range(-4, 15)]
+
+# the stage name of the transforms in the video transform.
+TRANSFORM_STAGES = {"UniformTemporalSubsample": "subsample", "Resize": "resize"}
+
+# the batch key of the collate end time, removed in the main process.
+_COLLATE_END = "_profile_collate_end"
+
+
+def _worker_name() -> str:
+    worker_info = torch.utils.data.get_worker_info()
+    return "main" if worker_info is None else "worker%d" % worker_info.id
+
+
+class PipelineProfiler:
+    """
+    collect the stage events of this process, and merge the events of all the processes in report().
+    The profiler is copied to the workers with the wrapped decoder, transform and collate.
+    """
+
+    def __init__(self, trace_dir: str) -> None:
+        """
+        Args:
+            trace_dir (str): the output folder of the events, summary and trace.
+        """
+
+        self.trace_dir = trace_dir
+        self._events: List[list] = []
+
+        os.makedirs(trace_dir, exist_ok=True)
+
+        # the events of the last run in the same folder.
+        for path in glob.glob(os.path.join(trace_dir, "events-*.jsonl")):
+            os.remove(path)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_events"] = []
+        return state
+
+    def record(self, stage: str, start_ns: int, duration_ns: int) -> None:
+        self._events.append([stage, _worker_name(), start_ns, duration_ns])
+
+    def flush(self) -> None:
+        """
+        append the events of this process to the events file.
+        """
+
+        if not self._events:
+            return
+
+        with open(os.path.join(self.trace_dir, "events-%d.jsonl" % os.getpid()), "a") as f:
+            for event in self._events:
+                f.write(json.dumps(event) + "\n")
+
+        self._events = []
+
+    def _load_events(self) -> List[list]:
+        events = []
+
+        for path in sorted(glob.glob(os.path.join(self.trace_dir, "events-*.jsonl"))):
+            pid = int(os.path.basename(path)[len("events-"):-len(".jsonl")])
+
+            with open(path, "r") as f:
+                events.extend(json.loads(line) + [pid] for line in f if line.strip())
+
+        return events
+
+    def report(self) -> str:
+        """
+        merge the events of all the processes, save summary.txt, summary.json (with the histograms) and trace.json.
+
+        Returns:
+            str: the summary table.
+        """
+
+        self.flush()
+        events = self._load_events()
+
+        # stage > worker > durations (ms)
+        durations: Dict[str, Dict[str, List[float]]] = {}
+        for stage, worker, _, duration_ns, _ in events:
+            durations.setdefault(stage, {}).setdefault(worker, []).append(duration_ns / 1e6)
+
+        summary = {}
+        rows = ["%-12s %-10s %8s %10s %10s %10s %10s %10s" % ("stage", "worker", "count", "mean ms", "p50 ms", "p95 ms", "max ms", "total s")]
+
+        for stage, workers in durations.items():
+            summary[stage] = {}
+            workers = dict(workers, all=[d for worker_durations in workers.values() for d in worker_durations])
+
+            for worker in sorted(workers, key=lambda w: (w == "all", w)):
+                values = np.asarray(workers[worker])
+                counts, _ = np.histogram(values, bins=[0.0] + HISTOGRAM_EDGES_MS + [float("inf")])
+
+                summary[stage][worker] = {
+                    "count": int(values.size),
+                    "mean_ms": float(values.mean()),
+                    "p50_ms": float(np.percentile(values, 50)),
+                    "p95_ms": float(np.percentile(values, 95)),
+                    "max_ms": float(values.max()),
+                    "total_s": float(values.sum() / 1e3),
+                    "histogram": counts.tolist(),
+                }
+
+                stats = summary[stage][worker]
+                rows.append("%-12s %-10s %8d %10.2f %10.2f %10.2f %10.2f %10.2f" % (
+                    stage, worker, stats["count"], stats["mean_ms"], stats["p50_ms"], stats["p95_ms"], stats["max_ms"], stats["total_s"],
+                ))
+
+        table = "\n".join(rows)
+
+        with open(os.path.join(self.trace_dir, "summary.txt"), "w") as f:
+            f.write(table + "\n")
+
+        with open(os.path.join(self.trace_dir, "summary.json"), "w") as f:
+            json.dump({"histogram_edges_ms": HISTOGRAM_EDGES_MS, "stages": summary}, f, indent=2)
+
+        self._save_trace(events)
+
+        print("data pipeline profile, saved in %s\n%s" % (self.trace_dir, table))
+
+        return table
+
+    def _save_trace(self, events: List[list]) -> None:
+        """
+        the chrome trace, one row for one process.
+        """
+
+        trace_events = [
+            {"name": stage, "cat": "data", "ph": "X", "ts": start_ns / 1e3, "dur": duration_ns / 1e3, "pid": pid, "tid": worker}
+            for stage, worker, start_ns, duration_ns, pid in events
+        ]
+
+        with open(os.path.join(self.trace_dir, "trace.json"), "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+class _ProfiledContainer:
+    """
+    the pyav container, time the seek.
+    """
+
+    def __init__(self, container, profiler: PipelineProfiler) -> None:
+        self._wrapped = container
+        self._profiler = profiler
+        self.seek_ns = 0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._wrapped, name)
+
+    def seek(self, *args, **kwargs):
+        start_ns = time.time_ns()
+        result = self._wrapped.seek(*args, **kwargs)
+        duration_ns = time.time_ns() - start_ns
+
+        self.seek_ns += duration_ns
+        self._profiler.record("seek", start_ns, duration_ns)
+
+        return result
+
+
+class _ProfiledVideo:
+    """
+    the opened video, time the get_clip as the decode, without the seek.
+    """
+
+    def __init__(self, video, profiler: PipelineProfiler) -> None:
+        self._wrapped = video
+        self._profiler = profiler
+        self._container = None
+
+        if getattr(video, "_container", None) is not None:
+            self._container = _ProfiledContainer(video._container, profiler)
+            video._container = self._container
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._wrapped, name)
+
+    def get_clip(self, start_sec: float, end_sec: float) -> Dict[str, Optional[torch.Tensor]]:
+        seek_ns = self._container.seek_ns if self._container is not None else 0
+
+        start_ns = time.time_ns()
+        clip = self._wrapped.get_clip(start_sec, end_sec)
+        duration_ns = time.time_ns() - start_ns
+
+        # the decode is after the seek.
+        seek_ns = (self._container.seek_ns if self._container is not None else 0) - seek_ns
+        self._profiler.record("decode", start_ns + seek_ns, duration_ns - seek_ns)
+
+        return clip
+
+
+class ProfiledDecoder(VideoDecoder):
+    """
+    the decoder, time the open and the clip decode of the opened videos.
+    """
+
+    def __init__(self, decoder: VideoDecoder, profiler: PipelineProfiler) -> None:
+        self._decoder = decoder
+        self._profiler = profiler
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "_decoder":
+            raise AttributeError(name)
+        return getattr(self._decoder, name)
+
+    def add_video_info(self, video_info: Dict[str, Dict[str, Any]]) -> None:
+        self._decoder.add_video_info(video_info)
+
+    def _profile_open(self, open_fn: Callable, *args) -> _ProfiledVideo:
+        start_ns = time.time_ns()
+        video = open_fn(*args)
+        self._profiler.record("open", start_ns, time.time_ns() - start_ns)
+
+        return _ProfiledVideo(video, self._profiler)
+
+    def open(self, file_path: str) -> _ProfiledVideo:
+        return self._profile_open(self._decoder.open, file_path)
+
+    def open_bytes(self, data: bytes, name: str) -> _ProfiledVideo:
+        return self._profile_open(self._decoder.open_bytes, data, name)
+
+
+class ProfiledStage:
+    """
+    one transform, time the call as the stage.
+    """
+
+    def __init__(self, stage: str, transform: Callable, profiler: PipelineProfiler) -> None:
+        self.stage = stage
+        self.transform = transform
+        self._profiler = profiler
+
+    def __call__(self, x: Any) -> Any:
+        start_ns = time.time_ns()
+        x = self.transform(x)
+        self._profiler.record(self.stage, start_ns, time.time_ns() - start_ns)
+
+        return x
+
+
+def profile_transforms(transforms: List[Callable], profiler: Optional[PipelineProfiler]) -> List[Callable]:
+    """
+    wrap the transforms of the video transform, the stage name is from the transform class, or the lambda function name.
+
+    Args:
+        transforms (List[Callable]): the transforms of the Compose.
+        profiler (Optional[PipelineProfiler]): the profiler, None to return the transforms as it is.
+
+    Returns:
+        List[Callable]: the transforms.
+    """
+
+    if profiler is None:
+        return transforms
+
+    def stage_name(transform: Callable) -> str:
+        name = type(transform).__name__
+        if name in TRANSFORM_STAGES:
+            return TRANSFORM_STAGES[name]
+        return getattr(getattr(transform, "lambd", None), "__name__", name.lower())
+
+    return [ProfiledStage(stage_name(transform), transform, profiler) for transform in transforms]
+
+
+class ProfiledCollate:
+    """
+    the collate in the worker, time the collate and stamp the batch for the ipc time.
+    """
+
+    def __init__(self, profiler: PipelineProfiler, collate_fn: Optional[Callable[[List[Dict[str, Any]]], Dict[str, Any]]] = None) -> None:
+        self._profiler = profiler
+        self._collate_fn = collate_fn or default_collate
+
+    def __call__(self, samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+        start_ns = time.time_ns()
+        batch = self._collate_fn(samples)
+        end_ns = time.time_ns()
+
+        self._profiler.record("collate", start_ns, end_ns - start_ns)
+        batch[_COLLATE_END] = end_ns
+
+        # the worker can be stopped without the exit handler, write the events of every batch.
+        self._profiler.flush()
+
+        return batch
+
+
+class ProfiledDataLoader:
+    """
+    wrap the dataloader, time the ipc and the wait of the batches in the main process.
+    The other attributes are from the wrapped dataloader.
+    """
+
+    def __init__(self, dataloader: torch.utils.data.DataLoader, profiler: PipelineProfiler) -> None:
+        self.dataloader = dataloader
+        self._profiler = profiler
+
+    def __len__(self) -> int:
+        return len(self.dataloader)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "dataloader":
+            raise AttributeError(name)
+        return getattr(self.dataloader, name)
+
+    def __iter__(self) -> Iterator[Any]:
+        iterator = iter(self.dataloader)
+
+        while True:
+            start_ns = time.time_ns()
+
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                break
+
+            end_ns = time.time_ns()
+            self._profiler.record("wait", start_ns, end_ns - start_ns)
+
+            collate_end = batch.pop(_COLLATE_END, None)
+            if collate_end is not None:
+                self._profiler.record("ipc", collate_end, end_ns - collate_end)
+
+            yield batch
+
+        self._profiler.flush()
@@ -0,0 +1,78 @@
+"""
+the progressive resolution and frame number schedule of the train clips.
+
+The first epochs train with the small clips (e.g. 112 px, 4 frames), which are several times faster,
+and the clip grows linearly to the target img_size and frame number in the progressive epochs.
+The data module reload the train dataloader every epoch, and set the transform of the epoch to the ProgressiveTransform.
+"""
+
+from typing import Any, Callable, Dict, Tuple
+
+
+class ProgressiveSchedule:
+    """
+    the (img_size, frame number) of every epoch.
+    """
+
+    def __init__(
+        self,
+        epochs: int,
+        start_img_size: int,
+        start_frames: int,
+        img_size: int,
+        frames: int,
+        size_multiple: int = 16,
+    ) -> None:
+        """
+        Args:
+            epochs (int): the epochs to grow from the start to the target, 0 to train with the target from the first epoch.
+            start_img_size (int): the img size of the first epoch.
+            start_frames (int): the frame number of the first epoch.
+            img_size (int): the target img size.
+            frames (int): the target frame number.
+            size_multiple (int, optional): round the img size to the multiple, keep the feature map of the backbone stride. Defaults to 16.
+        """
+
+        if start_img_size > img_size or start_frames > frames:
+            raise ValueError(f"the start clip should not be larger than the target, get {start_img_size}x{start_frames} > {img_size}x{frames}")
+
+        self.epochs = epochs
+        self.start_img_size = start_img_size
+        self.start_frames = start_frames
+        self.img_size = img_size
+        self.frames = frames
+        self.size_multiple = size_multiple
+
+    def at(self, epoch: int) -> Tuple[int, int]:
+        """
+        Args:
+            epoch (int): the current epoch, from 0.
+
+        Returns:
+            Tuple[int, int]: the img size and the frame number of the epoch.
+        """
+
+        if self.epochs <= 0 or epoch >= self.epochs:
+            return self.img_size, self.frames
+
+        ratio = epoch / self.epochs
+
+        img_size = self.start_img_size + (self.img_size - self.start_img_size) * ratio
+        img_size = min(max(round(img_size / self.size_multiple) * self.size_multiple, self.size_multiple), self.img_size)
+
+        frames = round(self.start_frames + (self.frames - self.start_frames) * ratio)
+
+        return img_size, frames
+
+
+class ProgressiveTransform:
+    """
+    the transform of the train dataset, replaced by the data module at the epoch start.
+    The dataloader workers copy the dataset when the dataloader is reloaded, so they get the transform of the epoch.
+    """
+
+    def __init__(self, transform: Callable[[Dict[str, Any]], Dict[str, Any]]) -> None:
+        self.transform = transform
+
+    def __call__(self, x: Dict[str, Any]) -> Dict[str, Any]:
+        return self.transform(x)
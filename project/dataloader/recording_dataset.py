@@ -0,0 +1,359 @@
+"""
+the streaming walk dataset on the full AP/LAT recordings, without the intermediate segment videos.
+
+The person boxes of every frame are detected once by new_prepare_video/cache_boxes.py and saved next to the recordings:
+    recording_path/class/person/full_ap.mp4
+    recording_path/class/person/full_lat.mp4
+    recording_path/class/person/full_boxes.npz  {"ap": [N, 5], "lat": [N, 5], "fps": float}, x1, y1, x2, y2, conf, nan when not detected.
+
+The walk direction segmentation and the person crop are same as the split_cropfor*.py,
+but done on the fly: the segments and the clip frames are planned from the boxes first,
+then the two recordings are decoded once in order, and only the frames of the clips are cropped.
+"""
+
+import json
+import logging
+import os
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Type
+
+import av
+import cv2
+import numpy as np
+import torch
+from pytorchvideo.data.utils import MultiProcessSampler
+
+from dataloader.clip_index import uniform_clip_num
+from dataloader.paired_dataset import shuffle_buffer
+
+logger = logging.getLogger(__name__)
+
+RECORDING_AP = "full_ap.mp4"
+RECORDING_LAT = "full_lat.mp4"
+BOXES_FILE = "full_boxes.npz"
+
+
+class Recording(NamedTuple):
+    """
+    one pair of the full recordings.
+
+    Args:
+        ap_path (str): the full ap recording path.
+        lat_path (str): the full lat recording path.
+        boxes_path (str): the cached person boxes.
+        label (int): the class index, follow the sorted class folder name.
+        name (str): class/person.
+    """
+
+    ap_path: str
+    lat_path: str
+    boxes_path: str
+    label: int
+    name: str
+
+
+def make_recordings(recording_path: str, persons: Optional[Set[Tuple[str, str]]] = None) -> List[Recording]:
+    """
+    find the recordings with the cached boxes under recording_path/class/person.
+
+    Args:
+        recording_path (str): the recording folder.
+        persons (Optional[Set[Tuple[str, str]]], optional): only the (class, person) in the set, None for all. Defaults to None.
+
+    Returns:
+        List[Recording]: the recordings, the recording without the boxes is skipped.
+    """
+
+    classes = sorted(f.name for f in os.scandir(recording_path) if f.is_dir())
+    recordings = []
+
+    for label, class_name in enumerate(classes):
+        for person in sorted(os.listdir(os.path.join(recording_path, class_name))):
+            if persons is not None and (class_name, person) not in persons:
+                continue
+
+            person_path = os.path.join(recording_path, class_name, person)
+            ap_path = os.path.join(person_path, RECORDING_AP)
+            lat_path = os.path.join(person_path, RECORDING_LAT)
+            boxes_path = os.path.join(person_path, BOXES_FILE)
+
+            if not (os.path.isfile(ap_path) and os.path.isfile(lat_path)):
+                continue
+
+            if not os.path.isfile(boxes_path):
+                logger.warning("skip %s/%s, run cache_boxes.py first.", class_name, person)
+                continue
+
+            recordings.append(Recording(ap_path, lat_path, boxes_path, label, class_name + "/" + person))
+
+    return recordings
+
+
+def load_split_persons(split_json: str, fold: str, split: str) -> Set[Tuple[str, str]]:
+    """
+    the (class, person) of the fold split, from the split_results.json used by make_dataset_by_json.py.
+
+    Args:
+        split_json (str): the split json, {"Split_1": {"train_data": [{"category", "person_id"}], "valid_data": [...]}}
+        fold (str): the fold folder name, fold_1.
+        split (str): "train" or "val".
+
+    Returns:
+        Set[Tuple[str, str]]: the persons.
+    """
+
+    with open(split_json, "r") as f:
+        splits = json.load(f)
+
+    split_data = splits["Split_" + fold.split("_")[-1]]["train_data" if split == "train" else "valid_data"]
+
+    return {(person["category"], person["person_id"]) for person in split_data}
+
+
+def crop_and_resize(frame: np.ndarray, box: np.ndarray, img_size: int) -> np.ndarray:
+    """
+    crop the person, keep the aspect ratio and pad to the square with black, same as the split_cropfor*.py.
+
+    Args:
+        frame (np.ndarray): h, w, c uint8.
+        box (np.ndarray): x1, y1, x2, y2, conf.
+        img_size (int): the output size.
+
+    Returns:
+        np.ndarray: img_size, img_size, c uint8.
+    """
+
+    x1, y1, x2, y2 = (int(v) for v in box[:4])
+    cropped = frame[max(y1, 0):y2, max(x1, 0):x2]
+
+    height, width = cropped.shape[:2]
+    new_height = img_size
+    new_width = min(int(width / height * new_height), img_size)
+
+    resized = cv2.resize(cropped, (new_width, new_height))
+
+    final_frame = np.zeros((img_size, img_size, frame.shape[2]), dtype=np.uint8)
+    x_offset = (img_size - new_width) // 2
+    final_frame[:, x_offset:x_offset + new_width] = resized
+
+    return final_frame
+
+
+def segment_walk_directions(lat_boxes: np.ndarray, ap_boxes: np.ndarray, history_size: int = 10, min_frames: int = 50) -> List[List[int]]:
+    """
+    split the recording by the walk direction, same as the split_cropfor*.py.
+    The frame without the person in either view is skipped, the direction is the move of the lat x1 in the last history_size frames,
+    and a new segment starts when the direction changed. The segment shorter than min_frames is dropped.
+
+    Args:
+        lat_boxes (np.ndarray): [N, 5] the lat boxes, nan when not detected.
+        ap_boxes (np.ndarray): [N, 5] the ap boxes, nan when not detected.
+        history_size (int, optional): the direction history. Defaults to 10.
+        min_frames (int, optional): the min frame number of one segment. Defaults to 50.
+
+    Returns:
+        List[List[int]]: the frame indices of every segment.
+    """
+
+    segments = []
+    current = None
+    direction = None
+    history = deque(maxlen=history_size)
+
+    for frame_index in range(min(len(lat_boxes), len(ap_boxes))):
+        if np.isnan(lat_boxes[frame_index, 0]) or np.isnan(ap_boxes[frame_index, 0]):
+            continue
+
+        history.append(lat_boxes[frame_index, 0])
+
+        if len(history) == history_size:
+            new_direction = "right" if history[-1] - history[0] > 0 else "left"
+
+            if direction != new_direction:
+                if current is not None and len(current) >= min_frames:
+                    segments.append(current)
+
+                current = []
+                direction = new_direction
+
+        if current is not None:
+            current.append(frame_index)
+
+    if current is not None and len(current) >= min_frames:
+        segments.append(current)
+
+    return segments
+
+
+class WalkRecordingDataset(torch.utils.data.IterableDataset):
+    """
+    the iterable paired walk dataset on the full recordings.
+    Yield the same sample as the PairedWalkDataset, the name is class/person/segmentN.
+    """
+
+    def __init__(
+        self,
+        recordings: List[Recording],
+        clip_duration: float,
+        num_samples: int,
+        img_size: int,
+        transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        video_sampler: Type[torch.utils.data.Sampler] = torch.utils.data.SequentialSampler,
+        shuffle_window: int = 0,
+        history_size: int = 10,
+        min_frames: int = 50,
+    ) -> None:
+        """
+        Args:
+            recordings (List[Recording]): the recordings from make_recordings.
+            clip_duration (float): the clip duration of the uniform clips in the segment.
+            num_samples (int): the frame number of one clip.
+            img_size (int): the person crop size.
+            transform (Optional[Callable[[Dict[str, Any]], Dict[str, Any]]], optional): This callable is evaluated on the paired clip output before the clip is returned. Defaults to None.
+            video_sampler (Type[torch.utils.data.Sampler], optional): Sampler for the recording index. Defaults to torch.utils.data.SequentialSampler.
+            shuffle_window (int, optional): shuffle the clips within a window of this size. 0 to keep the order. Defaults to 0.
+            history_size (int, optional): the walk direction history. Defaults to 10.
+            min_frames (int, optional): the min frame number of one segment. Defaults to 50.
+        """
+
+        self._recordings = recordings
+        self._clip_duration = clip_duration
+        self._num_samples = num_samples
+        self._img_size = img_size
+        self._transform = transform
+        self._shuffle_window = shuffle_window
+        self._history_size = history_size
+        self._min_frames = min_frames
+
+        # the RandomSampler need a generator, to keep the same order in the different workers.
+        if video_sampler == torch.utils.data.RandomSampler:
+            self._video_random_generator = torch.Generator()
+            self._video_sampler = video_sampler(self._recordings, generator=self._video_random_generator)
+        else:
+            self._video_random_generator = None
+            self._video_sampler = video_sampler(self._recordings)
+
+    @property
+    def num_recordings(self) -> int:
+        return len(self._recordings)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """
+        shard the recording index across the dataloader workers, and yield the clips of every recording.
+        """
+
+        worker_info = torch.utils.data.get_worker_info()
+        if self._video_random_generator is not None and worker_info is not None:
+            base_seed = worker_info.seed - worker_info.id
+            self._video_random_generator.manual_seed(base_seed)
+
+        yield from shuffle_buffer(self._iter_recordings(), self._shuffle_window)
+
+    def _iter_recordings(self) -> Iterator[Dict[str, Any]]:
+        for recording_index in MultiProcessSampler(self._video_sampler):
+            yield from self._iter_clips(self._recordings[recording_index])
+
+    def _plan_clips(self, segments: List[List[int]], fps: float) -> Tuple[Dict[int, List[Tuple[Tuple[int, int], int]]], Dict[Tuple[int, int], int]]:
+        """
+        the uniform clips of the segments, and the subsampled frames of every clip.
+
+        Returns:
+            Tuple: {frame_index: [((segment_id, clip_index), slot)]}, and {(segment_id, clip_index): frame number}.
+        """
+
+        clip_frames = max(1, round(self._clip_duration * fps))
+        needed_frames, clip_sizes = {}, {}
+
+        for segment_id, segment in enumerate(segments):
+            for clip_index in range(uniform_clip_num(len(segment) / fps, self._clip_duration)):
+                clip = segment[clip_index * clip_frames: (clip_index + 1) * clip_frames]
+
+                # same as the uniform_temporal_subsample.
+                slots = torch.linspace(0, len(clip) - 1, self._num_samples).long().tolist()
+
+                for slot, i in enumerate(slots):
+                    needed_frames.setdefault(clip[i], []).append(((segment_id, clip_index), slot))
+
+                clip_sizes[(segment_id, clip_index)] = len(slots)
+
+        return needed_frames, clip_sizes
+
+    def _iter_clips(self, recording: Recording) -> Iterator[Dict[str, Any]]:
+        """
+        decode the two recordings once in order, and yield the clip when all its frames are cropped.
+
+        Args:
+            recording (Recording): the recording.
+
+        Yields:
+            Dict[str, Any]: the paired clip.
+        """
+
+        boxes = np.load(recording.boxes_path)
+        ap_boxes, lat_boxes, fps = boxes["ap"], boxes["lat"], float(boxes["fps"])
+
+        segments = segment_walk_directions(lat_boxes, ap_boxes, self._history_size, self._min_frames)
+        needed_frames, clip_sizes = self._plan_clips(segments, fps)
+
+        if not needed_frames:
+            return
+
+        last_frame = max(needed_frames)
+        clips: Dict[Tuple[int, int], Dict[str, Any]] = {}
+
+        ap_container = None
+
+        try:
+            ap_container = av.open(recording.ap_path)
+            lat_container = av.open(recording.lat_path)
+        except Exception as e:
+            logger.debug("Failed to load recording %s with error: %s", recording.name, e)
+
+            # the lat open failed, close the opened ap recording.
+            if ap_container is not None:
+                ap_container.close()
+            return
+
+        try:
+            for container in (ap_container, lat_container):
+                container.streams.video[0].thread_type = "AUTO"
+
+            frame_pairs = zip(ap_container.decode(video=0), lat_container.decode(video=0))
+
+            for frame_index, (ap_frame, lat_frame) in enumerate(frame_pairs):
+                if frame_index > last_frame:
+                    break
+                if frame_index not in needed_frames:
+                    continue
+
+                ap_crop = crop_and_resize(ap_frame.to_ndarray(format="rgb24"), ap_boxes[frame_index], self._img_size)
+                lat_crop = crop_and_resize(lat_frame.to_ndarray(format="rgb24"), lat_boxes[frame_index], self._img_size)
+
+                for clip_key, slot in needed_frames[frame_index]:
+                    clip = clips.setdefault(clip_key, {"ap": {}, "lat": {}})
+                    clip["ap"][slot] = ap_crop
+                    clip["lat"][slot] = lat_crop
+
+                    if len(clip["ap"]) == clip_sizes[clip_key]:
+                        del clips[clip_key]
+                        yield self._make_sample(recording, clip_key, clip)
+
+        except av.error.FFmpegError as e:
+            logger.debug("Failed to decode recording %s with error: %s", recording.name, e)
+        finally:
+            ap_container.close()
+            lat_container.close()
+
+    def _make_sample(self, recording: Recording, clip_key: Tuple[int, int], clip: Dict[str, Dict[int, np.ndarray]]) -> Dict[str, Any]:
+        segment_id, clip_index = clip_key
+
+        sample_dict = {"label": recording.label, "name": "%s/segment%d" % (recording.name, segment_id), "clip_index": clip_index}
+
+        for view in ("ap", "lat"):
+            frames = np.stack([clip[view][slot] for slot in range(len(clip[view]))])
+            sample_dict[view] = torch.from_numpy(frames).permute(3, 0, 1, 2) # t, h, w, c > c, t, h, w
+
+        if self._transform is not None:
+            sample_dict = self._transform(sample_dict)
+
+        return sample_dict
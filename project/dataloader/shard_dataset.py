@@ -0,0 +1,295 @@
+"""
+the tar shards of the paired walk dataset, and the streaming dataset on them.
+
+One shard is a plain tar file (the webdataset layout), the files of one sample are next to each other:
+    000000.ap.mp4   the ap view video
+    000000.lat.mp4  the lat view video
+    000000.json     {"label": int, "name": the relative path under the split folder}
+
+The index.json in the split folder has the shard list, the sample number and the classes.
+The streaming dataset read the shards one by one with the sequential read,
+so the small video files are never opened on the network filesystem. see pack_shards.py.
+"""
+
+import io
+import json
+import logging
+import os
+import random
+import tarfile
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+import torch
+
+from dataloader.clip_index import uniform_clip_num
+from dataloader.decoders import VideoDecoder, make_decoder
+from dataloader.paired_dataset import VideoPair, decode_paired_clip, shuffle_buffer
+
+logger = logging.getLogger(__name__)
+
+SHARD_INDEX = "index.json"
+SHARD_NAME = "shard-%06d.tar"
+
+
+def _add_bytes(tar: tarfile.TarFile, arcname: str, data: bytes) -> None:
+    tar_info = tarfile.TarInfo(arcname)
+    tar_info.size = len(data)
+    tar.addfile(tar_info, io.BytesIO(data))
+
+
+def write_shards(
+    paired_video_paths: List[VideoPair],
+    output_path: str,
+    classes: List[str],
+    max_shard_bytes: int = 1 << 30,
+    seed: int = 42,
+    min_shards: int = 1,
+) -> Dict[str, Any]:
+    """
+    write the paired videos of one split into the tar shards.
+    The samples are shuffled once before packing, so one shard has the samples of all the classes and patients,
+    then a small shuffle buffer is enough when streaming.
+
+    Args:
+        paired_video_paths (List[VideoPair]): the paired video list of the split.
+        output_path (str): the split folder of the shards.
+        classes (List[str]): the class names, the index is the label.
+        max_shard_bytes (int, optional): start a new shard after the shard is larger than this. Defaults to 1 << 30.
+        seed (int, optional): the seed of the pack order. Defaults to 42.
+        min_shards (int, optional): split the split bytes evenly into at least this many shards, so every dataloader worker has its shards. Defaults to 1.
+
+    Returns:
+        Dict[str, Any]: the shard index, also saved to output_path/index.json.
+    """
+
+    os.makedirs(output_path, exist_ok=True)
+
+    video_pairs = list(paired_video_paths)
+    random.Random(seed).shuffle(video_pairs)
+
+    # the even byte boundaries of the min_shards shards.
+    split_bytes = sum(os.path.getsize(video_pair.ap_path) + os.path.getsize(video_pair.lat_path) for video_pair in video_pairs)
+    written_bytes = 0
+
+    shards = []
+    tar, tmp_path, shard_bytes, shard_samples = None, None, 0, 0
+
+    def close_shard():
+        tar.close()
+        shard_name = SHARD_NAME % len(shards)
+        os.replace(tmp_path, os.path.join(output_path, shard_name))
+        shards.append({"name": shard_name, "samples": shard_samples, "bytes": shard_bytes})
+
+    for sample_index, video_pair in enumerate(video_pairs):
+        if tar is None:
+            tmp_path = os.path.join(output_path, (SHARD_NAME % len(shards)) + ".tmp")
+            tar = tarfile.open(tmp_path, "w")
+            shard_bytes, shard_samples = 0, 0
+
+        key = "%06d" % sample_index
+
+        for view, video_path in (("ap", video_pair.ap_path), ("lat", video_pair.lat_path)):
+            tar.add(video_path, arcname="%s.%s%s" % (key, view, os.path.splitext(video_path)[1].lower()))
+            shard_bytes += os.path.getsize(video_path)
+            written_bytes += os.path.getsize(video_path)
+
+        _add_bytes(tar, key + ".json", json.dumps({"label": video_pair.label, "name": video_pair.name}).encode("utf-8"))
+        shard_samples += 1
+
+        if shard_bytes >= max_shard_bytes or written_bytes >= split_bytes * (len(shards) + 1) / min_shards:
+            close_shard()
+            tar = None
+
+    if tar is not None:
+        close_shard()
+
+    shard_index = {"classes": classes, "samples": len(video_pairs), "shards": shards}
+
+    with open(os.path.join(output_path, SHARD_INDEX), "w") as f:
+        json.dump(shard_index, f, indent=4)
+
+    return shard_index
+
+
+def read_shard_paths(shard_path: str) -> List[str]:
+    """
+    the shard files of the split, from the index.json.
+
+    Args:
+        shard_path (str): the split folder of the shards.
+
+    Returns:
+        List[str]: the shard file paths.
+    """
+
+    with open(os.path.join(shard_path, SHARD_INDEX), "r") as f:
+        shard_index = json.load(f)
+
+    return [os.path.join(shard_path, shard["name"]) for shard in shard_index["shards"]]
+
+
+def iter_tar_samples(tar_path: str) -> Iterator[Dict[str, bytes]]:
+    """
+    read the tar as a stream, and group the consecutive members with the same key into one sample.
+
+    Args:
+        tar_path (str): the shard file path.
+
+    Yields:
+        Dict[str, bytes]: {"__key__": key, "ap.mp4": bytes, "lat.mp4": bytes, "json": bytes}
+    """
+
+    sample = {}
+
+    # "r|" read the tar in order, without the seek.
+    with tarfile.open(tar_path, mode="r|") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+
+            key, suffix = member.name.split(".", 1)
+
+            if sample and sample["__key__"] != key:
+                yield sample
+                sample = {}
+
+            sample["__key__"] = key
+            sample[suffix] = tar.extractfile(member).read()
+
+    if sample:
+        yield sample
+
+
+def _find_view(sample: Dict[str, bytes], view: str) -> Optional[str]:
+    for suffix in sample:
+        if suffix.startswith(view + "."):
+            return suffix
+    return None
+
+
+class WalkShardDataset(torch.utils.data.IterableDataset):
+    """
+    the streaming paired walk dataset on the tar shards.
+    The shards are split to the dataloader workers, every worker read its shards in order,
+    and yield the uniform clips of the samples, same as the PairedWalkDataset.
+    """
+
+    def __init__(
+        self,
+        shard_paths: List[str],
+        clip_duration: float,
+        transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+        decoder: Union[str, VideoDecoder] = "pyav",
+        shuffle_shards: bool = False,
+        shuffle_window: int = 0,
+    ) -> None:
+        """
+        Args:
+            shard_paths (List[str]): the shard file paths.
+            clip_duration (float): the clip duration of the uniform clips.
+            transform (Optional[Callable[[Dict[str, Any]], Dict[str, Any]]], optional): This callable is evaluated on the paired clip output before the clip is returned. Defaults to None.
+            decoder (Union[str, VideoDecoder], optional): the decoder which can open the video in memory. Defaults to "pyav".
+            shuffle_shards (bool, optional): shuffle the shard order every epoch. Defaults to False.
+            shuffle_window (int, optional): shuffle the clips within a window of this size. 0 to keep the order. Defaults to 0.
+        """
+
+        self._shard_paths = shard_paths
+        self._clip_duration = clip_duration
+        self._transform = transform
+        self._decoder = make_decoder(decoder) if isinstance(decoder, str) else decoder
+        self._shuffle_shards = shuffle_shards
+        self._shuffle_window = shuffle_window
+
+    @property
+    def num_shards(self) -> int:
+        return len(self._shard_paths)
+
+    def _worker_shards(self) -> List[str]:
+        """
+        the shards of this worker, the shard order is shuffled with the same seed in all the workers of one epoch.
+        """
+
+        shard_paths = list(self._shard_paths)
+        worker_info = torch.utils.data.get_worker_info()
+
+        if worker_info is None:
+            base_seed, worker_id, num_workers = torch.initial_seed(), 0, 1
+        else:
+            base_seed, worker_id, num_workers = worker_info.seed - worker_info.id, worker_info.id, worker_info.num_workers
+
+        if self._shuffle_shards:
+            random.Random(base_seed).shuffle(shard_paths)
+
+        if len(shard_paths) < num_workers:
+            logger.warning("%d shards for %d workers, some workers are idle, pack with pack_shards.py --min_shards.", len(shard_paths), num_workers)
+
+        return shard_paths[worker_id::num_workers]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        yield from shuffle_buffer(self._iter_shards(), self._shuffle_window)
+
+    def _iter_shards(self) -> Iterator[Dict[str, Any]]:
+        for shard_path in self._worker_shards():
+            for sample in iter_tar_samples(shard_path):
+                yield from self._iter_clips(shard_path, sample)
+
+    def _iter_clips(self, shard_path: str, sample: Dict[str, bytes]) -> Iterator[Dict[str, Any]]:
+        """
+        decode the uniform clips of one sample from the video bytes.
+
+        Args:
+            shard_path (str): the shard file path, for the video name.
+            sample (Dict[str, bytes]): the sample from iter_tar_samples.
+
+        Yields:
+            Dict[str, Any]: the paired clip.
+        """
+
+        ap_suffix, lat_suffix = _find_view(sample, "ap"), _find_view(sample, "lat")
+
+        if ap_suffix is None or lat_suffix is None or "json" not in sample:
+            logger.warning("skip the broken sample %s in %s", sample["__key__"], shard_path)
+            return
+
+        meta = json.loads(sample["json"])
+        video_pair = VideoPair(
+            "%s/%s.%s" % (shard_path, sample["__key__"], ap_suffix),
+            "%s/%s.%s" % (shard_path, sample["__key__"], lat_suffix),
+            meta["label"],
+            meta["name"],
+        )
+
+        ap_video = None
+
+        try:
+            ap_video = self._decoder.open_bytes(sample[ap_suffix], video_pair.ap_path)
+            lat_video = self._decoder.open_bytes(sample[lat_suffix], video_pair.lat_path)
+        except NotImplementedError:
+            raise
+        except Exception as e:
+            logger.debug("Failed to load video pair %s with error: %s", video_pair.name, e)
+
+            # the lat open failed, close the opened ap video.
+            if ap_video is not None:
+                ap_video.close()
+            return
+
+        try:
+            duration = min(ap_video.duration, lat_video.duration)
+
+            for clip_index in range(uniform_clip_num(float(duration), self._clip_duration)):
+                sample_dict = decode_paired_clip(
+                    ap_video,
+                    lat_video,
+                    video_pair,
+                    clip_index * self._clip_duration,
+                    (clip_index + 1) * self._clip_duration,
+                    clip_index,
+                    self._transform,
+                )
+
+                if sample_dict is not None:
+                    yield sample_dict
+        finally:
+            ap_video.close()
+            lat_video.close()
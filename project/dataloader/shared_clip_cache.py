@@ -0,0 +1,414 @@
+"""
+process-wide shared-memory cache of the decoded walk clips.
+
+The clips of one video pair are stored as one uint8 shared-memory segment, shape [clip_num, 2 (ap, lat), t, c, h, w],
+same as the shard of the on-disk ClipCache. The segment index and the LRU order are kept in a Manager server,
+so all the dataloader workers attach to the same segments, and the total size is kept under the byte budget.
+
+The cache is made once in the main process by get_shared_clip_cache, and survive across the data modules of the CV folds.
+The key is made of the relative video name, the file size and mtime, not the fold path,
+so the same patient video in the train split of the next fold hit the cache.
+"""
+
+import atexit
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+import torch
+
+from dataloader.clip_cache import file_lock, to_uint8
+from dataloader.paired_dataset import VideoPair
+
+if TYPE_CHECKING:
+    from dataloader.clip_cache import ClipCache
+
+logger = logging.getLogger(__name__)
+
+# the shared-memory segment name prefix, /dev/shm/walkclip_<key>
+SEGMENT_PREFIX = "walkclip_"
+
+# the segments attached in one worker at the same time.
+MAX_ATTACHED_SEGMENTS = 64
+
+
+def _untrack(segment: SharedMemory) -> None:
+    """
+    the resource tracker unlink the segment when the process which made or attached it exit,
+    but the segment is owned by the cache index, so remove it from the tracker.
+    """
+    try:
+        resource_tracker.unregister(segment._name, "shared_memory")
+    except Exception as e:
+        logger.debug("Failed to unregister the segment %s: %s", segment.name, e)
+
+
+class SharedMemoryClipCache:
+    """
+    the shared-memory clip cache, with the same load and save as the ClipCache.
+
+    When the backing on-disk ClipCache is given, the shard loaded from the disk is also put into the shared memory,
+    and the saved clips are also written to the disk.
+    """
+
+    def __init__(
+        self,
+        byte_budget: int,
+        clip_duration: float,
+        uniform_temporal_subsample_num: int,
+        img_size: int,
+        backing: Optional["ClipCache"] = None,
+        decoder: str = "pyav",
+        decode_resize: bool = False,
+    ) -> None:
+        """
+        Args:
+            byte_budget (int): the max total bytes of the segments, the least recently used segments are evicted.
+            clip_duration (float): clip duration for the video.
+            uniform_temporal_subsample_num (int): num frame from the clip duration.
+            img_size (int): the image size after resize.
+            decoder (str, optional): the decoder name in DECODERS. Defaults to "pyav".
+            decode_resize (bool, optional): the frames are scaled during decode. Defaults to False.
+            backing (Optional[ClipCache], optional): the on-disk clip cache under the shared memory. Defaults to None.
+        """
+
+        self.byte_budget = byte_budget
+        self.clip_duration = clip_duration
+        self.uniform_temporal_subsample_num = uniform_temporal_subsample_num
+        self.img_size = img_size
+        self.decoder = decoder
+        self.decode_resize = decode_resize
+        self.backing = backing
+
+        # the manager server keep the index, the proxies can be sent to the workers.
+        self._manager = multiprocessing.Manager()
+        # {key: (segment_name, nbytes, shape)}
+        self._index = self._manager.dict()
+        # {key: last used time}, the monotonic clock is same in all the processes.
+        self._last_used = self._manager.dict()
+        self._stats = self._manager.dict(hits=0, misses=0, evictions=0, nbytes=0)
+        self._lock = self._manager.Lock()
+
+        self._owner_pid = os.getpid()
+        self._attached: "OrderedDict[str, SharedMemory]" = OrderedDict()
+
+        atexit.register(self.close)
+
+    def __getstate__(self):
+        # the manager and the attached segments stay in this process.
+        state = self.__dict__.copy()
+        state["_manager"] = None
+        state["_attached"] = OrderedDict()
+        return state
+
+    def matches(
+        self,
+        clip_duration: float,
+        uniform_temporal_subsample_num: int,
+        img_size: int,
+        backing: Optional["ClipCache"],
+        decoder: str = "pyav",
+        decode_resize: bool = False,
+    ) -> bool:
+        """
+        if the cache is made with the same clip parameters and decoder.
+        """
+        return (
+            (self.clip_duration, self.uniform_temporal_subsample_num, self.img_size) == (clip_duration, uniform_temporal_subsample_num, img_size)
+            and (self.decoder, self.decode_resize) == (decoder, decode_resize)
+            and (self.backing is None) == (backing is None)
+            and (backing is None or self.backing.cache_dir == backing.cache_dir)
+        )
+
+    def key(self, video_pair: VideoPair) -> str:
+        """
+        make the cache key of the video pair, not depend on the fold folder.
+
+        Args:
+            video_pair (VideoPair): the video pair.
+
+        Returns:
+            str: the sha1 hex digest of the video name, size, mtime, clip parameters and decoder.
+        """
+
+        ap_stat = os.stat(video_pair.ap_path)
+        lat_stat = os.stat(video_pair.lat_path)
+
+        key_items = [
+            video_pair.name,
+            str(ap_stat.st_size),
+            str(ap_stat.st_mtime_ns),
+            str(lat_stat.st_size),
+            str(lat_stat.st_mtime_ns),
+            str(self.clip_duration),
+            str(self.uniform_temporal_subsample_num),
+            str(self.img_size),
+            self.decoder,
+            str(self.decode_resize),
+        ]
+
+        return hashlib.sha1("|".join(key_items).encode("utf-8")).hexdigest()
+
+    def _touch(self, key: str) -> None:
+        self._last_used[key] = time.monotonic_ns()
+
+    def _attach(self, key: str, segment_name: str) -> Optional[SharedMemory]:
+        """
+        attach the segment in this process, keep the recent MAX_ATTACHED_SEGMENTS segments.
+
+        Returns:
+            Optional[SharedMemory]: the segment, None when it has been evicted.
+        """
+
+        segment = self._attached.get(key)
+
+        if segment is not None and segment.name == segment_name:
+            self._attached.move_to_end(key)
+            return segment
+
+        try:
+            segment = SharedMemory(name=segment_name)
+        except FileNotFoundError:
+            return None
+
+        _untrack(segment)
+        self._attached[key] = segment
+
+        while len(self._attached) > MAX_ATTACHED_SEGMENTS:
+            _, old_segment = self._attached.popitem(last=False)
+            try:
+                old_segment.close()
+            except BufferError:
+                # the clip array is still used, the segment is closed when it is freed.
+                pass
+
+        return segment
+
+    def build_lock(self, video_pair: VideoPair):
+        """
+        the lock of the clip build, the lock of the backing disk cache, or a lock file in the temp folder.
+        """
+
+        if self.backing is not None:
+            return self.backing.build_lock(video_pair)
+
+        return file_lock(os.path.join(tempfile.gettempdir(), SEGMENT_PREFIX + self.key(video_pair) + ".lock"))
+
+    def load(self, video_pair: VideoPair) -> Optional[np.ndarray]:
+        """
+        load the clips of the video pair from the shared memory, or from the backing disk cache.
+
+        Args:
+            video_pair (VideoPair): the video pair.
+
+        Returns:
+            Optional[np.ndarray]: the uint8 shard, [clip_num, 2, t, c, h, w], None when not cached.
+        """
+
+        key = self.key(video_pair)
+        entry = self._index.get(key)
+
+        if entry is not None:
+            segment_name, _, shape = entry
+            segment = self._attach(key, segment_name)
+
+            if segment is not None:
+                self._touch(key)
+                self._increase("hits")
+                return np.ndarray(shape, dtype=np.uint8, buffer=segment.buf)
+
+        self._increase("misses")
+
+        if self.backing is None:
+            return None
+
+        shard = self.backing.load(video_pair)
+
+        if shard is not None:
+            self._put(key, np.asarray(shard))
+
+        return shard
+
+    def save(self, video_pair: VideoPair, ap_clips: List[torch.Tensor], lat_clips: List[torch.Tensor]) -> None:
+        """
+        save all the clips of the video pair into one segment, and to the backing disk cache.
+
+        Args:
+            video_pair (VideoPair): the video pair.
+            ap_clips (List[torch.Tensor]): the ap clips after transform, t, c, h, w.
+            lat_clips (List[torch.Tensor]): the lat clips after transform, t, c, h, w.
+        """
+
+        if len(ap_clips) == 0:
+            return
+
+        if self.backing is not None:
+            self.backing.save(video_pair, ap_clips, lat_clips)
+
+        shard = np.stack([
+            np.stack([to_uint8(ap_clip).numpy(), to_uint8(lat_clip).numpy()])
+            for ap_clip, lat_clip in zip(ap_clips, lat_clips)
+        ])
+
+        self._put(self.key(video_pair), shard)
+
+    def _put(self, key: str, shard: np.ndarray) -> None:
+        """
+        copy the shard into a new segment, then add it to the index after evict the LRU segments.
+        The segment is full written before it is in the index, so the other workers never read a half segment.
+        """
+
+        nbytes = shard.nbytes
+
+        if nbytes > self.byte_budget or key in self._index:
+            return
+
+        try:
+            segment = SharedMemory(name=SEGMENT_PREFIX + key, create=True, size=nbytes)
+        except FileExistsError:
+            # the other worker is writing the same video.
+            return
+        except OSError as e:
+            logger.warning("Failed to create the shared clip segment, /dev/shm may be full: %s", e)
+            return
+
+        _untrack(segment)
+
+        np.ndarray(shard.shape, dtype=np.uint8, buffer=segment.buf)[:] = shard
+
+        with self._lock:
+            self._evict(nbytes)
+
+            self._index[key] = (segment.name, nbytes, tuple(shard.shape))
+            self._stats["nbytes"] = self._stats["nbytes"] + nbytes
+            self._touch(key)
+
+        segment.close()
+
+    def _evict(self, nbytes: int) -> None:
+        """
+        unlink the least recently used segments until the new segment fit the budget, call with the lock.
+        """
+
+        total = self._stats["nbytes"]
+
+        if total + nbytes <= self.byte_budget:
+            return
+
+        last_used = dict(self._last_used)
+
+        for key in sorted(self._index.keys(), key=lambda key: last_used.get(key, 0)):
+            if total + nbytes <= self.byte_budget:
+                break
+
+            segment_name, segment_nbytes, _ = self._index.pop(key)
+            self._last_used.pop(key, None)
+            _unlink(segment_name)
+
+            total -= segment_nbytes
+            self._stats["evictions"] = self._stats["evictions"] + 1
+
+        self._stats["nbytes"] = total
+
+    def _increase(self, name: str) -> None:
+        # without the lock, the hits and misses are approximate.
+        self._stats[name] = self._stats[name] + 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: hits, misses, evictions, nbytes and segments.
+        """
+        stats = dict(self._stats)
+        stats["segments"] = len(self._index)
+        return stats
+
+    def close(self) -> None:
+        """
+        unlink all the segments and stop the manager, only in the process which made the cache.
+        """
+
+        if os.getpid() != self._owner_pid or self._manager is None:
+            return
+
+        for segment in self._attached.values():
+            try:
+                segment.close()
+            except BufferError:
+                pass
+        self._attached.clear()
+
+        try:
+            for segment_name, _, _ in self._index.values():
+                _unlink(segment_name)
+        except (OSError, EOFError) as e:
+            logger.debug("the cache manager has been stopped: %s", e)
+
+        self._manager.shutdown()
+        self._manager = None
+
+
+def _unlink(segment_name: str) -> None:
+    """
+    unlink the segment, the workers which still attach it keep the memory until they close it.
+    """
+    try:
+        segment = SharedMemory(name=segment_name)
+    except FileNotFoundError:
+        return
+
+    _untrack(segment)
+    segment.close()
+    segment.unlink()
+
+
+# the cache of this process, shared by the data modules of all the folds.
+_SHARED_CLIP_CACHE: Optional[SharedMemoryClipCache] = None
+
+
+def get_shared_clip_cache(
+    byte_budget: int,
+    clip_duration: float,
+    uniform_temporal_subsample_num: int,
+    img_size: int,
+    backing: Optional["ClipCache"] = None,
+    decoder: str = "pyav",
+    decode_resize: bool = False,
+) -> SharedMemoryClipCache:
+    """
+    get the process-wide shared clip cache, made at the first call.
+    The cache is made again only when the clip parameters or the decoder changed.
+
+    Args:
+        byte_budget (int): the max total bytes of the segments.
+        clip_duration (float): clip duration for the video.
+        uniform_temporal_subsample_num (int): num frame from the clip duration.
+        img_size (int): the image size after resize.
+        backing (Optional[ClipCache], optional): the on-disk clip cache under the shared memory. Defaults to None.
+        decoder (str, optional): the decoder name in DECODERS. Defaults to "pyav".
+        decode_resize (bool, optional): the frames are scaled during decode. Defaults to False.
+
+    Returns:
+        SharedMemoryClipCache: the shared clip cache.
+    """
+
+    global _SHARED_CLIP_CACHE
+
+    if _SHARED_CLIP_CACHE is not None and _SHARED_CLIP_CACHE.matches(clip_duration, uniform_temporal_subsample_num, img_size, backing, decoder, decode_resize):
+        _SHARED_CLIP_CACHE.byte_budget = byte_budget
+        return _SHARED_CLIP_CACHE
+
+    if _SHARED_CLIP_CACHE is not None:
+        _SHARED_CLIP_CACHE.close()
+
+    _SHARED_CLIP_CACHE = SharedMemoryClipCache(byte_budget, clip_duration, uniform_temporal_subsample_num, img_size, backing, decoder, decode_resize)
+
+    return _SHARED_CLIP_CACHE
@@ -0,0 +1,63 @@
+'''
+export the pre-cropped segments of all the folds into one frame store, for main.py --dataset_type frame_store.
+
+The segments after split_cropfor*.py are fixed size person crops, so the decoded uint8 frames are stored directly,
+and the training read the subsampled frames by the index, without the video decode.
+The same video in different folds is stored once.
+
+usage:
+    python export_frame_store.py --data_path_a /workspace/data/Cross_Validation/ex_20250116_ap_organized \
+        --data_path_b /workspace/data/Cross_Validation/ex_20250116_lat_organized \
+        --output_path /workspace/data/Cross_Validation/ex_20250116_frames --img_size 224
+'''
+
+# %%
+import os
+from argparse import ArgumentParser
+
+from dataloader.frame_store import FRAME_STORE_FORMATS, FrameStoreWriter, export_paired_videos
+from dataloader.paired_dataset import make_paired_video_paths
+
+
+def get_parameters():
+    '''
+    The parameters for the frame store export, can be called out via the --h menu
+    '''
+    parser = ArgumentParser()
+
+    parser.add_argument('--data_path_a', type=str, required=True, help='the ap cross validation dataset path')
+    parser.add_argument('--data_path_b', type=str, required=True, help='the lat cross validation dataset path')
+    parser.add_argument('--output_path', type=str, required=True, help='the frame store folder')
+    parser.add_argument('--store_format', type=str, default='npy', choices=list(FRAME_STORE_FORMATS), help='npy: raw memory-mapped frames, the fastest read. hdf5: chunked frames with the compression.')
+    parser.add_argument('--compression', type=str, default=None, choices=['lzf', 'gzip'], help='the lossless hdf5 compression, lzf is fast, gzip is small')
+    parser.add_argument('--img_size', type=int, default=None, help='scale the frames to img_size during export, None keep the crop size')
+
+    return parser.parse_known_args()
+
+
+# %%
+if __name__ == '__main__':
+
+    config, unkonwn = get_parameters()
+
+    writer = FrameStoreWriter(config.output_path, config.store_format, config.compression, config.img_size)
+
+    for fold in sorted(os.listdir(config.data_path_a)):
+        fold_path_a = os.path.join(config.data_path_a, fold)
+
+        if not os.path.isdir(fold_path_a):
+            continue
+
+        for split in sorted(os.listdir(fold_path_a)):
+            split_path_a = os.path.join(fold_path_a, split)
+            split_path_b = os.path.join(config.data_path_b, fold, split)
+
+            if not os.path.isdir(split_path_a) or not os.path.isdir(split_path_b):
+                continue
+
+            added = export_paired_videos(writer, make_paired_video_paths(split_path_a, split_path_b))
+            print('%s/%s: %d new videos' % (fold, split, added))
+
+    writer.close()
+
+    print('%d videos in %s' % (len(writer.videos), config.output_path))
@@ -11,8 +11,11 @@ from pytorch_lightning import loggers as pl_loggers
 from pytorch_lightning.callbacks import TQDMProgressBar, RichModelSummary, RichProgressBar, ModelCheckpoint, EarlyStopping
 from pl_bolts.callbacks import PrintTableMetricsCallback, TrainingDataMonitor
 from utils.utils import get_ckpt_path
+from utils.loader_config import apply_loader_config
+from utils.compile import CompileTimeCallback
 
 from dataloader.data_loader import WalkDataModule
+from dataloader.decoders import DECODERS
 from models.pytorchvideo_models import WalkVideoClassificationLightningModule
 from argparse import ArgumentParser
 
@@ -37,10 +40,34 @@ def get_parameters():
     parser.add_argument('--max_epochs', type=int, default=50, help='numer of epochs of training')
     parser.add_argument('--batch_size', type=int, default=16, help='batch size for the dataloader')
     parser.add_argument('--num_workers', type=int, default=8, help='dataloader for load video')
+    parser.add_argument('--prefetch_factor', type=int, default=2, help='batches prefetched by every dataloader worker')
+    parser.add_argument('--persistent_workers', action='store_true', help='keep the dataloader workers alive between the epochs')
+    parser.add_argument('--pin_memory', action='store_true', help='copy the batches into the pinned memory in the dataloader')
+    parser.add_argument('--async_prefetch', type=int, default=0, help='copy N batches to the device in a background thread ahead of the step, cpu double buffer without gpu. 0 to disable.')
+    parser.add_argument('--loader_config', type=str, default=None, help='the tuned loader settings yaml from tune_loader.py, default configs/loader/<hostname>.yaml')
+    parser.add_argument('--no_loader_config', action='store_true', help='do not load the tuned loader settings')
     parser.add_argument('--clip_duration', type=int, default=1, help='clip duration for the video')
     parser.add_argument('--uniform_temporal_subsample_num', type=int,
                         default=8, help='num frame from the clip duration')
     parser.add_argument('--gpu_num', type=int, default=0, choices=[0, 1], help='the gpu number whicht to train')
+    parser.add_argument('--accelerator', type=str, default='gpu', choices=['gpu', 'cpu'], help='train on the gpu of gpu_num, or the cpu')
+    parser.add_argument('--precision_mode', type=str, default='fp32', choices=['fp32', 'bf16'], help='bf16: the model forward under the bf16 autocast, the loss in fp32. compare with benchmark_precision.py')
+    parser.add_argument('--compile', action='store_true', help='torch.compile the view fusion and the model forward')
+    parser.add_argument('--compile_mode', type=str, default='default', choices=['default', 'reduce-overhead', 'max-autotune'], help='the torch.compile mode')
+    parser.add_argument('--compile_cache_dir', type=str, default=None, help='the persistent compile cache shared by the folds and runs, default the repo root compile_cache folder')
+    parser.add_argument('--checkpoint_stages', type=int, nargs='*', default=[], help='the model.blocks index of the 3D CNN to recompute in the backward (activation checkpoint), like 1 2 3. compare with benchmark_checkpoint.py')
+    parser.add_argument('--channels_last', action='store_true', help='the channels_last_3d memory format of the 3D CNN weights and input')
+    parser.add_argument('--progressive_epochs', type=int, default=0, help='grow the train clip from the progressive size to img_size and uniform_temporal_subsample_num in N epochs, 0 to train with the target size')
+    parser.add_argument('--progressive_img_size', type=int, default=112, help='the train img size of the first epoch, with the progressive schedule')
+    parser.add_argument('--progressive_frames', type=int, default=4, help='the train frame number of the first epoch, with the progressive schedule')
+    parser.add_argument('--decoder', type=str, default='pyav', choices=list(DECODERS), help='the video decoder backend, pyav_sparse only decode the subsampled frames of the clip. compare the backends with benchmark_decoder.py')
+    parser.add_argument('--decode_resize', action='store_true', help='scale the frames to img_size during decode, instead of resize the full size frames')
+    parser.add_argument('--profile_data', action='store_true', help='time every stage of the data pipeline (open, seek, decode, transform, collate, ipc), save the summary and the chrome trace in the log folder of the fold')
+    parser.add_argument('--balance_sampler', type=str, default='none', choices=['none', 'class', 'patient', 'class_patient'], help='draw the train clips balanced by the class, the patient, or both, for the clip_index and frame_store dataset')
+    parser.add_argument('--batch_augment', type=str, default='device', choices=['device', 'worker'], help='where the paired batch augmentation runs, device: after the batch transfer, worker: in the dataloader collate')
+    parser.add_argument('--aug_flip_prob', type=float, default=0.5, help='the horizontal flip probability of one ap/lat pair')
+    parser.add_argument('--aug_scale_min', type=float, default=1.0, help='the min random zoom in of one ap/lat pair, 1.0 for no zoom')
+    parser.add_argument('--aug_scale_max', type=float, default=1.0, help='the max random zoom in of one ap/lat pair, e.g. 1.25 same as RandomShortSideScale(224, 280) + RandomCrop(224)')
 
     # ablation experment 
     # different fusion method 
@@ -48,6 +75,7 @@ def get_parameters():
     
     # Transfor_learning
     parser.add_argument('--transfor_learning', action='store_true', help='if use the transformer learning')
+    parser.add_argument('--weights_dir', type=str, default=None, help='the local pretrained weight store from prefetch_weights.py, default the repo root weights folder')
     parser.add_argument('--fix_layer', type=str, default='all', choices=['all', 'head', 'stem_head', 'stage_head'], help="select the ablation study within the choices ['all', 'head', 'stem_head', 'stage_head'].")
 
     # TTUR
@@ -68,6 +96,16 @@ def get_parameters():
                         help="segmentation dataset with mediapipe, with 5 fold cross validation.")
 
     parser.add_argument('--log_path', type=str, default='./logs', help='the lightning logs saved path')
+    parser.add_argument('--dataset_type', type=str, default='clip_index', choices=['clip_index', 'iterable', 'shard', 'frame_store', 'recording'], help='clip_index: map-style dataset on the precomputed clip index, shuffled and sized. iterable: decode the clips video by video. shard: stream the tar shards from pack_shards.py. frame_store: slice the frames from export_frame_store.py, no decode. recording: split and crop the full recordings on the fly.')
+    parser.add_argument('--manifest_path', type=str, default=None, help='the cached video manifest json, skip the folder walk and the video probe in setup. None to disable.')
+    parser.add_argument('--multi_clip_buffer', type=int, default=0, help='iterable dataset only, decode up to N consecutive clips in one pass and cut the clips from the buffered frames. 0 to decode clip by clip.')
+    parser.add_argument('--clip_shuffle_window', type=int, default=0, help='iterable and shard dataset, shuffle the train clips within a window of N clips. 0 to keep the decode order.')
+    parser.add_argument('--shard_path', type=str, default=None, help='the tar shards from pack_shards.py, shard_path/fold/split, for the shard dataset.')
+    parser.add_argument('--frame_store_path', type=str, default=None, help='the frame store from export_frame_store.py, for the frame_store dataset.')
+    parser.add_argument('--recording_path', type=str, default=None, help='the full recordings with the boxes from cache_boxes.py, recording_path/class/date/full_ap.mp4, for the recording dataset.')
+    parser.add_argument('--split_json', type=str, default=None, help='the fold split json of make_dataset_by_json.py for the recording dataset, None use all the recordings.')
+    parser.add_argument('--clip_cache_dir', type=str, default=None, help='the on-disk cache of the decoded clips, shared by the epochs and folds. None to decode every epoch.')
+    parser.add_argument('--shared_cache_gb', type=float, default=0, help='the shared-memory cache of the decoded clips (GB), shared by the dataloader workers and kept across the CV folds. 0 to disable.')
 
     # using pretrained
     parser.add_argument('--pretrained_model', type=bool, default=False,
@@ -76,7 +114,12 @@ def get_parameters():
     # add the parser to ther Trainer
     # parser = Trainer.add_argparse_args(parser)
 
-    return parser.parse_known_args()
+    config, unknown = parser.parse_known_args()
+
+    # the tuned loader settings of this host, the option in the command line has the priority.
+    apply_loader_config(config, parser)
+
+    return config, unknown
 
 # %%
 
@@ -119,14 +162,22 @@ def train(hparams):
     # table_metrics_callback = PrintTableMetricsCallback()
     monitor = TrainingDataMonitor(log_every_n_steps=25)
 
+    callbacks = [progress_bar, rich_model_summary, monitor, model_check_point, early_stopping]
+
+    # the compile time is in the first step, report it with the steady state step time.
+    if hparams.compile:
+        callbacks.append(CompileTimeCallback())
+
     trainer = Trainer(
-                      devices=[hparams.gpu_num,],
-                      accelerator="gpu",
+                      devices=[hparams.gpu_num,] if hparams.accelerator == 'gpu' else 1,
+                      accelerator=hparams.accelerator,
                       max_epochs=hparams.max_epochs,
                       logger=tb_logger,
                       #   log_every_n_steps=100,
                       check_val_every_n_epoch=1,
-                      callbacks=[progress_bar, rich_model_summary, monitor, model_check_point, early_stopping],
+                      # the progressive schedule set the train transform of the epoch when the train dataloader is made.
+                      reload_dataloaders_every_n_epochs=1 if hparams.progressive_epochs > 0 else 0,
+                      callbacks=callbacks,
                       #   deterministic=True
                       )
 
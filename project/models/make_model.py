@@ -1,10 +1,52 @@
 # %%
-from pytorchvideo.models import resnet, csn, r2plus1d, x3d, slowfast
+import importlib
+from typing import Callable, List
 
 import torch
 import torch.nn as nn
+import torch.utils.checkpoint
 import copy
 
+from models.weight_store import WeightStore, build_model
+
+# %%
+# the pytorchvideo model families, imported when the model is made, not when this module is imported.
+# notice that, pytorchvideo/models/__init__.py import all the families, so the first get_model_builder import them all.
+MODEL_FAMILIES = {
+    'resnet': ('pytorchvideo.models.resnet', 'create_resnet'),
+    'csn': ('pytorchvideo.models.csn', 'create_csn'),
+    'r2plus1d': ('pytorchvideo.models.r2plus1d', 'create_r2plus1d'),
+    'x3d': ('pytorchvideo.models.x3d', 'create_x3d'),
+    'slowfast': ('pytorchvideo.models.slowfast', 'create_slowfast'),
+}
+
+# the --model name to the make_walk_* method.
+WALK_MODELS = {
+    'resnet': 'make_walk_resnet',
+    'r2plus1d': 'make_walk_r2plus1d',
+    'csn': 'make_walk_csn',
+    'x3d': 'make_walk_x3d',
+    'slowfast': 'make_walk_slow_fast',
+    'i3d': 'make_walk_i3d',
+    'c2d': 'make_walk_c2d',
+}
+
+
+def get_model_builder(family: str) -> Callable[..., nn.Module]:
+    '''
+    import the pytorchvideo model family (with the pytorchvideo.models package), and return the create function.
+
+    Args:
+        family (str): the family name in MODEL_FAMILIES.
+
+    Returns:
+        Callable[..., nn.Module]: the create function, like create_resnet.
+    '''
+
+    module_name, builder_name = MODEL_FAMILIES[family]
+
+    return getattr(importlib.import_module(module_name), builder_name)
+
 
 # %%
 
@@ -27,19 +69,97 @@ class MakeVideoModule(nn.Module):
 
         self.fix_layer = hparams.fix_layer
 
+        # the pretrained weights from the local store, see prefetch_weights.py
+        self.weight_store = WeightStore(hparams.weights_dir)
+
+        # the layers of the pretrained model made again by the make_walk_*, like the 6 channel input conv, always trained.
+        self.reinitialized_layers: List[nn.Module] = []
+
+    def make(self, model_type: str) -> nn.Module:
+        '''
+        make the walk model of the --model name.
+
+        Args:
+            model_type (str): the model name in WALK_MODELS.
+
+        Returns:
+            nn.Module: the model.
+        '''
+
+        if model_type not in WALK_MODELS:
+            raise ValueError(f'the model should be in {list(WALK_MODELS)}, get {model_type}')
+
+        if self.fix_layer != 'all' and not self.transfor_learning:
+            raise ValueError(f'the fix_layer {self.fix_layer} freeze the pretrained weights, use it with --transfor_learning')
+
+        model = getattr(self, WALK_MODELS[model_type])()
+
+        if self.fix_layer != 'all':
+            model = self.freeze_layers(model, self.fix_layer)
+
+        return model
+
     def set_parameter_requires_grad(self, model: torch.nn.Module, flag:bool = True):
 
         for param in model.parameters():
             param.requires_grad = flag
 
+    def freeze_layers(self, model: nn.Module, fix_layer: str) -> nn.Module:
+        '''
+        the ablation expermentional, train the selected part of the model.blocks, fix other.
+        the stem is model.blocks[0], the head is model.blocks[-1], and the stages are between them.
+
+        the frozen blocks keep the eval mode (the BatchNorm use the pretrained running stats),
+        and the frozen blocks before the first trained block run under the torch.no_grad, so they store no activations and skip the backward.
+        the frozen blocks after a trained block still pass the gradient to it.
+        the reinitialized_layers in a frozen block (like the 6 channel stem conv) have no pretrained weights, they are still trained,
+        so the block is not under the torch.no_grad.
+
+        Args:
+            model (nn.Module): the pytorchvideo model, with the model.blocks.
+            fix_layer (str): head (train the head), stem_head (train the stem and head), stage_head (train the stages and head).
+
+        Returns:
+            nn.Module: the same model.
+        '''
+
+        blocks = model.blocks
+
+        if fix_layer == 'head':
+            trained = [len(blocks) - 1]
+        elif fix_layer == 'stem_head':
+            trained = [0, len(blocks) - 1]
+        elif fix_layer == 'stage_head':
+            trained = list(range(1, len(blocks)))
+        else:
+            raise ValueError(f'the fix_layer should be in [all, head, stem_head, stage_head], get {fix_layer}')
+
+        reinitialized = {id(param) for layer in self.reinitialized_layers for param in layer.parameters()}
+        partly_trained = [idx for idx, block in enumerate(blocks) if idx not in trained and any(id(param) in reinitialized for param in block.parameters())]
+
+        first_trained = min(trained + partly_trained)
+
+        for idx, block in enumerate(blocks):
+            if idx in trained:
+                continue
+
+            # no trained block before it, the input need no gradient.
+            freeze_block(block, no_grad=idx < first_trained)
+
+            if idx in partly_trained:
+                for param in block.parameters():
+                    param.requires_grad = id(param) in reinitialized
+
+        return model
+
     def make_walk_csn(self):
 
         if self.transfor_learning:
-            CSN = torch.hub.load("facebookresearch/pytorchvideo:main", model='csn_r101', pretrained=True)
+            CSN = build_model('csn_r101', pretrained=True, store=self.weight_store)
             CSN.blocks[-1].proj = nn.Linear(2048, self.model_class_num)
         
         else:
-            CSN = csn.create_csn(
+            CSN = get_model_builder('csn')(
             input_channel=6,
             model_depth=self.model_depth,
             model_num_class=self.model_class_num,
@@ -52,14 +172,14 @@ class MakeVideoModule(nn.Module):
     def make_walk_r2plus1d(self) -> nn.Module:
 
         if self.transfor_learning:
-            model = torch.hub.load("facebookresearch/pytorchvideo:main", model='r2plus1d_r50', pretrained=True)
+            model = build_model('r2plus1d_r50', pretrained=True, store=self.weight_store)
 
             # change the head layer.
             model.blocks[-1].proj = nn.Linear(2048, self.model_class_num)
             model.blocks[-1].activation = None
         
         else:
-            model = r2plus1d.create_r2plus1d(
+            model = get_model_builder('r2plus1d')(
                 input_channel=6,
                 model_depth=self.model_depth,
                 model_num_class=self.model_class_num,
@@ -73,7 +193,7 @@ class MakeVideoModule(nn.Module):
     def make_walk_c2d(self) -> nn.Module:
 
         if self.transfor_learning:
-            model = torch.hub.load("facebookresearch/pytorchvideo:main", model='c2d_r50', pretrained=True)
+            model = build_model('c2d_r50', pretrained=True, store=self.weight_store)
             model.blocks[-1].proj = nn.Linear(2048, self.model_class_num, bias=True)
 
             return model
@@ -83,7 +203,7 @@ class MakeVideoModule(nn.Module):
     def make_walk_i3d(self) -> nn.Module:
         
         if self.transfor_learning:
-            model = torch.hub.load("facebookresearch/pytorchvideo:main", model='i3d_r50', pretrained=True)
+            model = build_model('i3d_r50', pretrained=True, store=self.weight_store)
             model.blocks[-1].proj = nn.Linear(2048, self.model_class_num)
 
             return model
@@ -93,12 +213,12 @@ class MakeVideoModule(nn.Module):
     def make_walk_x3d(self) -> nn.Module:
 
         if self.transfor_learning:
-            model = torch.hub.load("facebookresearch/pytorchvideo:main", model='x3d_m', pretrained=True)
+            model = build_model('x3d_m', pretrained=True, store=self.weight_store)
             model.blocks[-1].proj = nn.Linear(2048, self.model_class_num)
             model.blocks[-1].activation = None
 
         else:
-            model = x3d.create_x3d(
+            model = get_model_builder('x3d')(
                 input_channel=6, 
                 input_clip_length=16,
                 input_crop_size=224,
@@ -113,12 +233,12 @@ class MakeVideoModule(nn.Module):
     def make_walk_slow_fast(self) -> nn.Module:
 
         if self.transfor_learning:
-            model = torch.hub.load("facebookresearch/pytorchvideo:main", model='slowfast_r50', pretrained=True)
+            model = build_model('slowfast_r50', pretrained=True, store=self.weight_store)
             model.blocks[-1].proj = nn.Linear(2048, self.model_class_num)
 
         else:
 
-            model = slowfast.create_slowfast(
+            model = get_model_builder('slowfast')(
                 input_channels=6,
                 model_depth=self.model_depth,
                 model_num_class=self.model_class_num,
@@ -133,38 +253,15 @@ class MakeVideoModule(nn.Module):
         
         # make model
         if self.transfor_learning:
-            slow = torch.hub.load('facebookresearch/pytorchvideo', 'slow_r50', pretrained=True)
+            slow = build_model('slow_r50', pretrained=True, store=self.weight_store)
             
             slow.blocks[0].conv = nn.Conv3d(in_channels=6, out_channels=64, kernel_size=(1, 7, 7), stride=(1, 2, 2), padding=(0, 3, 3))
+            self.reinitialized_layers.append(slow.blocks[0].conv)
             # change the knetics-400 output 400 to model class num
             slow.blocks[-1].proj = nn.Linear(2048, self.model_class_num)
 
-            # model_stem = slow.blocks[0]
-            # model_head = slow.blocks[-1]
-            # model_stage = slow.blocks[1:-1]
-
-            # # ablation expermentional
-
-            # # first make sure all param to false 
-            # self.set_parameter_requires_grad(slow, False)
-
-            # if self.fix_layer == 'all':
-            #     # train all param
-            #     self.set_parameter_requires_grad(slow, True)
-            # elif self.fix_layer == 'head':
-            #     # train model head, fix other
-            #     self.set_parameter_requires_grad(model_head, True)
-            # elif self.fix_layer == 'stem_head':
-            #     # train model head and stem, fix other
-            #     self.set_parameter_requires_grad(model_head, True)
-            #     self.set_parameter_requires_grad(model_stem, True)
-            # elif self.fix_layer == 'stage_head':
-            #     # train model stage and head, fix stem
-            #     self.set_parameter_requires_grad(model_stage, True)
-            #     self.set_parameter_requires_grad(model_head, True)
-
         else:
-            slow = resnet.create_resnet(
+            slow = get_model_builder('resnet')(
                 input_channel=6,
                 model_depth=self.model_depth,
                 model_num_class=self.model_class_num,
@@ -174,6 +271,149 @@ class MakeVideoModule(nn.Module):
 
         return slow
 
+def adaptive_head_pool(model: nn.Module) -> nn.Module:
+    '''
+    replace the fixed kernel AvgPool3d of the head (sized for the train clip) with the global AdaptiveAvgPool3d.
+    the output is same at the train clip size, and the model accept the other img size and frame number.
+
+    Args:
+        model (nn.Module): the pytorchvideo model.
+
+    Returns:
+        nn.Module: the same model.
+    '''
+
+    pools = [
+        (module, name)
+        for module in model.modules()
+        for name, child in module.named_children()
+        if isinstance(child, nn.AvgPool3d)
+    ]
+
+    for module, name in pools:
+        setattr(module, name, nn.AdaptiveAvgPool3d(1))
+
+    return model
+
+
+class _FrozenForward:
+    '''
+    the forward of the frozen block under the torch.no_grad.
+    '''
+
+    def __init__(self, block: nn.Module) -> None:
+        self.forward = block.forward
+
+    def __call__(self, *args):
+
+        with torch.no_grad():
+            return self.forward(*args)
+
+
+class _FrozenTrain:
+    '''
+    the train of the frozen block, keep the eval mode when the LightningModule.train() is called every epoch.
+    '''
+
+    def __init__(self, block: nn.Module) -> None:
+        self.block = block
+
+    def __call__(self, mode: bool = True) -> nn.Module:
+        return nn.Module.train(self.block, False)
+
+
+def freeze_block(block: nn.Module, no_grad: bool = False) -> nn.Module:
+    '''
+    fix the parameters of the block, and keep the block in the eval mode.
+    the forward and train of the block are replaced, so the state dict keys are same.
+
+    Args:
+        block (nn.Module): one of the model.blocks.
+        no_grad (bool, optional): run the block under the torch.no_grad, when no trained block is before it. Defaults to False.
+
+    Returns:
+        nn.Module: the same block.
+    '''
+
+    for param in block.parameters():
+        param.requires_grad = False
+
+    block.train = _FrozenTrain(block)
+    block.eval()
+
+    if no_grad:
+        block.forward = _FrozenForward(block)
+
+    return block
+
+
+class _CheckpointForward:
+    '''
+    the forward of one stage with the activation checkpoint, the activations in the stage are recomputed in the backward.
+    '''
+
+    def __init__(self, block: nn.Module) -> None:
+        self.block = block
+        self.forward = block.forward
+
+    def __call__(self, *args):
+
+        # the validation and the no_grad frozen stages store no activations, no need to recompute.
+        if not torch.is_grad_enabled():
+            return self.forward(*args)
+
+        recompute = [False]
+
+        def run(*inputs):
+            if not recompute[0]:
+                recompute[0] = True
+                return self.forward(*inputs)
+
+            # the recompute in the backward, keep the BatchNorm running stats updated once.
+            # the non-reentrant checkpoint stop the recompute early by raising in the middle of the forward, so restore in the finally.
+            norms = [module for module in self.block.modules() if isinstance(module, nn.modules.batchnorm._BatchNorm) and module.track_running_stats]
+            stats = [[buffer.clone() for buffer in (norm.running_mean, norm.running_var, norm.num_batches_tracked)] for norm in norms]
+
+            try:
+                return self.forward(*inputs)
+            finally:
+                with torch.no_grad():
+                    for norm, (mean, var, num) in zip(norms, stats):
+                        norm.running_mean.copy_(mean)
+                        norm.running_var.copy_(var)
+                        norm.num_batches_tracked.copy_(num)
+
+        return torch.utils.checkpoint.checkpoint(run, *args, use_reentrant=False)
+
+
+def checkpoint_blocks(model: nn.Module, stages: List[int]) -> nn.Module:
+    '''
+    the activation checkpoint of the selected model.blocks of the pytorchvideo model.
+    only the stage input is kept in the forward, the stage is run again in the backward,
+    so the larger batch is trained with the same memory, and the train step is slower by about one forward of the stages.
+    the forward of the block is replaced, so the state dict keys are same.
+
+    Args:
+        model (nn.Module): the pytorchvideo model, with the model.blocks.
+        stages (List[int]): the index of the model.blocks, like [1, 2, 3] for the res stages of the resnet.
+
+    Returns:
+        nn.Module: the same model.
+    '''
+
+    blocks = getattr(model, 'blocks', None)
+
+    if not isinstance(blocks, nn.ModuleList):
+        raise ValueError(f'the activation checkpoint need the model.blocks of the pytorchvideo model, get {type(model).__name__}')
+
+    for stage in sorted(set(stages)):
+        if not -len(blocks) <= stage < len(blocks):
+            raise ValueError(f'the checkpoint stage should be in [0, {len(blocks)}) for the {len(blocks)} blocks, get {stage}')
+
+        blocks[stage].forward = _CheckpointForward(blocks[stage])
+
+    return model
+
 # ! below is compare experiment.
 # %%
 class single_frame(nn.Module):
@@ -186,7 +426,7 @@ class single_frame(nn.Module):
 
         self.transfor_learning = hparams.transfor_learning
 
-        self.resnet_model = torch.hub.load('pytorch/vision:v0.10.0', 'resnet50', pretrained=self.transfor_learning)
+        self.resnet_model = build_model('resnet50', pretrained=self.transfor_learning, store=WeightStore(hparams.weights_dir))
 
         self.resnet_model.fc = torch.nn.Linear(2048, self.model_class_num, bias=True)
 
@@ -211,7 +451,7 @@ class early_fusion(nn.Module):
         self.uniform_temporal_subsample_num = hparams.uniform_temporal_subsample_num
 
         # change the resnet work structure
-        self.resnet_model = torch.hub.load('pytorch/vision:v0.10.0', 'resnet50', pretrained=self.transfor_learning)
+        self.resnet_model = build_model('resnet50', pretrained=self.transfor_learning, store=WeightStore(hparams.weights_dir))
 
         self.resnet_model.conv1 = torch.nn.Conv2d(3 * self.uniform_temporal_subsample_num, out_channels=64, kernel_size=(7,7), stride=(2, 2), padding=(3, 3), bias=False)
         self.resnet_model.fc = torch.nn.Linear(2048, self.model_class_num, bias=True)
@@ -235,7 +475,7 @@ class late_fusion(nn.Module):
 
         self.transfor_learning = hparams.transfor_learning
 
-        self.resnet_model = torch.hub.load('pytorch/vision:v0.10.0', 'resnet50', pretrained=self.transfor_learning)
+        self.resnet_model = build_model('resnet50', pretrained=self.transfor_learning, store=WeightStore(hparams.weights_dir))
 
         # late fusion model
         self.first_model = torch.nn.Sequential(*list(self.resnet_model.children())[:-2])
@@ -287,5 +527,5 @@ class late_fusion(nn.Module):
 
 # %%
 # list the model in repo.
-torch.hub.list('facebookresearch/pytorchvideo', force_reload=True)
+# torch.hub.list('facebookresearch/pytorchvideo', force_reload=True)
 # # %%
\ No newline at end of file
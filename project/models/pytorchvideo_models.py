@@ -4,11 +4,13 @@ import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np 
 
-from models.make_model import MakeVideoModule, early_fusion, late_fusion, single_frame
+from models.make_model import MakeVideoModule, adaptive_head_pool, checkpoint_blocks, early_fusion, late_fusion, single_frame
+from dataloader.batch_augment import PairedBatchAugment
 
 from pytorch_lightning import LightningModule
 
 from utils.metrics import *
+from utils.compile import enable_compile_cache
 
 from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
 
@@ -33,31 +35,14 @@ class WalkVideoClassificationLightningModule(LightningModule):
 
         self.fusion_method = hparams.fusion_method       
 
-        if self.fusion_method == 'slow_fusion':
-            self.model = MakeVideoModule(hparams)
-
-            # select the network structure 
-            if self.model_type == 'resnet':
-                self.model=self.model.make_walk_resnet()
-
-            elif self.model_type == 'r2plus1d':
-                self.model = self.model.make_walk_r2plus1d()
-
-            elif self.model_type == 'csn':
-                self.model=self.model.make_walk_csn()
-
-            elif self.model_type == 'x3d':
-                self.model = self.model.make_walk_x3d()
-
-            elif self.model_type == 'slowfast':
-                self.model = self.model.make_walk_slow_fast()
-
-            elif self.model_type == 'i3d':
-                self.model = self.model.make_walk_i3d()
-
-            elif self.model_type == 'c2d':
-                self.model = self.model.make_walk_c2d()
+        # the layers without the pretrained weights, should be in the optimizer with any --fix_layer.
+        self.reinitialized_params = []
 
+        if self.fusion_method == 'slow_fusion':
+            # select the network structure, the pytorchvideo models are imported here, not at the module import.
+            video_module = MakeVideoModule(hparams)
+            self.model = video_module.make(self.model_type)
+            self.reinitialized_params = [param for layer in video_module.reinitialized_layers for param in layer.parameters()]
 
         elif self.fusion_method == 'single_frame':
             self.model = single_frame(hparams)
@@ -68,8 +53,51 @@ class WalkVideoClassificationLightningModule(LightningModule):
         else:
             raise ValueError('no choiced model selected, get {self.fusion_method}')
 
+        # the progressive schedule train with the smaller clips first.
+        if hparams.progressive_epochs > 0:
+            if self.fusion_method == 'slow_fusion':
+                self.model = adaptive_head_pool(self.model)
+            elif self.fusion_method in ('early_fusion', 'late_fusion') and hparams.progressive_frames != self.uniform_temporal_subsample_num:
+                # the early fusion stack the frames in the channel, the late fusion pick the fixed frames.
+                raise ValueError(f'the {self.fusion_method} model need the fixed frame number, set --progressive_frames {self.uniform_temporal_subsample_num}')
+
+        # recompute the activations of the selected stages in the backward, for the larger batch.
+        if hparams.checkpoint_stages:
+            if self.fusion_method != 'slow_fusion':
+                raise ValueError(f'the activation checkpoint is for the model.blocks of the 3D CNN, not the {self.fusion_method} model')
+
+            self.model = checkpoint_blocks(self.model, hparams.checkpoint_stages)
+
         self.transfor_learning = hparams.transfor_learning
 
+        # bf16 autocast of the model forward, the loss and the metrics keep fp32.
+        self.precision_mode = hparams.precision_mode
+        # the channels_last_3d memory format of the 3D CNN weights and the fused video.
+        self.channels_last = hparams.channels_last
+
+        if self.channels_last:
+            if self.fusion_method != 'slow_fusion':
+                raise ValueError(f'the channels_last_3d is for the 3D CNN, not the {self.fusion_method} model')
+
+            self.model = self.model.to(memory_format=torch.channels_last_3d)
+
+        # compile the view fusion and the model forward into one graph, the self.model keep the same state dict keys.
+        if hparams.compile:
+            enable_compile_cache(hparams.compile_cache_dir)
+            self._forward_fn = torch.compile(self._fused_forward, mode=hparams.compile_mode)
+        else:
+            self._forward_fn = self._fused_forward
+
+        # the uint8 video from the dataloader is normalized on the device, b, t, c, h, w
+        self.register_buffer('_video_mean', torch.tensor([0.45, 0.45, 0.45]).view(1, 1, 3, 1, 1), persistent=False)
+        self.register_buffer('_video_std', torch.tensor([0.225, 0.225, 0.225]).view(1, 1, 3, 1, 1), persistent=False)
+
+        # the same flip and scale for the ap and lat view of one sample, None when it is in the dataloader worker.
+        if hparams.batch_augment == 'device':
+            self.batch_augment = PairedBatchAugment(hparams.aug_flip_prob, (hparams.aug_scale_min, hparams.aug_scale_max))
+        else:
+            self.batch_augment = None
+
         # save the hyperparameters to the file and ckpt
         self.save_hyperparameters()
 
@@ -88,6 +116,46 @@ class WalkVideoClassificationLightningModule(LightningModule):
     def forward(self, x):
         return self.model(x)
 
+    def on_after_batch_transfer(self, batch, dataloader_idx):
+        '''
+        the batched normalization and augmentation on the device.
+        the dataloader keep the uint8 video to make the IPC and host to device copy small,
+        here convert to float, Div255 and Normalize for the whole batch, and the paired batch augmentation when training.
+
+        Args:
+            batch (dict): the batch on the device, the ap and lat video are b, t, c, h, w, uint8.
+            dataloader_idx (int): the dataloader index.
+
+        Returns:
+            dict: the batch with the float video.
+        '''
+
+        video_ap = self._normalize_video(batch['ap'])
+        video_lat = self._normalize_video(batch['lat'])
+
+        if self.batch_augment is not None and self.trainer is not None and self.trainer.training:
+            video_ap, video_lat = self.batch_augment(video_ap, video_lat)
+
+        batch['ap'] = video_ap
+        batch['lat'] = video_lat
+
+        return batch
+
+    def _normalize_video(self, video: torch.Tensor) -> torch.Tensor:
+        '''
+        Div255 and Normalize the uint8 video.
+
+        Args:
+            video (torch.Tensor): b, t, c, h, w, uint8
+
+        Returns:
+            torch.Tensor: b, t, c, h, w, float
+        '''
+
+        video = video.float().div_(255.0)
+
+        return (video - self._video_mean) / self._video_std
+
     def training_step(self, batch, batch_idx):
         '''
         train steop when trainer.fit called
@@ -101,28 +169,18 @@ class WalkVideoClassificationLightningModule(LightningModule):
         '''
         
         # input and label
-        self._check_info(batch=batch)
-        label = batch['a']['label']
-        
-        # input and label
-        video_a = batch['a']['video'] # b, c, t, h, w
-        video_b = batch['b']['video'] # b, c, t, h, w
-        
-        fusion_video = torch.cat([video_a, video_b], dim=2) # b, t, c, h, w 
-        fusion_video = fusion_video.transpose(2, 1) # b, t, c, h, w > b, c, t, h, w 
-
         if self.fusion_method == 'single_frame': 
             # for single frame
             label = batch['label'].detach()
 
             # when batch > 1, for multi label, to repeat label in (bxt)
-            label = label.repeat_interleave(self.uniform_temporal_subsample_num).squeeze()
+            label = label.repeat_interleave(batch['ap'].size(1)).squeeze()
 
         else:
-            label = batch['a']['label'] # b, class_num
+            label = batch['label'] # b, class_num
 
-        # classification task
-        y_hat = self.model(fusion_video)
+        # classification task, the ap and lat are fused in the _predict.
+        y_hat = self._predict(batch)
 
         # when torch.size([1]), not squeeze.
         if y_hat.size()[0] != 1 or len(y_hat.size()) != 1 :
@@ -168,22 +226,14 @@ class WalkVideoClassificationLightningModule(LightningModule):
             accuract: selected accuracy result.
         '''
 
-        # * Check the info from two date 
-        self._check_info(batch=batch)
-        label = batch['a']['label']
-
         # input and label
-        video_a = batch['a']['video'] # b, t, c, h, w
-        video_b = batch['b']['video'] # b, t, c, h, w
+        label = batch['label']
 
-        # TODO: fuse the video data with lat and ap.
-        fusion_video = torch.cat([video_a, video_b], dim=2) # b, t, c, h, w 
-        fusion_video = fusion_video.transpose(2, 1) # b, t, c, h, w > b, c, t, h, w 
         self.model.eval()
         
         # pred the video frames
         with torch.no_grad():
-            preds = self.model(fusion_video)
+            preds = self._predict(batch)
 
         # when torch.size([1]), not squeeze.
         if preds.size()[0] != 1 or len(preds.size()) != 1 :
@@ -232,13 +282,11 @@ class WalkVideoClassificationLightningModule(LightningModule):
         '''
 
         # input and label
-        video = batch['video'].detach() # b, c, t, h, w
-
         if self.fusion_method == 'single_frame': 
             label = batch['label'].detach()
 
             # when batch > 1, for multi label, to repeat label in (bxt)
-            label = label.repeat_interleave(self.uniform_temporal_subsample_num).squeeze()
+            label = label.repeat_interleave(batch['ap'].size(1)).squeeze()
 
         else:
             label = batch['label'].detach() # b, class_num
@@ -247,7 +295,7 @@ class WalkVideoClassificationLightningModule(LightningModule):
 
         # pred the video frames
         with torch.no_grad():
-            preds = self.model(video)
+            preds = self._predict(batch)
 
         # when torch.size([1]), not squeeze.
         if preds.size()[0] != 1 or len(preds.size()) != 1 :
@@ -311,7 +359,14 @@ class WalkVideoClassificationLightningModule(LightningModule):
             lr_scheduler: the selected lr scheduler.
         '''
 
-        optimizer = torch.optim.Adam(self.parameters(), lr=self.lr)
+        # only the trained parameters, the frozen layers of --fix_layer are not in the optimizer.
+        params = [param for param in self.parameters() if param.requires_grad]
+
+        trained = {id(param) for param in params}
+        if any(id(param) not in trained for param in self.reinitialized_params):
+            raise RuntimeError('the reinitialized layers (like the 6 channel stem conv) are not in the optimizer, they will keep the random weights.')
+
+        optimizer = torch.optim.Adam(params, lr=self.lr)
         
         return {
             "optimizer": optimizer,
@@ -325,45 +380,55 @@ class WalkVideoClassificationLightningModule(LightningModule):
     def _get_name(self):
         return self.model_type
     
-    def _check_info(self, batch: dict) -> None:
-        """check the info from data loader.
-        because prepare the two data, lat and ap, so should check the video name, tensor shape and label, first
+    def _predict(self, batch: dict) -> torch.Tensor:
+        '''
+        fuse the two views and the model forward, compiled with --compile, under the bf16 autocast with --precision_mode bf16.
+        the logits are cast back to fp32, so the BCE loss, sigmoid and metrics are in fp32.
+
+        Args:
+            batch (dict): the batch with the ap and lat video, b, t, c, h, w
+
+        Returns:
+            torch.Tensor: the fp32 logits.
+        '''
+
+        with torch.autocast(device_type=self.device.type, dtype=torch.bfloat16, enabled=self.precision_mode == 'bf16'):
+            y_hat = self._forward_fn(batch['ap'], batch['lat'])
+
+        return y_hat.float()
+
+    def _fused_forward(self, video_ap: torch.Tensor, video_lat: torch.Tensor) -> torch.Tensor:
+        '''
+        the model forward on the fused video.
+
+        Args:
+            video_ap (torch.Tensor): b, t, c, h, w
+            video_lat (torch.Tensor): b, t, c, h, w
+
+        Returns:
+            torch.Tensor: the logits.
+        '''
+
+        return self.model(self._fuse_video({'ap': video_ap, 'lat': video_lat}))
+
+    def _fuse_video(self, batch: dict) -> torch.Tensor:
+        """fuse the ap and lat video in the channel dim.
+        the two views are paired in the dataset, so the name and label have been matched.
 
         Args:
-            batch (dict): the dataloader info, include dict['a'[info], 'b'[info]]
+            batch (dict): the dataloader info, include dict['ap', 'lat', 'label', 'name']
+
+        Returns:
+            torch.Tensor: the fused video, b, c, t, h, w
         """        
 
-        # * Check the info from two date 
-        video_info_a = batch['a']
-        video_info_b = batch['b']
-        
-        # print('vedeoname_a', video_info_a["video_name"])
-        # print('vedeoname_b', video_info_b["video_name"])
-        
-        # * check tensor shape 
-        video_a = video_info_a["video"]
-        video_b = video_info_b["video"]
-        
-        assert video_a.shape == video_b.shape
+        video_ap = batch['ap'] # b, t, c, h, w
+        video_lat = batch['lat'] # b, t, c, h, w
 
-        # * check label 
-        label_a = video_info_a["label"]
-        label_b = video_info_b["label"]
-        
-        # print('label_a:', label_a)
-        # print('label_b:', label_b)
+        fusion_video = torch.cat([video_ap, video_lat], dim=2) # b, t, c, h, w 
+        fusion_video = fusion_video.transpose(2, 1) # b, t, c, h, w > b, c, t, h, w 
 
-        assert label_a.shape ==  label_b.shape 
-        
-        for i in range(len(label_a)):
-            assert label_a[i] == label_b[i]
-        
-        # * check video name 
-        video_name_a = video_info_a["video_name"]
-        video_name_b = video_info_b["video_name"]
+        if self.channels_last:
+            fusion_video = fusion_video.contiguous(memory_format=torch.channels_last_3d)
 
-        assert len(video_name_a) == len(video_name_b)
-        
-        for i in range(len(video_name_a)):
-            assert video_name_a[i] == video_name_b[i] 
-        
\ No newline at end of file
+        return fusion_video
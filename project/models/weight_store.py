@@ -0,0 +1,229 @@
+'''
+the local content-addressed store of the pretrained weights, and the offline model builder.
+
+The architectures are built from pytorchvideo.models.hub and torchvision.models without the pretrained weights (no network),
+and the weights are memory-mapped from the store, prefetched once by prefetch_weights.py.
+
+The store is like:
+    weights/
+        index.json              {model name: {"sha256", "url", "bytes"}}
+        objects/<sha256>.pt     the state dict, saved by torch.save (zip format, can be memory-mapped)
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Optional
+
+import torch
+import torch.nn as nn
+
+# the repo root weights folder.
+WEIGHTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'weights')
+
+_PYTORCHVIDEO_ROOT = 'https://dl.fbaipublicfiles.com/pytorchvideo/model_zoo/kinetics'
+
+# the pretrained weights used by make_model.py, same as the torch.hub models.
+PRETRAINED_URLS = {
+    'slow_r50': f'{_PYTORCHVIDEO_ROOT}/SLOW_8x8_R50.pyth',
+    'c2d_r50': f'{_PYTORCHVIDEO_ROOT}/C2D_8x8_R50.pyth',
+    'i3d_r50': f'{_PYTORCHVIDEO_ROOT}/I3D_8x8_R50.pyth',
+    'slowfast_r50': f'{_PYTORCHVIDEO_ROOT}/SLOWFAST_8x8_R50.pyth',
+    'r2plus1d_r50': f'{_PYTORCHVIDEO_ROOT}/R2PLUS1D_16x4_R50.pyth',
+    'csn_r101': f'{_PYTORCHVIDEO_ROOT}/CSN_32x2_R101.pyth',
+    'x3d_m': f'{_PYTORCHVIDEO_ROOT}/X3D_M.pyth',
+    # pytorch/vision:v0.10.0 resnet50(pretrained=True)
+    'resnet50': 'https://download.pytorch.org/models/resnet50-0676ba61.pth',
+}
+
+INDEX_FILE = 'index.json'
+
+
+def _sha256(file_path: str) -> str:
+    sha = hashlib.sha256()
+
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+class WeightStore:
+    '''
+    the content-addressed weight store, the same weights are saved once.
+    '''
+
+    def __init__(self, store_path: Optional[str] = None) -> None:
+        '''
+        Args:
+            store_path (Optional[str], optional): the store folder, None for the repo root weights folder. Defaults to None.
+        '''
+
+        self.store_path = store_path or WEIGHTS_DIR
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @property
+    def index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            index_path = os.path.join(self.store_path, INDEX_FILE)
+
+            if os.path.exists(index_path):
+                with open(index_path, 'r') as f:
+                    self._index = json.load(f)
+            else:
+                self._index = {}
+
+        return self._index
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.store_path, 'objects', sha256 + '.pt')
+
+    def path(self, name: str) -> Optional[str]:
+        '''
+        Returns:
+            Optional[str]: the weight file of the model, None when not in the store.
+        '''
+
+        entry = self.index.get(name)
+
+        if entry is None or not os.path.exists(self.object_path(entry['sha256'])):
+            return None
+
+        return self.object_path(entry['sha256'])
+
+    def add(self, name: str, state_dict: Dict[str, torch.Tensor], url: Optional[str] = None) -> str:
+        '''
+        save the state dict to the store, and map the model name to it.
+
+        Args:
+            name (str): the model name.
+            state_dict (Dict[str, torch.Tensor]): the weights.
+            url (Optional[str], optional): where the weights come from. Defaults to None.
+
+        Returns:
+            str: the sha256 of the weight file.
+        '''
+
+        os.makedirs(os.path.join(self.store_path, 'objects'), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_path, suffix='.tmp')
+        os.close(fd)
+
+        try:
+            torch.save(state_dict, tmp_path)
+            sha256 = _sha256(tmp_path)
+            size = os.path.getsize(tmp_path)
+
+            os.replace(tmp_path, self.object_path(sha256))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.index[name] = {'sha256': sha256, 'url': url, 'bytes': size}
+        self._save_index()
+
+        return sha256
+
+    def _save_index(self) -> None:
+        index_path = os.path.join(self.store_path, INDEX_FILE)
+
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+
+        os.replace(index_path + '.tmp', index_path)
+
+    def verify(self, name: str) -> bool:
+        '''
+        check the weight file is same as the sha256 in the index.
+        '''
+
+        file_path = self.path(name)
+
+        return file_path is not None and _sha256(file_path) == self.index[name]['sha256']
+
+    def load(self, name: str) -> Dict[str, torch.Tensor]:
+        '''
+        memory-map the state dict of the model.
+
+        Args:
+            name (str): the model name.
+
+        Raises:
+            FileNotFoundError: the model is not in the store.
+
+        Returns:
+            Dict[str, torch.Tensor]: the state dict.
+        '''
+
+        file_path = self.path(name)
+
+        if file_path is None:
+            raise FileNotFoundError(f'the {name} weights are not in {self.store_path}, run prefetch_weights.py --models {name} first.')
+
+        try:
+            return torch.load(file_path, map_location='cpu', mmap=True, weights_only=True)
+        except TypeError:
+            # the old torch without the mmap load.
+            return torch.load(file_path, map_location='cpu')
+
+
+def prefetch_weights(name: str, store: WeightStore) -> str:
+    '''
+    download the pretrained weights of the model, and add the state dict to the store.
+
+    Args:
+        name (str): the model name in PRETRAINED_URLS.
+        store (WeightStore): the weight store.
+
+    Returns:
+        str: the sha256 of the weight file.
+    '''
+
+    url = PRETRAINED_URLS[name]
+
+    fd, download_path = tempfile.mkstemp(suffix=os.path.splitext(url)[-1])
+    os.close(fd)
+
+    try:
+        torch.hub.download_url_to_file(url, download_path, progress=True)
+        checkpoint = torch.load(download_path, map_location='cpu')
+    finally:
+        os.remove(download_path)
+
+    # the pytorchvideo checkpoint keep the weights in model_state.
+    state_dict = checkpoint['model_state'] if 'model_state' in checkpoint else checkpoint
+
+    return store.add(name, state_dict, url)
+
+
+def build_model(name: str, pretrained: bool = False, store: Optional[WeightStore] = None) -> nn.Module:
+    '''
+    build the model without the network, and load the pretrained weights from the store.
+
+    Args:
+        name (str): the model name in PRETRAINED_URLS.
+        pretrained (bool, optional): load the pretrained weights. Defaults to False.
+        store (Optional[WeightStore], optional): the weight store, None for the repo root weights folder. Defaults to None.
+
+    Returns:
+        nn.Module: the model.
+    '''
+
+    if name not in PRETRAINED_URLS:
+        raise ValueError(f'the model should be in {list(PRETRAINED_URLS)}, get {name}')
+
+    # import the model zoo only when building, the import is slow.
+    if name == 'resnet50':
+        import torchvision
+        model = torchvision.models.resnet50()
+    else:
+        from pytorchvideo.models import hub
+        model = getattr(hub, name)(pretrained=False)
+
+    if pretrained:
+        store = store or WeightStore()
+        model.load_state_dict(store.load(name))
+
+    return model
@@ -0,0 +1,95 @@
+'''
+detect the person in every frame of the full recordings once, and save the boxes next to the recordings.
+The boxes are used by dataloader/recording_dataset.py (main.py --dataset_type recording),
+which split the walk direction and crop the person on the fly, without writing the segment videos.
+
+output: input_dir/class/date/full_boxes.npz
+    lat: [N, 5] x1, y1, x2, y2, conf of the first detected person, nan when not detected.
+    ap: [N, 5] the leftmost detected person, same as the split_cropfor*.py.
+    fps: the recording fps.
+'''
+
+import os
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+BOXES_FILE = "full_boxes.npz"
+NO_BOX = (np.nan,) * 5
+
+
+def detect_person(model, frame, conf_threshold=0.5):
+    results = model(frame, verbose=False)
+    detections = []
+    for result in results[0].boxes:
+        if int(result.cls[0]) == 0:  # Person class
+            x1, y1, x2, y2 = result.xyxy[0].tolist()
+            conf = result.conf[0].item()
+            if conf >= conf_threshold:
+                detections.append((int(x1), int(y1), int(x2), int(y2), float(conf)))
+    return detections
+
+
+def cache_recording_boxes(input_lat_path, input_ap_path, model):
+    cap_lat = cv2.VideoCapture(input_lat_path)
+    cap_ap = cv2.VideoCapture(input_ap_path)
+
+    fps = cap_lat.get(cv2.CAP_PROP_FPS)
+
+    lat_boxes, ap_boxes = [], []
+
+    while cap_lat.isOpened() and cap_ap.isOpened():
+        ret_lat, frame_lat = cap_lat.read()
+        ret_ap, frame_ap = cap_ap.read()
+        if not ret_lat or not ret_ap:
+            break
+
+        # 側面は最初に検出されたターゲット
+        detections_lat = detect_person(model, frame_lat)
+        lat_boxes.append(detections_lat[0] if detections_lat else NO_BOX)
+
+        # 正面は一番左の人物をターゲット
+        detections_ap = detect_person(model, frame_ap)
+        ap_boxes.append(min(detections_ap, key=lambda bbox: bbox[0]) if detections_ap else NO_BOX)
+
+    cap_lat.release()
+    cap_ap.release()
+
+    return np.array(lat_boxes, dtype=np.float32).reshape(-1, 5), np.array(ap_boxes, dtype=np.float32).reshape(-1, 5), fps
+
+
+def process_videos(input_dir, gpu_id=0, overwrite=False):
+    torch.cuda.set_device(gpu_id)
+
+    model = YOLO("yolo11n.pt")
+    model.to('cuda')
+
+    for root, _, files in os.walk(input_dir):
+        if "full_lat.mp4" not in files or "full_ap.mp4" not in files:
+            continue
+
+        boxes_path = os.path.join(root, BOXES_FILE)
+        if os.path.exists(boxes_path) and not overwrite:
+            continue
+
+        lat_boxes, ap_boxes, fps = cache_recording_boxes(
+            os.path.join(root, "full_lat.mp4"),
+            os.path.join(root, "full_ap.mp4"),
+            model,
+        )
+
+        np.savez(boxes_path, lat=lat_boxes, ap=ap_boxes, fps=fps)
+        print(f"{root}: {len(lat_boxes)} frames, fps {fps:.2f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--input_dir', type=str, required=True, help='the recordings, input_dir/class/date/full_lat.mp4 and full_ap.mp4')
+    parser.add_argument('--gpu_id', type=int, default=0)
+    parser.add_argument('--overwrite', action='store_true', help='detect again when the boxes are already cached')
+    config, unkonwn = parser.parse_known_args()
+
+    process_videos(config.input_dir, config.gpu_id, config.overwrite)
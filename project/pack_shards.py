@@ -0,0 +1,67 @@
+'''
+pack the paired walk videos of every fold into the tar shards, for main.py --dataset_type shard.
+
+The input is the same cross validation folders as main.py, data_path_a/fold/split/class/... and data_path_b/...
+The output is output_path/fold/split/shard-000000.tar ... and index.json, one sample has the two views and the label.
+
+usage:
+    python pack_shards.py --data_path_a /workspace/data/Cross_Validation/ex_20250116_ap_organized \
+        --data_path_b /workspace/data/Cross_Validation/ex_20250116_lat_organized \
+        --output_path /workspace/data/Cross_Validation/ex_20250116_shards --min_shards 8
+'''
+
+# %%
+import os
+from argparse import ArgumentParser
+
+from dataloader.paired_dataset import make_paired_video_paths
+from dataloader.shard_dataset import write_shards
+
+
+def get_parameters():
+    '''
+    The parameters for the shard packer, can be called out via the --h menu
+    '''
+    parser = ArgumentParser()
+
+    parser.add_argument('--data_path_a', type=str, required=True, help='the ap cross validation dataset path')
+    parser.add_argument('--data_path_b', type=str, required=True, help='the lat cross validation dataset path')
+    parser.add_argument('--output_path', type=str, required=True, help='the shards saved path')
+    parser.add_argument('--max_shard_mb', type=int, default=1024, help='start a new shard after the shard is larger than this')
+    parser.add_argument('--min_shards', type=int, default=8, help='pack at least N shards for every split, same as the main.py --num_workers, the shards are split to the dataloader workers')
+    parser.add_argument('--seed', type=int, default=42, help='the seed of the pack order')
+
+    return parser.parse_known_args()
+
+
+# %%
+if __name__ == '__main__':
+
+    config, unkonwn = get_parameters()
+
+    for fold in sorted(os.listdir(config.data_path_a)):
+        fold_path_a = os.path.join(config.data_path_a, fold)
+
+        if not os.path.isdir(fold_path_a):
+            continue
+
+        for split in sorted(os.listdir(fold_path_a)):
+            split_path_a = os.path.join(fold_path_a, split)
+            split_path_b = os.path.join(config.data_path_b, fold, split)
+
+            if not os.path.isdir(split_path_a) or not os.path.isdir(split_path_b):
+                continue
+
+            classes = sorted(f.name for f in os.scandir(split_path_a) if f.is_dir())
+            paired_video_paths = make_paired_video_paths(split_path_a, split_path_b)
+
+            shard_index = write_shards(
+                paired_video_paths,
+                os.path.join(config.output_path, fold, split),
+                classes,
+                max_shard_bytes=config.max_shard_mb * 2 ** 20,
+                seed=config.seed,
+                min_shards=config.min_shards,
+            )
+
+            print('%s/%s: %d samples, %d shards' % (fold, split, shard_index['samples'], len(shard_index['shards'])))
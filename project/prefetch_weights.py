@@ -0,0 +1,50 @@
+'''
+download the pretrained weights once into the local weight store, then main.py --transfor_learning works offline.
+
+The weights are saved by the content hash, and the index map the model name to the hash.
+
+usage:
+    python prefetch_weights.py                      # all the models
+    python prefetch_weights.py --models slow_r50 resnet50 --weights_dir /workspace/weights
+'''
+
+# %%
+import time
+from argparse import ArgumentParser
+
+from models.weight_store import PRETRAINED_URLS, WeightStore, build_model, prefetch_weights
+
+
+def get_parameters():
+    '''
+    The parameters for the weight prefetch, can be called out via the --h menu
+    '''
+    parser = ArgumentParser()
+
+    parser.add_argument('--models', type=str, nargs='+', default=list(PRETRAINED_URLS), choices=list(PRETRAINED_URLS), help='the models to prefetch')
+    parser.add_argument('--weights_dir', type=str, default=None, help='the weight store, default the repo root weights folder')
+    parser.add_argument('--force', action='store_true', help='download again when the weights are already in the store')
+
+    return parser.parse_known_args()
+
+
+# %%
+if __name__ == '__main__':
+
+    config, unkonwn = get_parameters()
+
+    store = WeightStore(config.weights_dir)
+
+    for name in config.models:
+        if store.path(name) is not None and not config.force:
+            if not store.verify(name):
+                raise RuntimeError(f'the {name} weights in {store.store_path} are broken, prefetch with --force')
+            print('%s: already in the store' % name)
+        else:
+            sha256 = prefetch_weights(name, store)
+            print('%s: %s' % (name, sha256))
+
+        # check the weights fit the offline architecture.
+        start_time = time.perf_counter()
+        build_model(name, pretrained=True, store=store)
+        print('%s: offline build %.2f s' % (name, time.perf_counter() - start_time))
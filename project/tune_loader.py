@@ -0,0 +1,296 @@
+'''
+tune the dataloader settings of WalkDataModule on this host.
+
+The tuner measure the model consumption rate (train steps/s on a synthetic batch) first,
+then run short trial epochs of the train dataloader with different num_workers, prefetch_factor, persistent_workers and pin_memory,
+and measure the delivered batches/s (include the host to device copy).
+The cheapest settings which feed the model fast enough are saved to configs/loader/<hostname>.yaml,
+and main.py load them automatically.
+
+usage:
+    python tune_loader.py --model resnet --batch_size 16 --tune_search adaptive
+'''
+
+# %%
+import copy
+import os
+import time
+from argparse import ArgumentParser
+from itertools import product
+from typing import Any, Dict, List
+
+import torch
+import torch.nn.functional as F
+
+from dataloader.data_loader import WalkDataModule
+from main import get_parameters
+from models.pytorchvideo_models import WalkVideoClassificationLightningModule
+from utils.loader_config import LOADER_OPTIONS, loader_config_path, save_loader_config
+
+
+def get_tune_parameters(unknown: List[str]):
+    '''
+    The parameters for the tuner, the dataset and model parameters are from main.get_parameters.
+    '''
+    parser = ArgumentParser()
+
+    parser.add_argument('--tune_search', type=str, default='adaptive', choices=['adaptive', 'grid'], help='adaptive: tune the options one by one. grid: try all the combinations.')
+    parser.add_argument('--tune_batches', type=int, default=50, help='batches of one trial epoch')
+    parser.add_argument('--tune_epochs', type=int, default=2, help='trial epochs of one setting, the last epoch is measured')
+    parser.add_argument('--tune_model_steps', type=int, default=20, help='train steps to measure the model consumption rate')
+    parser.add_argument('--max_num_workers', type=int, default=os.cpu_count(), help='the max num_workers to try')
+    parser.add_argument('--tune_output', type=str, default=None, help='the output config file, default configs/loader/<hostname>.yaml')
+
+    return parser.parse_known_args(unknown)[0]
+
+
+def get_device(config) -> torch.device:
+    if torch.cuda.is_available():
+        return torch.device('cuda', config.gpu_num)
+
+    return torch.device('cpu')
+
+
+def synchronize(device: torch.device) -> None:
+    if device.type == 'cuda':
+        torch.cuda.synchronize(device)
+
+
+def measure_model_rate(config, device: torch.device, steps: int) -> float:
+    '''
+    the train steps/s of the model on a synthetic uint8 batch, which is the batches/s the model can consume.
+
+    Args:
+        config: the main.py parameters.
+        device (torch.device): the train device.
+        steps (int): the measured steps, after 3 warmup steps.
+
+    Returns:
+        float: the model batches/s.
+    '''
+
+    module = WalkVideoClassificationLightningModule(config).to(device)
+    module.train()
+
+    optimizer = torch.optim.Adam(module.parameters(), lr=config.lr)
+
+    shape = (config.batch_size, config.uniform_temporal_subsample_num, 3, config.img_size, config.img_size)
+    batch = {
+        'ap': torch.randint(0, 256, shape, dtype=torch.uint8, device=device),
+        'lat': torch.randint(0, 256, shape, dtype=torch.uint8, device=device),
+        'label': torch.randint(0, 2, (config.batch_size,), device=device),
+    }
+
+    def train_step():
+        y_hat = module._predict({'ap': module._normalize_video(batch['ap']), 'lat': module._normalize_video(batch['lat'])}).view(-1)
+
+        # the single frame model predict every frame, same as the training_step.
+        label = batch['label'].repeat_interleave(y_hat.numel() // config.batch_size)
+
+        loss = F.binary_cross_entropy_with_logits(y_hat, label.float())
+
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+    for _ in range(3):
+        train_step()
+    synchronize(device)
+
+    start_time = time.perf_counter()
+    for _ in range(steps):
+        train_step()
+    synchronize(device)
+
+    rate = steps / (time.perf_counter() - start_time)
+
+    del module, optimizer
+    if device.type == 'cuda':
+        torch.cuda.empty_cache()
+
+    return rate
+
+
+def measure_loader_rate(config, settings: Dict[str, Any], device: torch.device, tune_config) -> Dict[str, Any]:
+    '''
+    run the trial epochs of the train dataloader with the settings.
+    Every epoch make a new iterator like the trainer, so the worker start cost is measured without the persistent workers.
+
+    Args:
+        config: the main.py parameters.
+        settings (Dict[str, Any]): the trial value of LOADER_OPTIONS.
+        device (torch.device): the train device, the batch is copied to it.
+        tune_config: the tuner parameters.
+
+    Returns:
+        Dict[str, Any]: the settings with the batches/s of the last epoch and the first batch latency.
+    '''
+
+    trial_config = copy.copy(config)
+    for key, value in settings.items():
+        setattr(trial_config, key, value)
+
+    data_module = WalkDataModule(trial_config)
+    data_module.setup('fit')
+    loader = data_module.train_dataloader()
+
+    batches_per_sec, first_batch_sec = 0.0, 0.0
+
+    for _ in range(tune_config.tune_epochs):
+        batches = 0
+        start_time = time.perf_counter()
+
+        for batch in loader:
+            batch = {key: value.to(device, non_blocking=settings['pin_memory']) if torch.is_tensor(value) else value for key, value in batch.items()}
+
+            if batches == 0:
+                synchronize(device)
+                first_batch_sec = time.perf_counter() - start_time
+
+            batches += 1
+            if batches >= tune_config.tune_batches:
+                break
+
+        synchronize(device)
+        batches_per_sec = batches / (time.perf_counter() - start_time)
+
+    # stop the persistent workers.
+    del loader, data_module
+
+    result = dict(settings)
+    result.update({'batches_per_sec': batches_per_sec, 'first_batch_sec': first_batch_sec})
+
+    print('%-60s %8.2f batches/s, first batch %.2f s' % (settings, batches_per_sec, first_batch_sec))
+
+    return result
+
+
+def worker_ladder(max_num_workers: int) -> List[int]:
+    '''
+    0, 1, 2, 4, 8 ... max_num_workers
+    '''
+
+    ladder = [0]
+    num_workers = 1
+
+    while num_workers < max_num_workers:
+        ladder.append(num_workers)
+        num_workers *= 2
+
+    return ladder + [max_num_workers]
+
+
+def grid_search(config, device, tune_config) -> List[Dict[str, Any]]:
+
+    trials = []
+
+    for num_workers, prefetch_factor, persistent_workers, pin_memory in product(
+        worker_ladder(tune_config.max_num_workers), [2, 4, 8], [False, True], [False, device.type == 'cuda']
+    ):
+        # the prefetch and persistent workers have no effect without the workers.
+        if num_workers == 0 and (prefetch_factor != 2 or persistent_workers):
+            continue
+
+        settings = {'num_workers': num_workers, 'prefetch_factor': prefetch_factor, 'persistent_workers': persistent_workers, 'pin_memory': pin_memory}
+
+        if settings not in [{key: trial[key] for key in LOADER_OPTIONS} for trial in trials]:
+            trials.append(measure_loader_rate(config, settings, device, tune_config))
+
+    return trials
+
+
+def adaptive_search(config, device, tune_config, model_rate: float) -> List[Dict[str, Any]]:
+    '''
+    tune the options one by one, more workers until the loader feed the model, or the rate not improved by 5%.
+    Then the prefetch_factor, pin_memory and persistent_workers with the best num_workers.
+    '''
+
+    trials = []
+    best = None
+
+    settings = {'num_workers': 0, 'prefetch_factor': 2, 'persistent_workers': True, 'pin_memory': device.type == 'cuda'}
+
+    for num_workers in worker_ladder(tune_config.max_num_workers):
+        settings = dict(settings, num_workers=num_workers)
+        trial = measure_loader_rate(config, settings, device, tune_config)
+        trials.append(trial)
+
+        if best is not None and trial['batches_per_sec'] < best['batches_per_sec'] * 1.05:
+            break
+
+        best = trial
+        if trial['batches_per_sec'] >= model_rate * 1.1:
+            break
+
+    if best['num_workers'] > 0:
+        for key, values in (('prefetch_factor', [4, 8]), ('persistent_workers', [False])):
+            for value in values:
+                settings = dict({key: best[key] for key in LOADER_OPTIONS}, **{key: value})
+                trial = measure_loader_rate(config, settings, device, tune_config)
+                trials.append(trial)
+
+                if trial['batches_per_sec'] > best['batches_per_sec'] * 1.05:
+                    best = trial
+
+    if device.type == 'cuda':
+        settings = dict({key: best[key] for key in LOADER_OPTIONS}, pin_memory=not best['pin_memory'])
+        trials.append(measure_loader_rate(config, settings, device, tune_config))
+
+    return trials
+
+
+def select_settings(trials: List[Dict[str, Any]], model_rate: float) -> Dict[str, Any]:
+    '''
+    the cheapest trial (fewer workers, smaller prefetch) which feed the model, else the fastest trial.
+    '''
+
+    enough = [trial for trial in trials if trial['batches_per_sec'] >= model_rate]
+
+    if enough:
+        return min(enough, key=lambda trial: (trial['num_workers'], trial['prefetch_factor'], -trial['batches_per_sec']))
+
+    return max(trials, key=lambda trial: trial['batches_per_sec'])
+
+
+# %%
+if __name__ == '__main__':
+
+    config, unkonwn = get_parameters()
+    tune_config = get_tune_parameters(unkonwn)
+
+    # tune on the first fold, the folds have the same video size.
+    fold = sorted(os.listdir(config.data_path_a))[0]
+    config.train_path_a = os.path.join(config.data_path_a, fold)
+    config.train_path_b = os.path.join(config.data_path_b, fold)
+
+    device = get_device(config)
+
+    model_rate = measure_model_rate(config, device, tune_config.tune_model_steps)
+    print('model consumption: %.2f batches/s on %s' % (model_rate, device))
+
+    if tune_config.tune_search == 'grid':
+        trials = grid_search(config, device, tune_config)
+    else:
+        trials = adaptive_search(config, device, tune_config, model_rate)
+
+    best = select_settings(trials, model_rate)
+
+    if best['batches_per_sec'] < model_rate:
+        print('the loader is the bottleneck, %.2f < %.2f batches/s' % (best['batches_per_sec'], model_rate))
+
+    output_path = loader_config_path(tune_config.tune_output or config.loader_config)
+
+    save_loader_config(
+        output_path,
+        best,
+        {
+            'loader_batches_per_sec': best['batches_per_sec'],
+            'model_batches_per_sec': model_rate,
+            'batch_size': config.batch_size,
+            'model': config.model,
+            'trials': trials,
+        },
+    )
+
+    print('best settings: %s' % {key: best[key] for key in LOADER_OPTIONS})
+    print('saved to %s' % output_path)
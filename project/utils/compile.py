@@ -0,0 +1,104 @@
+'''
+the torch.compile helpers, for main.py --compile.
+
+The inductor caches (the compiled fx graphs and the autotune results) are kept in one folder on the disk,
+so the next fold and the next run of the same model and input shape load the compiled kernels instead of compiling again.
+'''
+
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+import torch
+from pytorch_lightning import Callback, LightningModule, Trainer
+
+# the repo root compile cache folder.
+COMPILE_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'compile_cache')
+
+
+def enable_compile_cache(cache_dir: Optional[str] = None) -> str:
+    '''
+    keep the inductor caches in the cache folder, shared by the folds, the runs and the dataloader workers.
+
+    Args:
+        cache_dir (Optional[str], optional): the cache folder, None for the repo root compile_cache. Defaults to None.
+
+    Returns:
+        str: the cache folder.
+    '''
+
+    cache_dir = os.path.abspath(cache_dir or COMPILE_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    os.environ['TORCHINDUCTOR_CACHE_DIR'] = cache_dir
+    os.environ['TORCHINDUCTOR_FX_GRAPH_CACHE'] = '1'
+    os.environ['TORCHINDUCTOR_AUTOGRAD_CACHE'] = '1'
+
+    # the config is read when the inductor is imported, set it again if it is imported already.
+    try:
+        import torch._inductor.config as inductor_config
+        inductor_config.fx_graph_cache = True
+    except (ImportError, AttributeError):
+        pass
+
+    return cache_dir
+
+
+class CompileTimeCallback(Callback):
+    '''
+    time the train and val steps, the first step include the compile, the rest are the steady state.
+    '''
+
+    def __init__(self) -> None:
+        self.step_times: Dict[str, List[float]] = {'train': [], 'val': []}
+        self._start_time = 0.0
+
+    def _start(self, trainer: Trainer) -> None:
+        if trainer.strategy.root_device.type == 'cuda':
+            torch.cuda.synchronize(trainer.strategy.root_device)
+        self._start_time = time.perf_counter()
+
+    def _end(self, trainer: Trainer, stage: str) -> None:
+        if trainer.strategy.root_device.type == 'cuda':
+            torch.cuda.synchronize(trainer.strategy.root_device)
+        self.step_times[stage].append(time.perf_counter() - self._start_time)
+
+    def on_train_batch_start(self, trainer: Trainer, pl_module: LightningModule, batch: Any, batch_idx: int) -> None:
+        self._start(trainer)
+
+    def on_train_batch_end(self, trainer: Trainer, pl_module: LightningModule, outputs: Any, batch: Any, batch_idx: int) -> None:
+        self._end(trainer, 'train')
+
+    def on_validation_batch_start(self, trainer: Trainer, pl_module: LightningModule, batch: Any, batch_idx: int, dataloader_idx: int = 0) -> None:
+        self._start(trainer)
+
+    def on_validation_batch_end(self, trainer: Trainer, pl_module: LightningModule, outputs: Any, batch: Any, batch_idx: int, dataloader_idx: int = 0) -> None:
+        self._end(trainer, 'val')
+
+    def report(self) -> str:
+        '''
+        the first step time, the steady state step time (median of the rest), and the compile overhead.
+
+        Returns:
+            str: the report.
+        '''
+
+        lines = []
+
+        for stage, times in self.step_times.items():
+            if len(times) < 2:
+                continue
+
+            steady = statistics.median(times[1:])
+            lines.append('%s: first step %.2f s, steady step %.1f ms (%d steps), compile %.2f s' % (
+                stage, times[0], steady * 1000, len(times) - 1, max(times[0] - steady, 0.0),
+            ))
+
+        report = '\n'.join(lines)
+        print(report)
+
+        return report
+
+    def on_fit_end(self, trainer: Trainer, pl_module: LightningModule) -> None:
+        self.report()
@@ -0,0 +1,104 @@
+'''
+the per-host dataloader settings, written by tune_loader.py and loaded by main.py.
+
+The config file is configs/loader/<hostname>.yaml like:
+    host: <hostname>
+    settings:
+        num_workers: 8
+        prefetch_factor: 4
+        persistent_workers: true
+        pin_memory: true
+    loader_batches_per_sec: ...
+    model_batches_per_sec: ...
+    trials: [...]
+'''
+
+import logging
+import os
+import socket
+from argparse import ArgumentParser, Namespace
+from typing import Any, Dict, Optional
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# the repo root configs folder.
+LOADER_CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'configs', 'loader')
+
+# the options tuned by tune_loader.py
+LOADER_OPTIONS = ('num_workers', 'prefetch_factor', 'persistent_workers', 'pin_memory')
+
+
+def loader_config_path(config_path: Optional[str] = None) -> str:
+    '''
+    the loader config file of this host.
+
+    Args:
+        config_path (Optional[str], optional): the config file path, None for configs/loader/<hostname>.yaml. Defaults to None.
+
+    Returns:
+        str: the config file path.
+    '''
+
+    if config_path:
+        return config_path
+
+    return os.path.join(LOADER_CONFIG_DIR, socket.gethostname() + '.yaml')
+
+
+def save_loader_config(config_path: str, settings: Dict[str, Any], report: Optional[Dict[str, Any]] = None) -> None:
+    '''
+    save the tuned settings and the tune report.
+
+    Args:
+        config_path (str): the config file path.
+        settings (Dict[str, Any]): the tuned value of LOADER_OPTIONS.
+        report (Optional[Dict[str, Any]], optional): the measured rates and trials. Defaults to None.
+    '''
+
+    os.makedirs(os.path.dirname(os.path.abspath(config_path)), exist_ok=True)
+
+    loader_config = {'host': socket.gethostname(), 'settings': {key: settings[key] for key in LOADER_OPTIONS}}
+    loader_config.update(report or {})
+
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(loader_config, f, sort_keys=False)
+
+
+def apply_loader_config(config: Namespace, parser: ArgumentParser) -> Dict[str, Any]:
+    '''
+    load the tuned settings of this host into the config.
+    The option set in the command line has the priority, only the option with the default value is replaced.
+
+    Args:
+        config (Namespace): the parsed parameters, with loader_config and no_loader_config.
+        parser (ArgumentParser): the parser, to get the default values.
+
+    Returns:
+        Dict[str, Any]: the applied settings.
+    '''
+
+    if config.no_loader_config:
+        return {}
+
+    config_path = loader_config_path(config.loader_config)
+
+    if not os.path.isfile(config_path):
+        return {}
+
+    with open(config_path, 'r') as f:
+        settings = (yaml.safe_load(f) or {}).get('settings', {})
+
+    applied = {}
+
+    for key in LOADER_OPTIONS:
+        if key in settings and getattr(config, key) == parser.get_default(key):
+            setattr(config, key, settings[key])
+            applied[key] = settings[key]
+
+    if applied:
+        logger.info('load the loader settings from %s: %s', config_path, applied)
+        print('loader settings from %s: %s' % (config_path, applied))
+
+    return applied